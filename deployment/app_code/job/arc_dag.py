@@ -0,0 +1,438 @@
+"""Run an Arc notebook with its independent stages in parallel.
+
+    arc_dag.py --etl.config.uri=<notebook> --etl.config.environment=test [--parallelism=4] [--ETL_CONF_X=value ...]
+    arc_dag.py --plan <notebook> [--etl.config.environment=test]
+
+Takes the arguments of the Arc job. Every stage of the notebook becomes a node of a
+dependency graph: a stage waits for the stages creating the views it reads (inputView,
+sqlParams and the view names in its SQL). Writes (loads, MERGE/INSERT, SET, JDBCExecute)
+stay in notebook order, a write also waits for the validations before it and for
+the reads of the location it writes. Ready stages are submitted concurrently to the same
+Spark session, each worker thread in its own FAIR scheduler pool, so the job follows the
+critical path of the graph instead of the sum of its stages.
+
+This is not Arc: it reimplements in PySpark the subset of Arc stages and attributes the jobs
+in app_code/job use (STAGE_KEYS), with Arc's semantics for them, eg. the _filename and _index
+columns of an extract. A notebook with any other stage type, attribute, magic option or
+authentication method is rejected before the first stage runs, run those with Arc. It needs
+the python and pyspark of the Arc image, the image build runs cds-training.ipynb with it to
+prove they are there (lib/ecr_build/Dockerfile).
+"""
+import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+EXTRACTS = {'DelimitedExtract', 'JSONExtract', 'DeltaLakeExtract'}
+LOADS = {'DeltaLakeLoad', 'JSONLoad'}
+SQL_MAGICS = {'%sql': 'SQLTransform', '%sqlvalidate': 'SQLValidate', '%sqlvaildate': 'SQLValidate'}
+# notebook-only magics, Arc ignores them in a job as well
+SKIPPED_MAGICS = {'%conf', '%env', '%printschema', '%metadata', '%schema', '%summary'}
+# attributes of each stage type this runner implements, besides the ones every stage has
+COMMON_KEYS = {'type', 'name', 'description', 'environments', 'authentication'}
+STAGE_KEYS = {
+    'DelimitedExtract': {'inputURI', 'outputView', 'delimiter', 'customDelimiter', 'header', 'quote', 'contiguousIndex'},
+    'JSONExtract': {'inputURI', 'outputView', 'schemaURI', 'contiguousIndex'},
+    'DeltaLakeExtract': {'inputURI', 'outputView'},
+    'DeltaLakeLoad': {'inputView', 'outputURI', 'saveMode', 'partitionBy', 'numPartitions', 'options'},
+    'JSONLoad': {'inputView', 'outputURI', 'saveMode', 'partitionBy', 'numPartitions'},
+    'SQLTransform': {'inputURI', 'outputView', 'persist', 'sqlParams'},
+    'SQLValidate': {'inputURI', 'sqlParams'},
+    'JDBCExecute': {'inputURI', 'jdbcURL', 'sqlParams'}
+}
+SUPPORTED = set(STAGE_KEYS)
+# options of the SQL magics, numRows and truncate only change what a notebook displays
+MAGIC_KEYS = {'name', 'description', 'environments', 'outputView', 'persist', 'sqlParams', 'numRows', 'truncate'}
+# the cluster credentials (IRSA) are used for every location
+AUTHENTICATION = {'AmazonIAM'}
+DELIMITERS = {'Comma': ',', 'Pipe': '|', 'DefaultHive': '\u0001'}
+SPARK_TYPES = {'integer': 'INT', 'long': 'BIGINT', 'double': 'DOUBLE', 'string': 'STRING',
+    'boolean': 'BOOLEAN', 'date': 'DATE', 'timestamp': 'TIMESTAMP'}
+VARIABLE = re.compile(r'"?\s*\$\{(\w+)\}\s*"?')
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# delta.`s3a://...` reads a location straight from SQL
+PATH_TABLE = re.compile(r'\b(?:delta|parquet|json|csv)\.`([^`]+)`', re.I)
+READ_ONLY_SQL = re.compile(r'^\s*(SELECT|WITH|DESCRIBE|SHOW|EXPLAIN)\b', re.I)
+
+class Stage:
+    def __init__(self, index, kind, name, environments, spec, sql=None):
+        self.index = index
+        self.kind = kind
+        self.name = name
+        self.environments = environments
+        self.spec = spec
+        self.sql = sql
+        self.depends = set()
+
+    @property
+    def output_view(self):
+        return self.spec.get('outputView')
+
+    @property
+    def sql_params(self):
+        return self.spec.get('sqlParams') or {}
+
+    @property
+    def is_write(self):
+        if self.kind in LOADS or self.kind == 'JDBCExecute':
+            return True
+        return self.kind == 'SQLTransform' and self.sql is not None and not READ_ONLY_SQL.match(self.sql)
+
+    @property
+    def read_uri(self):
+        if self.kind in EXTRACTS:
+            return self.spec.get('inputURI')
+        match = PATH_TABLE.search(_substitute(self.sql or '', self.sql_params))
+        return match.group(1) if match else None
+
+    @property
+    def write_uri(self):
+        return self.spec.get('outputURI') if self.kind in LOADS else None
+
+    def referenced_names(self):
+        names = set(self.sql_params.values())
+        if 'inputView' in self.spec:
+            names.add(self.spec['inputView'])
+        if self.sql:
+            names.update(IDENTIFIER.findall(self.sql))
+        return names
+
+def _substitute_hocon(text, variables, strict):
+    # "s3a://"${X}"/path" is a HOCON concatenation, fold it into a single JSON string
+    def replace(m):
+        value = variables.get(m.group(1))
+        if value is None:
+            if strict:
+                raise ValueError('{} is not set'.format(m.group(1)))
+            value = '${' + m.group(1) + '}'
+        quoted = m.group(0).startswith('"') and m.group(0).endswith('"')
+        return json.dumps(value)[1:-1] if quoted else value
+    return VARIABLE.sub(replace, text)
+
+def _substitute(text, params):
+    return re.sub(r'\$\{(\w+)\}', lambda m: params.get(m.group(1), m.group(0)), text)
+
+def _magic_args(line, variables):
+    args = {}
+    for token in shlex.split(line)[1:]:
+        key, _, value = token.partition('=')
+        args[key] = _substitute(value, variables)
+    if 'sqlParams' in args:
+        args['sqlParams'] = dict(p.split('=', 1) for p in args['sqlParams'].split(',') if p)
+    return args
+
+def parse_notebook(notebook, variables, strict=True):
+    """Stages of an Arc notebook, with the %env defaults merged into variables.
+
+    Without strict a variable that is not set stays as ${NAME}, enough to plan the graph.
+    """
+    stages = []
+    cells = [c for c in notebook['cells'] if c['cell_type'] == 'code']
+    sources = [''.join(c['source']).strip() for c in cells]
+    # %env cells only set defaults, the job arguments win
+    for source in sources:
+        if source.startswith('%env'):
+            for line in source.splitlines()[1:]:
+                key, _, value = line.strip().partition('=')
+                if key:
+                    variables.setdefault(key, value)
+    for source in sources:
+        if not source:
+            continue
+        magic = source.split(None, 1)[0]
+        if magic in SKIPPED_MAGICS:
+            continue
+        if magic in SQL_MAGICS:
+            line, _, sql = source.partition('\n')
+            args = _magic_args(line, variables)
+            unknown = set(args) - MAGIC_KEYS
+            if unknown:
+                raise ValueError('{} option {} is not supported'.format(magic, ', '.join(sorted(unknown))))
+            spec = {k: v for k, v in args.items() if k in ('outputView', 'sqlParams', 'persist', 'description')}
+            stages.append(Stage(len(stages), SQL_MAGICS[magic], args.get('name', magic), args.get('environments', '').split(','), spec, sql.strip()))
+            continue
+        if magic.startswith('%'):
+            raise ValueError('magic {} is not supported'.format(magic))
+        spec = json.loads(_substitute_hocon(source, variables, strict))
+        if spec['type'] not in SUPPORTED:
+            raise ValueError('stage type {} is not supported'.format(spec['type']))
+        unknown = set(spec) - COMMON_KEYS - STAGE_KEYS[spec['type']]
+        if unknown:
+            raise ValueError('{} attribute {} is not supported'.format(spec['type'], ', '.join(sorted(unknown))))
+        if spec.get('authentication', {}).get('method', 'AmazonIAM') not in AUTHENTICATION:
+            raise ValueError('authentication method {} is not supported'.format(spec['authentication'].get('method')))
+        stages.append(Stage(len(stages), spec['type'], spec.get('name', spec['type']), spec.get('environments', []), spec))
+    return stages
+
+def build_graph(stages, environment):
+    """Keep the stages of an environment and set their dependencies."""
+    stages = [s for s in stages if environment in s.environments]
+    views = {}       # view -> stage creating it
+    view_uris = {}   # view -> location it was extracted from
+    reads = []       # (location, stage) of the extracts so far
+    writes = []      # (location, stage) of the loads so far
+    gates = []       # validations not yet followed by a write
+    last_write = None
+    same = lambda a, b: a.startswith(b) or b.startswith(a)
+    for s in stages:
+        names = s.referenced_names()
+        s.depends.update(views[n] for n in names if n in views)
+        # an extract after a load of the same location reads the new data
+        if s.read_uri:
+            s.depends.update(w for uri, w in writes if same(s.read_uri, uri))
+        if s.is_write:
+            if last_write is not None:
+                s.depends.add(last_write)
+            s.depends.update(gates)
+            gates = []
+            # MERGE INTO a view writes the table the view was extracted from
+            targets = [s.write_uri] if s.write_uri else [view_uris[n] for n in names if n in view_uris]
+            s.depends.update(r for uri, r in reads for t in targets if same(uri, t))
+            writes.extend((t, s) for t in targets)
+            last_write = s
+        if s.kind == 'SQLValidate':
+            gates.append(s)
+        if s.read_uri:
+            reads.append((s.read_uri, s))
+        if s.output_view:
+            views[s.output_view] = s
+            if s.read_uri:
+                view_uris[s.output_view] = s.read_uri
+        s.depends.discard(s)
+    return stages
+
+def critical_path(stages, seconds):
+    """Longest chain of the graph weighted by the stage durations."""
+    finish, parent = {}, {}
+    for s in stages:
+        before = max(s.depends, key=lambda d: finish[d.index], default=None)
+        finish[s.index] = (finish[before.index] if before else 0) + seconds.get(s.index, 0)
+        parent[s.index] = before
+    if not finish:
+        return 0, []
+    end = max(stages, key=lambda s: finish[s.index])
+    total, chain = finish[end.index], []
+    while end is not None:
+        chain.append(end.name)
+        end = parent[end.index]
+    return total, chain[::-1]
+
+def levels(stages):
+    level = {}
+    for s in stages:
+        level[s.index] = 1 + max((level[d.index] for d in s.depends), default=-1)
+    grouped = {}
+    for s in stages:
+        grouped.setdefault(level[s.index], []).append(s.name)
+    return [grouped[l] for l in sorted(grouped)]
+
+class Runner:
+    def __init__(self, spark, variables, parallelism, pool_prefix='arc'):
+        self.spark = spark
+        self.variables = variables
+        self.parallelism = parallelism
+        self.pool_prefix = pool_prefix
+        self.local = threading.local()
+        self.pools = iter(range(parallelism))
+        self.lock = threading.Lock()
+        self.persisted = []
+
+    def _pool(self):
+        # one FAIR pool per worker thread, concurrent stages get an even share of the executors
+        if not hasattr(self.local, 'pool'):
+            with self.lock:
+                self.local.pool = '{}-{}'.format(self.pool_prefix, next(self.pools))
+        return self.local.pool
+
+    def _read_text(self, uri):
+        return self.spark.sparkContext.wholeTextFiles(uri).first()[1]
+
+    def _exists(self, uri):
+        jvm = self.spark.sparkContext._jvm
+        path = jvm.org.apache.hadoop.fs.Path(uri)
+        statuses = path.getFileSystem(self.spark.sparkContext._jsc.hadoopConfiguration()).globStatus(path)
+        return statuses is not None and len(statuses) > 0
+
+    def _schema(self, uri):
+        return ', '.join('`{}` {}'.format(f['name'], SPARK_TYPES[f['type']]) for f in json.loads(self._read_text(uri)))
+
+    def _source_columns(self, df, spec):
+        # like Arc: the file of each row and its row number in the file, or only an increasing id
+        # with contiguousIndex=false, as numbering the rows of a file costs a sort
+        from pyspark.sql import functions as F, Window
+        df = df.withColumn('_filename', F.input_file_name()).withColumn('_monotonically_increasing_id', F.monotonically_increasing_id())
+        if str(spec.get('contiguousIndex', True)).lower() == 'false':
+            return df
+        index = F.row_number().over(Window.partitionBy('_filename').orderBy('_monotonically_increasing_id'))
+        return df.withColumn('_index', index).drop('_monotonically_increasing_id')
+
+    def _extract(self, s):
+        spec = s.spec
+        if s.kind == 'DeltaLakeExtract':
+            return self.spark.read.format('delta').load(spec['inputURI'])
+        if s.kind == 'JSONExtract':
+            schema = self._schema(spec['schemaURI']) if 'schemaURI' in spec else None
+            if schema and not self._exists(spec['inputURI']):
+                return self._source_columns(self.spark.createDataFrame([], schema), spec)
+            reader = self.spark.read.schema(schema) if schema else self.spark.read
+            return self._source_columns(reader.json(spec['inputURI']), spec)
+        quote = spec.get('quote', 'DoubleQuote')
+        df = (self.spark.read
+            .option('header', spec.get('header', False))
+            .option('sep', DELIMITERS.get(spec.get('delimiter', 'DefaultHive'), spec.get('customDelimiter')))
+            .option('quote', {'None': '', 'SingleQuote': "'"}.get(quote, '"'))
+            .csv(spec['inputURI']))
+        return self._source_columns(df, spec)
+
+    def _load(self, s):
+        spec = s.spec
+        df = self.spark.table(spec['inputView'])
+        if 'numPartitions' in spec:
+            df = df.repartition(int(spec['numPartitions']))
+        writer = df.write.mode(spec.get('saveMode', 'Overwrite').lower())
+        if spec.get('partitionBy'):
+            writer = writer.partitionBy(*spec['partitionBy'])
+        # eg. overwriteSchema or mergeSchema of a Delta table
+        writer = writer.options(**spec.get('options', {}))
+        if s.kind == 'DeltaLakeLoad':
+            writer.format('delta').save(spec['outputURI'])
+        else:
+            writer.json(spec['outputURI'])
+
+    def _jdbc(self, s):
+        sql = _substitute(self._read_text(s.spec['inputURI']), s.sql_params)
+        connection = self.spark.sparkContext._jvm.java.sql.DriverManager.getConnection(s.spec['jdbcURL'])
+        try:
+            connection.createStatement().execute(sql)
+        finally:
+            connection.close()
+
+    def run_stage(self, s):
+        sc = self.spark.sparkContext
+        sc.setLocalProperty('spark.scheduler.pool', self._pool())
+        sc.setJobDescription(s.name)
+        start, success = time.perf_counter(), False
+        try:
+            if s.kind in EXTRACTS:
+                self._extract(s).createOrReplaceTempView(s.output_view)
+            elif s.kind in LOADS:
+                self._load(s)
+            elif s.kind == 'JDBCExecute':
+                self._jdbc(s)
+            else:
+                sql = self._read_text(s.spec['inputURI']) if 'inputURI' in s.spec else s.sql
+                df = self.spark.sql(_substitute(sql, s.sql_params))
+                if s.kind == 'SQLValidate':
+                    valid, message = df.first()[:2]
+                    print('{}: {}'.format(s.name, message))
+                    if not valid:
+                        raise RuntimeError('{} failed: {}'.format(s.name, message))
+                elif s.output_view:
+                    if str(s.spec.get('persist', '')).lower() == 'true':
+                        df.persist()
+                        df.count()
+                        self.persisted.append(df)
+                    df.createOrReplaceTempView(s.output_view)
+            success = True
+        finally:
+            sc.setJobDescription(None)
+            seconds = time.perf_counter() - start
+            # the exit event Arc logs for a stage, push_stage_metrics of spark-submit-*.sh reads both
+            print(json.dumps({'event': 'exit', 'success': success, 'duration': int(seconds * 1000),
+                'stage': {'type': s.kind, 'name': s.name}}, separators=(',', ':')), flush=True)
+        return seconds
+
+    def run(self, stages):
+        """Submit every stage once its dependencies are done, at most `parallelism` at a time."""
+        seconds, done, running = {}, set(), {}
+        pending = list(stages)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            while pending or running:
+                for s in [s for s in pending if all(d.index in done for d in s.depends)]:
+                    pending.remove(s)
+                    running[pool.submit(self.run_stage, s)] = s
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    s = running.pop(future)
+                    # a failed stage fails the job, the stages already running are left to finish
+                    seconds[s.index] = future.result()
+                    done.add(s.index)
+        wall = time.perf_counter() - started
+        path_seconds, path = critical_path(stages, seconds)
+        return {
+            'stages': {s.name: round(seconds[s.index], 3) for s in stages},
+            'sum_s': round(sum(seconds.values()), 3),
+            'wall_s': round(wall, 3),
+            'critical_path_s': round(path_seconds, 3),
+            'critical_path': path
+        }
+
+    def release(self):
+        """Unpersist the views the job cached, for a session that outlives the job."""
+        for df in self.persisted:
+            df.unpersist()
+        self.persisted = []
+
+def parse_args(argv):
+    """Arc style --key=value arguments, ETL_CONF_* become notebook variables."""
+    options, variables, plan = {}, dict(os.environ), None
+    for arg in argv:
+        if arg == '--plan':
+            plan = True
+            continue
+        if not arg.startswith('--'):
+            options['etl.config.uri'] = arg
+            continue
+        key, _, value = arg[2:].partition('=')
+        if key.startswith('ETL_CONF_'):
+            variables[key] = value
+        else:
+            options[key] = value
+    return options, variables, plan
+
+def session_builder(app_name):
+    from pyspark.sql import SparkSession
+    return (SparkSession.builder.appName(app_name)
+        .config('spark.scheduler.mode', 'FAIR')
+        .config('spark.sql.extensions', 'io.delta.sql.DeltaSparkSessionExtension')
+        .config('spark.sql.catalog.spark_catalog', 'org.apache.spark.sql.delta.catalog.DeltaCatalog'))
+
+def run_job(spark, argv, pool_prefix='arc'):
+    """Run the notebook of the job arguments in a Spark session, return the timing report.
+
+    Raises ValueError when the notebook has a stage this runner does not support.
+    """
+    options, variables, _ = parse_args(argv)
+    runner = Runner(spark, variables, int(options.get('parallelism', 4)), pool_prefix)
+    notebook = json.loads(runner._read_text(options['etl.config.uri']))
+    stages = build_graph(parse_notebook(notebook, variables), options.get('etl.config.environment', 'test'))
+    print('stage levels: ' + json.dumps(levels(stages)))
+    try:
+        return runner.run(stages)
+    finally:
+        runner.release()
+
+def main(argv):
+    options, variables, plan = parse_args(argv)
+    if plan:
+        with open(options['etl.config.uri']) as f:
+            stages = build_graph(parse_notebook(json.load(f), variables, strict=False), options.get('etl.config.environment', 'test'))
+        for i, level in enumerate(levels(stages)):
+            print('{}: {}'.format(i, ' | '.join(level)))
+        return
+
+    spark = session_builder(options.get('etl.config.job.id', 'arc-dag')).getOrCreate()
+    try:
+        print('stage timing: ' + json.dumps(run_job(spark, argv)))
+    except ValueError as e:
+        print('Unable to run {} stage by stage: {}, run it with Arc'.format(options['etl.config.uri'], e))
+        sys.exit(1)
+    spark.stop()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
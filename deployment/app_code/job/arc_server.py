@@ -0,0 +1,115 @@
+"""Warm Spark session serving Arc notebook jobs over HTTP.
+
+    arc_server.py [--port 8998] [--max-jobs 4] [--max-executors 8] [--idle-timeout 300]
+
+Keeps one Spark driver running and runs each job with arc_dag.py in a new session of it
+(own temporary views and SQL conf, shared executors and cache), so a job starts on warm
+executors instead of pulling the image, starting a JVM and requesting executors. The
+executors are scaled by dynamic allocation between 0 and --max-executors and given back
+after --idle-timeout seconds without work.
+
+    POST /jobs   body: the Arc job arguments, one per line, header Authorization: Bearer $ARC_POOL_TOKEN
+                 200 with the timing report, 500 with the error when the job fails, 401 without the token
+    GET  /health running jobs and executors
+
+At most --max-jobs jobs run at once, the other requests wait for a slot.
+"""
+import argparse
+import hmac
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from arc_dag import run_job, session_builder
+
+class JobHandler(BaseHTTPRequestHandler):
+    # set by serve()
+    spark = None
+    token = None
+    slots = None
+    ids = itertools.count()
+    running = set()
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {'error': 'not found'})
+        tracker = self.spark.sparkContext._jsc.sc().statusTracker()
+        # the driver is listed with the executors
+        self._reply(200, {'running': sorted(self.running), 'executors': len(tracker.getExecutorInfos()) - 1})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self._reply(404, {'error': 'not found'})
+        if not hmac.compare_digest(self.headers.get('Authorization', '').encode(), ('Bearer ' + self.token).encode()):
+            return self._reply(401, {'error': 'missing or wrong token'})
+        argv = [a for a in self.rfile.read(int(self.headers['Content-Length'])).decode().splitlines() if a.strip()]
+        job_id = 'job{}'.format(next(self.ids))
+        queued = time.perf_counter()
+        with self.slots:
+            self.running.add(job_id)
+            started = time.perf_counter()
+            try:
+                report = run_job(self.spark.newSession(), argv, pool_prefix=job_id)
+                report.update({'job': job_id, 'queued_s': round(started - queued, 3)})
+                print('job {}: {}'.format(job_id, json.dumps(report)))
+                self._reply(200, report)
+            except Exception as e:
+                traceback.print_exc()
+                self._reply(500, {'job': job_id, 'error': str(e)})
+            finally:
+                self.running.discard(job_id)
+
+    def log_message(self, format, *args):
+        sys.stderr.write('{} {}\n'.format(self.address_string(), format % args))
+
+def serve(args):
+    token = os.environ.get(args.token_env)
+    if not token:
+        # never serve jobs without authentication, they run with the arcjob IAM role
+        print('${} is not set'.format(args.token_env))
+        sys.exit(1)
+    # without an external shuffle service, shuffle tracking keeps the executors holding shuffle
+    # files alive until they time out as well
+    spark = (session_builder('arc-warm-pool')
+        .config('spark.dynamicAllocation.enabled', 'true')
+        .config('spark.dynamicAllocation.shuffleTracking.enabled', 'true')
+        .config('spark.dynamicAllocation.minExecutors', '0')
+        .config('spark.dynamicAllocation.maxExecutors', str(args.max_executors))
+        .config('spark.dynamicAllocation.executorIdleTimeout', '{}s'.format(args.idle_timeout))
+        .config('spark.dynamicAllocation.cachedExecutorIdleTimeout', '{}s'.format(args.idle_timeout))
+        .config('spark.dynamicAllocation.shuffleTracking.timeout', '{}s'.format(args.idle_timeout))
+        .getOrCreate())
+    JobHandler.spark = spark
+    JobHandler.token = token
+    JobHandler.slots = threading.BoundedSemaphore(args.max_jobs)
+    server = ThreadingHTTPServer(('', args.port), JobHandler)
+    print('arc warm pool listening on port {}'.format(args.port))
+    try:
+        server.serve_forever()
+    finally:
+        spark.stop()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8998)
+    parser.add_argument('--max-jobs', type=int, default=4, help='jobs running at once')
+    parser.add_argument('--max-executors', type=int, default=8)
+    parser.add_argument('--token-env', default='ARC_POOL_TOKEN', help='environment variable holding the POST /jobs bearer token')
+    parser.add_argument('--idle-timeout', type=int, default=300, help='seconds before an idle executor is removed')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    serve(parse_args(sys.argv[1:]))
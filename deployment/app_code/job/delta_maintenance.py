@@ -0,0 +1,117 @@
+"""Compact, Z-order and vacuum Delta Lake tables.
+
+    delta_maintenance.py <table path> [<table path> ...] [--target-file-mb 128] [--min-small-files 8]
+        [--zorder-by id] [--retention-hours 168 [--unsafe-retention]] [--checkpoint-interval 10] [--dry-run]
+
+Small files are rewritten by OPTIMIZE into files of about --target-file-mb, clustered on the
+--zorder-by columns, once a table has at least --min-small-files of them. VACUUM then deletes
+the files no longer referenced for --retention-hours, and the table properties keep the log
+checkpointed every --checkpoint-interval commits with the same retention. A JSON report with
+the file count and size histogram before and after is printed per table.
+
+A retention below 168 hours can delete files a running reader or a long job still needs, it
+is refused unless --unsafe-retention is passed as well.
+"""
+import argparse
+import json
+import sys
+import time
+from pyspark.sql import SparkSession
+
+# upper bound of each histogram bucket in MiB, the last one is open
+HISTOGRAM_MB = [1, 8, 32, 128, 512]
+# VACUUM refuses a shorter retention unless the check is turned off
+DEFAULT_RETENTION_HOURS = 168
+
+def _histogram(sizes):
+    labels = ['<{}MB'.format(mb) for mb in HISTOGRAM_MB] + ['>={}MB'.format(HISTOGRAM_MB[-1])]
+    counts = dict.fromkeys(labels, 0)
+    for size in sizes:
+        mb = size / 1024 / 1024
+        counts[next((l for l, bound in zip(labels, HISTOGRAM_MB) if mb < bound), labels[-1])] += 1
+    return counts
+
+def file_stats(spark, table, small_file_mb):
+    """Count, bytes and size histogram of the files in the current version of a table."""
+    # file names come from the Delta log, sizes from a single recursive listing of the table
+    active = set(spark.read.format('delta').load(table).inputFiles())
+    jvm = spark.sparkContext._jvm
+    path = jvm.org.apache.hadoop.fs.Path(table)
+    fs = path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    sizes = []
+    files = fs.listFiles(path, True)
+    while files.hasNext():
+        status = files.next()
+        if status.getPath().toString() in active:
+            sizes.append(status.getLen())
+    return {
+        'files': len(sizes),
+        'bytes': sum(sizes),
+        'small_files': sum(1 for size in sizes if size < small_file_mb * 1024 * 1024),
+        'histogram': _histogram(sizes)
+    }
+
+def set_log_retention(spark, table, checkpoint_interval, retention_hours):
+    wanted = {
+        'delta.checkpointInterval': str(checkpoint_interval),
+        'delta.logRetentionDuration': 'interval {} hours'.format(retention_hours),
+        'delta.deletedFileRetentionDuration': 'interval {} hours'.format(retention_hours)
+    }
+    current = {row[0]: row[1] for row in spark.sql('SHOW TBLPROPERTIES delta.`{}`'.format(table)).collect()}
+    # each ALTER is a commit, only write what changed
+    changed = {k: v for k, v in wanted.items() if current.get(k) != v}
+    if changed:
+        spark.sql('ALTER TABLE delta.`{}` SET TBLPROPERTIES ({})'.format(table,
+            ', '.join("'{}' = '{}'".format(k, v) for k, v in changed.items())))
+    return changed
+
+def maintain(spark, table, args):
+    report = {'table': table}
+    start = time.perf_counter()
+    # a file under half the target is worth rewriting
+    small_file_mb = args.target_file_mb / 2
+    report['before'] = file_stats(spark, table, small_file_mb)
+
+    if report['before']['small_files'] >= args.min_small_files and not args.dry_run:
+        spark.conf.set('spark.databricks.delta.optimize.maxFileSize', str(args.target_file_mb * 1024 * 1024))
+        zorder = ' ZORDER BY ({})'.format(', '.join(args.zorder_by)) if args.zorder_by else ''
+        metrics = spark.sql('OPTIMIZE delta.`{}`{}'.format(table, zorder)).select('metrics').first()[0]
+        report['optimize'] = {k: metrics[k] for k in ('numFilesAdded', 'numFilesRemoved')}
+    else:
+        report['optimize'] = 'skipped'
+
+    if not args.dry_run:
+        report['properties'] = set_log_retention(spark, table, args.checkpoint_interval, args.retention_hours)
+        spark.sql('VACUUM delta.`{}` RETAIN {} HOURS'.format(table, args.retention_hours))
+        report['after'] = file_stats(spark, table, small_file_mb)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tables', nargs='+', help='Delta table paths, space or comma separated')
+    parser.add_argument('--target-file-mb', type=int, default=128)
+    parser.add_argument('--min-small-files', type=int, default=8, help='skip OPTIMIZE below this many small files')
+    parser.add_argument('--zorder-by', type=lambda v: [c for c in v.split(',') if c], default=['id'],
+        help='comma separated columns, empty to compact without Z-ordering')
+    parser.add_argument('--retention-hours', type=int, default=DEFAULT_RETENTION_HOURS)
+    parser.add_argument('--unsafe-retention', action='store_true',
+        help='allow a --retention-hours below {}, turns off the Delta retention check'.format(DEFAULT_RETENTION_HOURS))
+    parser.add_argument('--checkpoint-interval', type=int, default=10)
+    parser.add_argument('--dry-run', action='store_true', help='report the file stats only')
+    args = parser.parse_args(argv)
+    args.tables = [t for arg in args.tables for t in arg.split(',') if t]
+    if args.retention_hours < DEFAULT_RETENTION_HOURS and not args.unsafe_retention:
+        print('--retention-hours {} is below {}, pass --unsafe-retention to vacuum with it'.format(
+            args.retention_hours, DEFAULT_RETENTION_HOURS))
+        sys.exit(1)
+    return args
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    spark = SparkSession.builder.appName('Delta Lake maintenance').getOrCreate()
+    if args.unsafe_retention and args.retention_hours < DEFAULT_RETENTION_HOURS:
+        spark.conf.set('spark.databricks.delta.retentionDurationCheck.enabled', 'false')
+    for table in args.tables:
+        print('delta maintenance: ' + json.dumps(maintain(spark, table, args)))
+    spark.stop()
@@ -5,5 +5,6 @@ SELECT id
 , ${CURRENT_TIMESTAMP} AS valid_from
 , CAST(null AS timestamp) AS valid_to
 , 1 AS iscurrent
-, md5(concat(name,email,state)) AS checksum 
+, xxhash64(concat_ws('\u001F', coalesce(name,'\u0000'), coalesce(email,'\u0000'), coalesce(state,'\u0000'))) AS checksum 
+, pmod(hash(id), ${ID_BUCKETS}) AS id_bucket
 FROM ${table_name}
\ No newline at end of file
@@ -0,0 +1,18 @@
+-- Compiled from meta/contact_meta_0.json by: python -m lib.util.schema_compiler, do not edit.
+-- metadata sha256: aabed9fbfa30fc52d6f5728b7f908645cee8b9ebf5fae37ae92f52901b907b52, compiler version: 1
+SELECT
+  TRY_CAST(`__id` AS INT) AS `id`
+  ,`__name` AS `name`
+  ,`__email` AS `email`
+  ,`__state` AS `state`
+  ,FILTER(ARRAY(
+    IF((`__id` IS NULL) OR (`__id` IS NOT NULL AND TRY_CAST(`__id` AS INT) IS NULL), NAMED_STRUCT('field', 'id', 'message', CASE WHEN `__id` IS NULL THEN 'null value found but field is not nullable' WHEN `__id` IS NOT NULL AND TRY_CAST(`__id` AS INT) IS NULL THEN CONCAT('unable to convert ''', `__id`, ''' to integer') END), NULL)
+  ), e -> e IS NOT NULL) AS _errors
+FROM (
+  SELECT
+    TRIM(`_c0`) AS `__id`
+    ,CASE WHEN TRIM(`_c1`) IN ('', 'null') THEN NULL ELSE TRIM(`_c1`) END AS `__name`
+    ,CASE WHEN TRIM(`_c2`) IN ('', 'null') THEN NULL ELSE TRIM(`_c2`) END AS `__email`
+    ,CASE WHEN TRIM(`_c3`) IN ('', 'null') THEN NULL ELSE TRIM(`_c3`) END AS `__state`
+  FROM ${inputView}
+) raw
@@ -96,15 +96,24 @@ echo "--------------------------------------------------------------------------
 # echo "rm -rf $source_dir/lib/package"
 # rm -rf $source_dir/lib/package
 
+echo "------------------------------------------------------------------------------"
+echo "[Packing] typing SQL"
+echo "------------------------------------------------------------------------------"
+
+# compiled from app_code/meta, cdk synth fails when it is out of date
+echo "python3 -m lib.util.schema_compiler --app-code $app_code_dir"
+cd $source_dir
+python3 -m lib.util.schema_compiler --app-code $app_code_dir
+
 echo "------------------------------------------------------------------------------"
 echo "[Packing] ecr image build"
 echo "------------------------------------------------------------------------------"
 
-echo "cd $source_dir/lib/ecr_build"
-cd $source_dir/lib/ecr_build
-echo "zip -q -r9 $app_code_dir/ecr_build_src.zip ."
-zip -q -r9 $app_code_dir/ecr_build_src.zip .
+# deterministic zip of the Docker inputs, unchanged inputs give the same bytes
+echo "cd $source_dir"
 cd $source_dir
+echo "python3 -m lib.app_code_publisher.publisher --ecr-zip --app-code $app_code_dir"
+python3 -m lib.app_code_publisher.publisher --ecr-zip --app-code $app_code_dir
 
 echo "------------------------------------------------------------------------------"
 echo "[Synth] CDK Project"
@@ -12,8 +12,16 @@ echo "==========================================================================
 # 1. update ECR endpoint in example jobs
 export ECR_IMAGE_URI=$(aws cloudformation describe-stacks --stack-name $stack_name --region $region \
 --query "Stacks[0].Outputs[?OutputKey=='IMAGEURI'].OutputValue" --output text)
-echo "Updated ECR endpoint in sample job files in source/example/"
-sed -i.bak "s|{{ECR_URL}}|${ECR_IMAGE_URI}|g" source/example/*.yaml
+# pin the latest build by digest, so the jobs can pull IfNotPresent and still run the image built last
+ECR_DIGEST=$(aws ecr describe-images --region $region --repository-name ${ECR_IMAGE_URI#*/} \
+--image-ids imageTag=latest --query "imageDetails[0].imageDigest" --output text 2>/dev/null)
+if [[ "$ECR_DIGEST" == sha256:* ]]; then
+  ECR_IMAGE_URI="${ECR_IMAGE_URI}@${ECR_DIGEST}"
+fi
+CODE_BUCKET=$(aws cloudformation describe-stacks --stack-name $stack_name --region $region \
+--query "Stacks[0].Outputs[?OutputKey=='CODEBUCKET'].OutputValue" --output text)
+echo "Updated ECR endpoint and code bucket in sample job files in source/example/"
+sed -i.bak "s|{{ECR_URL}}|${ECR_IMAGE_URI}|g; s|{{CODE_BUCKET}}|${CODE_BUCKET}|g" source/example/*.yaml
 
 find . -type f -name "*.bak" -delete
 
@@ -60,3 +68,11 @@ ARGO_LOGIN_URI=$(aws cloudformation describe-stacks --stack-name $stack_name --r
 echo -e "\n=============================== ARGO Workflows Login =============================================="
 echo -e "\nARGO_URL: $ARGO_LOGIN_URI"
 echo "================================================================================================"
+
+#6. Get Spark History Server URL
+HISTORY_URI=$(aws cloudformation describe-stacks --stack-name $stack_name --region $region \
+--query "Stacks[0].Outputs[?OutputKey=='HISTORYURL'].OutputValue" --output text)
+
+echo -e "\n=============================== Spark History Server =============================================="
+echo -e "\nHISTORY_URL: $HISTORY_URI"
+echo "================================================================================================"
@@ -2,9 +2,18 @@
 from aws_cdk import (App,Tags,CfnOutput)
 from lib.spark_on_eks_stack import SparkOnEksStack
 from lib.cloud_front_stack import NestedStack
+from lib.util.synth_profiler import profiler, package_constructs
 
 app = App()
 
+# opt-in synth profiling, eg. cdk synth -c profile_synth=synth-profile.json
+profile_report = app.node.try_get_context('profile_synth')
+if profile_report and str(profile_report).lower() != 'false':
+    profiler.enable()
+    # every construct of lib/cdk_infra and lib/ecr_build, a new one is timed without listing it here
+    profiler.instrument(SparkOnEksStack, NestedStack,
+        *package_constructs('lib.cdk_infra'), *package_constructs('lib.ecr_build'))
+
 eks_name = app.node.try_get_context('cluster_name')
 solution_id = app.node.try_get_context('solution_id')
 solution_version= app.node.try_get_context('version')
@@ -12,12 +21,17 @@ solution_version= app.node.try_get_context('version')
 # main stack
 eks_stack = SparkOnEksStack(app, 'sql-based-etl-with-apache-spark-on-amazon-eks', eks_name, solution_id, solution_version)
 # Recommend to remove the CloudFront nested stack. Setup your own SSL certificate and add it to ALB.
-cf_nested_stack = NestedStack(eks_stack,'CreateCloudFront', eks_stack.code_bucket, eks_stack.argo_url, eks_stack.jhub_url)
+cf_nested_stack = NestedStack(eks_stack,'CreateCloudFront', eks_stack.code_bucket, eks_stack.argo_url, eks_stack.jhub_url, eks_stack.history_url)
 Tags.of(eks_stack).add('project', 'sqlbasedetl')
 Tags.of(cf_nested_stack).add('project', 'sqlbasedetl')
 # Deployment Output
 CfnOutput(eks_stack,'CODE_BUCKET', value=eks_stack.code_bucket)
 CfnOutput(eks_stack,'ARGO_URL', value='https://'+ cf_nested_stack.argo_cf)
 CfnOutput(eks_stack,'JUPYTER_URL', value='https://'+ cf_nested_stack.jhub_cf)
+CfnOutput(eks_stack,'HISTORY_URL', value='https://'+ cf_nested_stack.history_cf)
+
+with profiler.span('app.synth'):
+    app.synth()
 
-app.synth()
\ No newline at end of file
+if profiler.enabled:
+    profiler.write_report('synth-profile.json' if str(profile_report).lower() == 'true' else profile_report)
\ No newline at end of file
@@ -0,0 +1,32 @@
+# Arc stage durations of the driver log, pushed to the Prometheus Pushgateway when it runs
+# (cdk deploy -c observability=true). Arc and app_code/job/arc_dag.py log one "exit" event
+# per stage. The workflowId is a grouping key, so the series join the scraped Spark metrics of the
+# same run. The Pushgateway keeps a group until it is deleted: after its push, a run deletes the
+# groups of the earlier runs of its jobId and size, so there is one group per jobId and size.
+PUSHGATEWAY=http://pushgateway.monitoring.svc:9091
+push_stage_metrics() {
+  curl -sf -m 2 -o /dev/null $PUSHGATEWAY/-/ready || return 0
+  local group=$PUSHGATEWAY/metrics/job/arc/jobId/{{inputs.parameters.jobId}}/size/{{size}}
+  echo "pushing the Arc stage metrics of jobId={{inputs.parameters.jobId}} size={{size}} workflowId={{workflow.uid}}"
+  awk -v rc="$1" '
+    /"event":"exit"/ && match($0, /"duration":[0-9]+/) {
+      seconds = substr($0, RSTART + 11, RLENGTH - 11) / 1000
+      stage = $0; sub(/.*"stage":\{/, "", stage)
+      name = type = ""
+      if (match(stage, /"name":"([^"\\]|\\.)*"/)) name = substr(stage, RSTART + 8, RLENGTH - 9)
+      if (match(stage, /"type":"[^"]*"/)) type = substr(stage, RSTART + 8, RLENGTH - 9)
+      status = ($0 ~ /"success":false/) ? "failure" : "success"
+      printf "arc_stage_duration_seconds{stage_index=\"%d\",stage=\"%s\",type=\"%s\",status=\"%s\"} %s\n", n++, name, type, status, seconds
+    }
+    END { printf "arc_job_exit_code %d\n", rc }' /tmp/arc.log \
+  | curl -sS -m 10 -X PUT --data-binary @- $group/workflowId/{{workflow.uid}} || return 0
+  # every group has a push_time_seconds series with its grouping key as labels
+  curl -sS -m 10 $PUSHGATEWAY/metrics | awk -v jobid='{{inputs.parameters.jobId}}' -v size='{{size}}' -v uid='{{workflow.uid}}' '
+    /^push_time_seconds\{/ && index($0, "job=\"arc\"") && index($0, "jobId=\"" jobid "\"") && index($0, "size=\"" size "\"") && match($0, /workflowId="[^"]*"/) {
+      id = substr($0, RSTART + 12, RLENGTH - 13)
+      if (id != uid) print id
+    }' \
+  | while read -r id; do curl -sS -m 10 -o /dev/null -X DELETE $group/workflowId/$id; done
+  # the group of a push without the workflowId key
+  curl -sS -m 10 -o /dev/null -X DELETE $group || true
+}
@@ -0,0 +1,23 @@
+# Runs from the node group launch template, before the EKS bootstrap starts kubelet.
+# RAID0 all NVMe instance store disks and mount them as Spark shuffle scratch space.
+set -ex
+MOUNT_POINT=/mnt/local-nvme
+mkdir -p $MOUNT_POINT
+
+DEVICES=$(lsblk -dpno NAME,MODEL | awk '/Instance Storage/ {print $1}')
+COUNT=$(echo $DEVICES | wc -w)
+if [ "$COUNT" -gt 1 ]; then
+  yum install -y mdadm
+  mdadm --create --force --verbose /dev/md0 --level=0 --raid-devices=$COUNT $DEVICES
+  DEVICE=/dev/md0
+elif [ "$COUNT" -eq 1 ]; then
+  DEVICE=$DEVICES
+fi
+
+if [ -n "$DEVICE" ]; then
+  mkfs.xfs -f $DEVICE
+  mount -o defaults,noatime $DEVICE $MOUNT_POINT
+  echo "$DEVICE $MOUNT_POINT xfs defaults,noatime,nofail 0 2" >> /etc/fstab
+fi
+# executors run as a non-root user
+chmod 1777 $MOUNT_POINT
@@ -0,0 +1,118 @@
+# verbose logging
+set -ex
+
+# print current hostname and ip
+hostname
+hostname -I
+
+# derived from the executor parameters, so they stay consistent when a workflow overrides them
+OVERHEAD_MB=$(({{inputs.parameters.executorMemory}} * 1024 * {{memory_overhead_percent}} / 100))
+if [ $OVERHEAD_MB -lt 384 ]; then OVERHEAD_MB=384; fi
+SHUFFLE_PARTITIONS=$(({{inputs.parameters.executorInstances}} * {{inputs.parameters.executorCores}} * {{partitions_per_core}}))
+
+# executor local dirs, a spark-local-dir-* volume replaces the default emptyDir
+if [ "{{inputs.parameters.shuffleStorage}}" = "nvme" ]; then
+  SHUFFLE_CONF="--conf spark.kubernetes.local.dirs.tmpfs=false \
+    --conf spark.kubernetes.executor.volumes.hostPath.spark-local-dir-1.mount.path=/nvme \
+    --conf spark.kubernetes.executor.volumes.hostPath.spark-local-dir-1.options.path=/mnt/local-nvme \
+    --conf spark.kubernetes.executor.volumes.hostPath.spark-local-dir-1.options.type=Directory \
+    --conf spark.kubernetes.executor.node.selector.local-nvme=true"
+else
+  SHUFFLE_CONF="--conf spark.kubernetes.local.dirs.tmpfs=true"
+fi
+
+# class data sharing archive of the image (lib/ecr_build/cds-archive.sh), the driver and executors share the image
+if [ -f /opt/spark/cds/spark.jsa ]; then
+  CDS_OPTS="-XX:SharedArchiveFile=/opt/spark/cds/spark.jsa -Xshare:auto"
+fi
+
+# Prometheus JMX exporter of the image (lib/ecr_build/Dockerfile), the executors serve their metrics on port 8090
+if [ -f /opt/spark/jmx/jmx_prometheus_javaagent.jar ]; then
+  JMX_OPTS="-javaagent:/opt/spark/jmx/jmx_prometheus_javaagent.jar=8090:/opt/spark/jmx/jmx-exporter.yaml"
+  JMX_CONF="--conf spark.metrics.conf.executor.sink.jmx.class=org.apache.spark.metrics.sink.JmxSink \
+    --conf spark.kubernetes.executor.annotation.prometheus.io/scrape=true \
+    --conf spark.kubernetes.executor.annotation.prometheus.io/port=8090"
+fi
+
+{{arc_metrics}}
+
+# rolling, compressed event log for the Spark History Server (app_resources/spark-history-server.yaml)
+if [ -n "$SPARK_EVENT_LOG_DIR" ]; then
+  EVENT_LOG_CONF="--conf spark.eventLog.enabled=true --conf spark.eventLog.dir=$SPARK_EVENT_LOG_DIR \
+    --conf spark.eventLog.rolling.enabled=true --conf spark.eventLog.rolling.maxFileSize=128m \
+    --conf spark.eventLog.compress=true --conf spark.eventLog.compression.codec=zstd \
+    --conf spark.eventLog.logStageExecutorMetrics=true"
+fi
+
+# runner=dag (experimental) runs the independent stages of the notebook concurrently with app_code/job/arc_dag.py,
+# a PySpark reimplementation of the Arc stages the app_code jobs use, next to the notebook
+CONFIG_URI="{{inputs.parameters.configUri}}"
+# runner=pool runs them in the warm driver of app_resources/arc-warm-pool.yaml, no driver or executor to start
+if [ "{{inputs.parameters.runner}}" = "pool" ]; then
+  printf '%s\n' --etl.config.uri=$CONFIG_URI \
+    --etl.config.job.id={{inputs.parameters.jobId}} \
+    --etl.config.environment={{inputs.parameters.environment}} \
+    --ETL_CONF_EPOCH=$(date '+%s') --ETL_CONF_CURRENT_TIMESTAMP="'$(date -u '+%Y-%m-%d %H:%M:%S')'" \
+    {{inputs.parameters.parameters}} \
+    | curl --fail -sS -H "Authorization: Bearer $ARC_POOL_TOKEN" --data-binary @- http://arc-warm-pool.{{workflow.namespace}}.svc:8998/jobs
+  exit $?
+fi
+if [ "{{inputs.parameters.runner}}" = "dag" ]; then
+  APP="--conf spark.scheduler.mode=FAIR ${CONFIG_URI%/*}/arc_dag.py"
+else
+  APP="--class ai.tripl.arc.ARC local:///opt/spark/jars/arc.jar"
+fi
+
+# submit job, the driver log is kept for push_stage_metrics
+{ /opt/spark/bin/spark-submit \
+--master k8s://kubernetes.default.svc:443 \
+--deploy-mode client \
+--name arc \
+--conf spark.authenticate=true \
+--conf spark.driver.cores={{driver_cores}} \
+--conf spark.driver.extraJavaOptions="-XX:+UseG1GC $CDS_OPTS" \
+--conf spark.driver.host=$(hostname -I)  \
+--conf spark.driver.memory={{driver_memory_mb}}m \
+--conf spark.executor.cores={{inputs.parameters.executorCores}} \
+--conf spark.executor.extraJavaOptions="-XX:+UseG1GC $CDS_OPTS $JMX_OPTS" \
+--conf spark.executor.instances={{inputs.parameters.executorInstances}} \
+--conf spark.executor.memory={{inputs.parameters.executorMemory}}G \
+--conf spark.executor.memoryOverhead=${OVERHEAD_MB}m \
+--conf spark.io.encryption.enabled=true \
+--conf spark.kubernetes.authenticate.caCertFile=/var/run/secrets/kubernetes.io/serviceaccount/ca.crt \
+--conf spark.kubernetes.authenticate.driver.serviceAccountName={{workflow.serviceAccountName}} \
+--conf spark.kubernetes.authenticate.oauthTokenFile=/var/run/secrets/kubernetes.io/serviceaccount/token \
+--conf spark.kubernetes.container.image.pullPolicy={{inputs.parameters.pullPolicy}} \
+--conf spark.kubernetes.container.image={{inputs.parameters.image}} \
+--conf spark.kubernetes.driver.pod.name=$(hostname) \
+--conf spark.kubernetes.executor.label.workflowId={{workflow.uid}} \
+--conf spark.kubernetes.executor.limit.cores={{inputs.parameters.executorCores}} \
+{{executor_node_selector}}--conf spark.kubernetes.executor.podNamePrefix=$(hostname) \
+--conf spark.kubernetes.executor.request.cores={{inputs.parameters.executorCores}} \
+$SHUFFLE_CONF \
+--conf spark.kubernetes.namespace={{workflow.namespace}} \
+--conf spark.metrics.appStatusSource.enabled=true \
+--conf spark.metrics.conf.driver.sink.prometheusServlet.class=org.apache.spark.metrics.sink.PrometheusServlet \
+--conf spark.metrics.conf.driver.sink.prometheusServlet.path=/metrics/prometheus \
+--conf spark.metrics.namespace=arc \
+$JMX_CONF \
+$EVENT_LOG_CONF \
+--conf "spark.sparkoneks.jobId={{inputs.parameters.jobId}}" \
+--conf spark.sparkoneks.template={{size}} \
+--conf spark.network.crypto.enabled=true \
+--conf spark.sql.ansi.enabled=true \
+--conf spark.sql.shuffle.partitions=$SHUFFLE_PARTITIONS \
+--conf spark.ui.prometheus.enabled=true \
+--conf spark.hadoop.fs.s3a.aws.credentials.provider=com.amazonaws.auth.WebIdentityTokenCredentialsProvider \
+{{inputs.parameters.sparkConf}} \
+$APP \
+--etl.config.uri=$CONFIG_URI \
+--etl.config.job.id={{inputs.parameters.jobId}} \
+--etl.config.environment={{inputs.parameters.environment}} \
+--etl.config.ignoreEnvironments=false \
+--etl.config.tags="service=arc workflowId={{workflow.uid}} pod={{pod.name}} serviceAccount={{workflow.serviceAccountName}} namespace={{workflow.namespace}} {{inputs.parameters.tags}}" \
+--ETL_CONF_EPOCH=$(date '+%s') --ETL_CONF_CURRENT_TIMESTAMP="'$(date -u '+%Y-%m-%d %H:%M:%S')'" \
+{{inputs.parameters.parameters}} && echo 0 > /tmp/spark-submit.rc || echo $? > /tmp/spark-submit.rc; } 2>&1 | tee /tmp/arc.log
+RC=$(cat /tmp/spark-submit.rc)
+push_stage_metrics $RC
+exit $RC
@@ -0,0 +1,58 @@
+# verbose logging
+set -ex
+
+# print current hostname and ip
+hostname
+hostname -I
+
+# class data sharing archive of the image (lib/ecr_build/cds-archive.sh)
+if [ -f /opt/spark/cds/spark.jsa ]; then
+  CDS_OPTS="-XX:SharedArchiveFile=/opt/spark/cds/spark.jsa -Xshare:auto"
+fi
+
+{{arc_metrics}}
+
+# rolling, compressed event log for the Spark History Server (app_resources/spark-history-server.yaml)
+if [ -n "$SPARK_EVENT_LOG_DIR" ]; then
+  EVENT_LOG_CONF="--conf spark.eventLog.enabled=true --conf spark.eventLog.dir=$SPARK_EVENT_LOG_DIR \
+    --conf spark.eventLog.rolling.enabled=true --conf spark.eventLog.rolling.maxFileSize=128m \
+    --conf spark.eventLog.compress=true --conf spark.eventLog.compression.codec=zstd \
+    --conf spark.eventLog.logStageExecutorMetrics=true"
+fi
+
+# submit job, the driver log is kept for push_stage_metrics
+# driver memory is set at 90% of executorMemory
+{ /opt/spark/bin/spark-submit \
+--master local[{{inputs.parameters.executorCores}}] \
+--driver-memory $(({{inputs.parameters.executorMemory}} * 1024 * 90/100))m \
+--driver-java-options "-XX:+UseG1GC $CDS_OPTS" \
+--class ai.tripl.arc.ARC \
+--name arc \
+--conf spark.driver.host=$(hostname -I)  \
+--conf spark.driver.pod.name=$(hostname)-driver \
+--conf spark.io.encryption.enabled=true \
+$EVENT_LOG_CONF \
+--conf "spark.sparkoneks.jobId={{inputs.parameters.jobId}}" \
+--conf spark.sparkoneks.template={{size}} \
+--conf spark.metrics.appStatusSource.enabled=true \
+--conf spark.metrics.conf.driver.sink.prometheusServlet.class=org.apache.spark.metrics.sink.PrometheusServlet \
+--conf spark.metrics.conf.driver.sink.prometheusServlet.path=/metrics/prometheus \
+--conf spark.metrics.namespace=arc \
+--conf spark.sql.adaptive.enabled=true \
+--conf spark.network.crypto.enabled=true \
+--conf spark.ui.enabled=true \
+--conf spark.ui.prometheus.enabled=true \
+--conf spark.sql.ansi.enabled=true \
+--conf spark.hadoop.fs.s3a.aws.credentials.provider=com.amazonaws.auth.WebIdentityTokenCredentialsProvider \
+{{inputs.parameters.sparkConf}} \
+local:///opt/spark/jars/arc.jar \
+--etl.config.uri={{inputs.parameters.configUri}} \
+--etl.config.job.id={{inputs.parameters.jobId}} \
+--etl.config.environment={{inputs.parameters.environment}} \
+--etl.config.ignoreEnvironments=false \
+--etl.config.tags="service=arc workflowId={{workflow.uid}} pod={{pod.name}} serviceAccount={{workflow.serviceAccountName}} namespace={{workflow.namespace}} {{inputs.parameters.tags}}" \
+--ETL_CONF_EPOCH=$(date '+%s') --ETL_CONF_CURRENT_TIMESTAMP="'$(date -u '+%Y-%m-%d %H:%M:%S')'" \
+{{inputs.parameters.parameters}} && echo 0 > /tmp/spark-submit.rc || echo $? > /tmp/spark-submit.rc; } 2>&1 | tee /tmp/arc.log
+RC=$(cat /tmp/spark-submit.rc)
+push_stage_metrics $RC
+exit $RC
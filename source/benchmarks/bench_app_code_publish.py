@@ -0,0 +1,73 @@
+"""Publish deployment/app_code to an in-memory S3 (moto) and compare a full sync with the incremental publisher.
+
+Copies app_code to a temporary directory, publishes it once, then publishes again with no
+change, with one notebook edited and with one file deleted, and reports the files and bytes
+uploaded each time against a full sync of the tree. A job output under the same prefix must
+survive every publish. Needs boto3 and moto, run from the source directory:
+    python -m benchmarks.bench_app_code_publish
+or against a running S3 stand-in (moto_server, localstack):
+    python -m benchmarks.bench_app_code_publish --endpoint-url http://localhost:5000
+"""
+import argparse
+import os
+import os.path as path
+import shutil
+import tempfile
+import time
+from lib.app_code_publisher.publisher import local_manifest, publish
+
+BUCKET = 'bench-app-code'
+OUTPUT_KEY = 'app_code/output/contact_snapshot/part-00000.parquet'
+APP_CODE = path.join(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))), 'deployment', 'app_code')
+
+def _run(label, s3, root, results):
+    start = time.perf_counter()
+    report = publish(s3, BUCKET, 'app_code', root)
+    results.append((label, len(report['uploaded']), report['uploaded_bytes'], len(report['deleted']),
+        time.perf_counter() - start))
+    # the publisher never removes what it did not publish
+    s3.head_object(Bucket=BUCKET, Key=OUTPUT_KEY)
+
+def bench(s3):
+    s3.create_bucket(Bucket=BUCKET)
+    s3.put_object(Bucket=BUCKET, Key=OUTPUT_KEY, Body=b'job output')
+    results = []
+    with tempfile.TemporaryDirectory() as work:
+        root = path.join(work, 'app_code')
+        shutil.copytree(APP_CODE, root)
+        full = local_manifest(root)
+        full_bytes = sum(f['size'] for f in full.values())
+
+        _run('first publish', s3, root, results)
+        _run('no change', s3, root, results)
+        with open(path.join(root, 'job', 'scd2_merge.ipynb'), 'a') as f:
+            f.write('\n')
+        _run('one notebook edited', s3, root, results)
+        os.remove(path.join(root, 'data', 'update_contacts.csv'))
+        _run('one file deleted', s3, root, results)
+
+    print('full sync: {} files, {:,} bytes every deploy'.format(len(full), full_bytes))
+    for label, files, size, deleted, seconds in results:
+        print('{:<22} uploaded {:>3} files {:>10,} bytes  deleted {:>2}  {:>6.2f}s'.format(label, files, size, deleted, seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoint-url', help='default: moto in process')
+    args = parser.parse_args()
+
+    import boto3
+    if args.endpoint_url:
+        bench(boto3.client('s3', endpoint_url=args.endpoint_url, region_name='us-east-1'))
+        return
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    try:
+        from moto import mock_aws
+    except ImportError:
+        # moto < 5
+        from moto import mock_s3 as mock_aws
+    with mock_aws():
+        bench(boto3.client('s3', region_name='us-east-1'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Startup latency of the Spark executor pods of a running workflow, from pod creation to first task.
+
+Polls the executor pods labelled with the workflow uid (spark.kubernetes.executor.label.workflowId)
+while the job runs, as they are deleted when it ends, and splits each pod's startup into:
+    schedule    created -> scheduled on a node (includes waiting for a new node)
+    pull        image pull, 0 when the image was already on the node
+    start       scheduled -> container running, pull included
+    first_task  container running -> first "Got assigned task" in the executor log (JVM and executor start)
+    total       created -> first task
+Needs kubectl with access to the spark namespace:
+    python -m benchmarks.bench_pod_startup --workflow-uid $(argo get @latest -n spark -o json | jq -r .metadata.uid)
+"""
+import argparse
+import json
+import re
+import subprocess
+import time
+from datetime import datetime
+
+PULLED = re.compile(r'Successfully pulled image .* in ([0-9.]+)(m?s)')
+FIRST_TASK = 'Got assigned task'
+PHASES = ['schedule', 'pull', 'start', 'first_task', 'total']
+
+def _kubectl(namespace, *args):
+    return subprocess.run(['kubectl', '-n', namespace] + list(args), check=True, capture_output=True, text=True).stdout
+
+def _time(value):
+    # RFC 3339 of the API server, or RFC 3339 nano of kubectl logs --timestamps
+    whole, _, fraction = value.rstrip('Z').partition('.')
+    return datetime.fromisoformat(whole + ('.' + fraction[:6].ljust(6, '0') if fraction else '') + '+00:00')
+
+def _pull_seconds(events):
+    for e in events:
+        if e.get('reason') == 'Pulled':
+            m = PULLED.search(e.get('message', ''))
+            if m:
+                return float(m.group(1)) / (1000 if m.group(2) == 'ms' else 1)
+            # Container image "..." already present on machine
+            return 0.0
+    return None
+
+def _first_task(namespace, pod):
+    try:
+        log = _kubectl(namespace, 'logs', pod, '--timestamps')
+    except subprocess.CalledProcessError:
+        return None
+    line = next((l for l in log.splitlines() if FIRST_TASK in l), None)
+    return _time(line.split(' ', 1)[0]) if line else None
+
+def measure(pod, events, first_task):
+    status = pod['status']
+    created = _time(pod['metadata']['creationTimestamp'])
+    scheduled = next((_time(c['lastTransitionTime']) for c in status.get('conditions', [])
+        if c['type'] == 'PodScheduled' and c['status'] == 'True'), None)
+    state = (status.get('containerStatuses') or [{}])[0].get('state', {})
+    running = state.get('running', state.get('terminated', {})).get('startedAt')
+    running = _time(running) if running else None
+    seconds = lambda a, b: round((b - a).total_seconds(), 3) if a and b else None
+    return {
+        'schedule': seconds(created, scheduled),
+        'pull': _pull_seconds(events),
+        'start': seconds(scheduled, running),
+        'first_task': seconds(running, first_task),
+        'total': seconds(created, first_task)
+    }
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+def summarize(pods):
+    summary = {}
+    for phase in PHASES:
+        values = [p[phase] for p in pods.values() if p.get(phase) is not None]
+        if values:
+            summary[phase] = {'p50': _percentile(values, 0.5), 'p90': _percentile(values, 0.9), 'max': max(values)}
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workflow-uid', required=True)
+    parser.add_argument('--namespace', default='spark')
+    parser.add_argument('--interval', type=float, default=2, help='seconds between polls')
+    parser.add_argument('--timeout', type=float, default=1800)
+    args = parser.parse_args()
+
+    selector = 'workflowId={},spark-role=executor'.format(args.workflow_uid)
+    done, seen = {}, set()
+    start = time.time()
+    while time.time() - start < args.timeout:
+        pods = json.loads(_kubectl(args.namespace, 'get', 'pods', '-l', selector, '-o', 'json'))['items']
+        for pod in pods:
+            name = pod['metadata']['name']
+            seen.add(name)
+            if name in done:
+                continue
+            first_task = _first_task(args.namespace, name)
+            if first_task:
+                events = json.loads(_kubectl(args.namespace, 'get', 'events', '-o', 'json',
+                    '--field-selector', 'involvedObject.name=' + name))['items']
+                done[name] = measure(pod, events, first_task)
+                print('{}: {}'.format(name, json.dumps(done[name])))
+        # every executor seen has started a task and is gone: the job is over
+        if seen and not pods:
+            break
+        time.sleep(args.interval)
+    print('executor startup: ' + json.dumps({'pods': len(done), 'seconds': summarize(done)}))
+
+if __name__ == '__main__':
+    main()
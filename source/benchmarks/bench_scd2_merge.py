@@ -0,0 +1,163 @@
+"""Local-mode benchmark of the SCD Type 2 merge in scd2_merge.ipynb against its original version.
+
+Generates a contact snapshot and a batch of unchanged, changed and new contacts, then
+merges the batch into an unpartitioned snapshot with the md5 checksum (original) and into
+a snapshot partitioned by iscurrent and id_bucket, dropping unchanged rows first (pruned).
+Needs pyspark and delta-spark, run from the source directory:
+    python -m benchmarks.bench_scd2_merge --rows 10000000 100000000 --changed 0.01 --unchanged 9
+"""
+import argparse
+import tempfile
+import time
+
+STATES = ['CA', 'NY', 'TX', 'WA', 'FL', 'IL', 'OR', 'NV']
+
+LEGACY_STAGE = """
+SELECT NULL AS mergeKey, new.*
+FROM current_snapshot old
+INNER JOIN delta_batch new
+ON old.id = new.id
+WHERE old.iscurrent=1
+AND old.checksum<>new.checksum
+UNION
+SELECT id AS mergeKey, *
+FROM delta_batch
+"""
+LEGACY_MERGE = """
+MERGE INTO delta.`{target}` tgt
+USING staged_update src
+ON tgt.id = src.mergeKey
+WHEN MATCHED AND src.checksum != tgt.checksum AND tgt.iscurrent = 1 THEN
+  UPDATE SET valid_to = src.valid_from, iscurrent = 0
+WHEN NOT MATCHED THEN
+  INSERT *
+"""
+# same statements as scd2_merge.ipynb
+PRUNED_DETECT = """
+SELECT new.*, old.id IS NOT NULL AS is_update
+FROM delta_batch new
+LEFT JOIN (
+  SELECT id, id_bucket, checksum FROM current_snapshot WHERE iscurrent=1
+) old
+ON old.id_bucket = new.id_bucket
+AND old.id = new.id
+WHERE old.id IS NULL
+OR old.checksum <> new.checksum
+"""
+PRUNED_STAGE = """
+SELECT NULL AS mergeKey, id,name,email,state,valid_from,valid_to,iscurrent,checksum,id_bucket
+FROM delta_changed
+WHERE is_update
+UNION ALL
+SELECT id AS mergeKey, id,name,email,state,valid_from,valid_to,iscurrent,checksum,id_bucket
+FROM delta_changed
+"""
+PRUNED_MERGE = """
+MERGE INTO delta.`{target}` tgt
+USING staged_update src
+ON tgt.iscurrent = 1
+AND tgt.id_bucket = src.id_bucket
+AND tgt.id = src.mergeKey
+WHEN MATCHED AND src.checksum != tgt.checksum THEN
+  UPDATE SET valid_to = src.valid_from, iscurrent = 0
+WHEN NOT MATCHED THEN
+  INSERT *
+"""
+
+LEGACY_CHECKSUM = 'md5(concat(name,email,state))'
+CHECKSUM = "xxhash64(concat_ws('\\u001F', coalesce(name,'\\u0000'), coalesce(email,'\\u0000'), coalesce(state,'\\u0000')))"
+
+def _contacts(spark, start, end, buckets, version, checksum):
+    from pyspark.sql import functions as F
+    states = F.array(*[F.lit(s) for s in STATES])
+    return (spark.range(start, end)
+        .select(
+            F.col('id').cast('int').alias('id'),
+            F.concat(F.lit('name'), F.col('id')).alias('name'),
+            F.concat(F.lit('user'), F.col('id'), F.lit('@example.com')).alias('email'),
+            F.element_at(states, (F.pmod(F.col('id') + version, len(STATES)) + 1).cast('int')).alias('state'),
+            F.current_timestamp().alias('valid_from'),
+            F.lit(None).cast('timestamp').alias('valid_to'),
+            F.lit(1).alias('iscurrent'))
+        .withColumn('checksum', F.expr(checksum))
+        .withColumn('id_bucket', F.expr('pmod(hash(id), {})'.format(buckets))))
+
+def generate(spark, work, rows, changed, unchanged, buckets):
+    """Write both snapshot layouts and their batches, return the number of changed ids."""
+    n = max(1, int(rows * changed))
+    step = max(1, rows // (n * (unchanged + 1)))
+    for variant, checksum in (('legacy', LEGACY_CHECKSUM), ('pruned', CHECKSUM)):
+        snapshot = _contacts(spark, 0, rows, buckets, 0, checksum).write.format('delta').mode('overwrite')
+        if variant == 'pruned':
+            snapshot = snapshot.partitionBy('iscurrent', 'id_bucket')
+        snapshot.save(work + '/' + variant)
+
+        # ids spread over the key space, every (unchanged + 1)th one changed, plus n new ids
+        sample = 'id % {} = 0'.format(step)
+        updates = _contacts(spark, 0, rows, buckets, 1, checksum).where(sample + ' AND id % {} = 0'.format(step * (unchanged + 1))).limit(n)
+        same = _contacts(spark, 0, rows, buckets, 0, checksum).where(sample + ' AND id % {} != 0'.format(step * (unchanged + 1))).limit(n * unchanged)
+        inserts = _contacts(spark, rows, rows + n, buckets, 0, checksum)
+        (updates.unionByName(same).unionByName(inserts)
+            .write.format('delta').mode('overwrite').save(work + '/batch-' + variant))
+    return n
+
+def merge(spark, work, variant):
+    target = work + '/' + variant
+    spark.read.format('delta').load(target).createOrReplaceTempView('current_snapshot')
+    spark.read.format('delta').load(work + '/batch-' + variant).createOrReplaceTempView('delta_batch')
+    start = time.perf_counter()
+    if variant == 'pruned':
+        spark.sql(PRUNED_DETECT).persist().createOrReplaceTempView('delta_changed')
+        spark.sql(PRUNED_STAGE).createOrReplaceTempView('staged_update')
+        statement = PRUNED_MERGE
+    else:
+        spark.sql(LEGACY_STAGE).createOrReplaceTempView('staged_update')
+        statement = LEGACY_MERGE
+    source_rows = spark.table('staged_update').count()
+    spark.sql(statement.format(target=target))
+    seconds = time.perf_counter() - start
+    metrics = (spark.sql('DESCRIBE HISTORY delta.`{}` LIMIT 1'.format(target))
+        .select('operationMetrics').first()[0])
+    return seconds, source_rows, metrics
+
+def counts(spark, path):
+    return (spark.read.format('delta').load(path)
+        .selectExpr('count(*)', 'sum(iscurrent)').first())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000000])
+    parser.add_argument('--changed', type=float, default=0.01, help='share of the snapshot changed by the batch')
+    parser.add_argument('--unchanged', type=int, default=9, help='unchanged rows in the batch per changed row')
+    parser.add_argument('--buckets', type=int, default=16)
+    parser.add_argument('--master', default='local[*]')
+    parser.add_argument('--work-dir', help='default: a temporary directory')
+    args = parser.parse_args()
+
+    from pyspark.sql import SparkSession
+    from delta import configure_spark_with_delta_pip
+
+    builder = (SparkSession.builder.master(args.master).appName('bench-scd2-merge')
+        .config('spark.ui.enabled', 'false')
+        .config('spark.sql.extensions', 'io.delta.sql.DeltaSparkSessionExtension')
+        .config('spark.sql.catalog.spark_catalog', 'org.apache.spark.sql.delta.catalog.DeltaCatalog')
+        .config('spark.databricks.delta.merge.repartitionBeforeWrite.enabled', 'true'))
+    spark = configure_spark_with_delta_pip(builder).getOrCreate()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(dir=args.work_dir) as work:
+            n = generate(spark, work, rows, args.changed, args.unchanged, args.buckets)
+            results = [(variant,) + merge(spark, work, variant) for variant in ('legacy', 'pruned')]
+            assert counts(spark, work + '/legacy') == counts(spark, work + '/pruned')
+
+        baseline = results[0][1]
+        print('{:,} rows, {:,} unchanged, {:,} changed and {:,} new ids, {} buckets'.format(
+            rows, n * args.unchanged, n, n, args.buckets))
+        for variant, seconds, source_rows, metrics in results:
+            print('{:<8} {:>8.2f}s  x{:.2f}  merge source rows {:>10}  files removed {:>6} added {:>6}  rows copied {:>12}'.format(
+                variant, seconds, baseline / seconds, source_rows, metrics.get('numTargetFilesRemoved'),
+                metrics.get('numTargetFilesAdded'), metrics.get('numTargetRowsCopied')))
+    spark.stop()
+
+if __name__ == '__main__':
+    main()
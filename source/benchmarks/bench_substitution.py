@@ -0,0 +1,60 @@
+"""Micro-benchmark: legacy str.replace loop vs compiled placeholder substitution.
+
+Run from the source directory:
+    python -m benchmarks.bench_substitution --docs 2000 --fields 20
+"""
+import argparse
+import os
+import timeit
+from lib.util.manifest_reader import ManifestTemplate
+from lib.util.placeholder import compile_fields
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_MANIFESTS = ['jupyter-config.yaml', 'etl-rbac.yaml', 'argo-values.yaml']
+
+def build_manifest(docs, n_fields):
+    # a large multi-document manifest, with extra placeholders to widen the field mapping
+    seeds = []
+    for name in SEED_MANIFESTS:
+        with open(os.path.join(SOURCE_DIR, 'app_resources', name)) as f:
+            seeds.extend(d for d in f.read().split('\n---\n') if d.strip())
+    extra = ''.join('    extra{0}: {{{{FIELD_{0}}}}}\n'.format(i) for i in range(n_fields))
+    body = []
+    for i in range(docs):
+        body.append(seeds[i % len(seeds)] + '\nbenchmark:\n  doc: {}\n  values:\n{}'.format(i, extra))
+    fields = {"{{MY_SA}}": "sparkoneks", "{{REGION}}": "${Token[AWS.Region.4]}",
+              "{{SECRET_NAME}}": "jHubPwd-abc", "{{INBOUND_SG}}": "sg-0123456789"}
+    fields.update({'{{FIELD_%d}}' % i: 'value-%d' % i for i in range(n_fields)})
+    return '\n---\n'.join(body), fields
+
+def legacy_replace(text, fields):
+    for searchwrd, replwrd in fields.items():
+        text = text.replace(searchwrd, replwrd)
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    text, fields = build_manifest(args.docs, args.fields)
+    compiled = compile_fields(fields)
+    template = ManifestTemplate(text)
+    assert legacy_replace(text, fields) == compiled.apply(text) == template.render(fields)
+
+    print('manifest: {:,} bytes, {} documents, {} fields'.format(len(text), args.docs, len(fields)))
+    cases = [
+        ('str.replace loop', lambda: legacy_replace(text, fields)),
+        ('compiled regex', lambda: compiled.apply(text)),
+        ('indexed template', lambda: template.render(fields)),
+    ]
+    baseline = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print('{:<18} {:>9.2f} ms  x{:.1f}'.format(name, best * 1000, baseline / best))
+
+if __name__ == '__main__':
+    main()
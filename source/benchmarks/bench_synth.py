@@ -0,0 +1,183 @@
+"""Synthesize SparkOnEksStack offline at scale and compare against a stored baseline.
+
+Each scenario runs in a fresh process, so peak RSS covers one synth only.
+Run from the source directory, with the CDK dependencies installed:
+    python -m benchmarks.bench_synth                      # all scenarios, compare to baseline
+    python -m benchmarks.bench_synth -s stacks -n 8       # one scenario at a different scale
+    python -m benchmarks.bench_synth --update-baseline    # record the current numbers
+    python -m benchmarks.bench_synth --check              # as above, and fail when a scenario has no baseline
+"""
+import argparse
+import json
+import os
+import os.path as path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+SOURCE_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+BASELINE_FILE = path.join(path.dirname(path.abspath(__file__)), 'baseline.json')
+
+# scenario -> default scale
+SCENARIOS = {
+    'single-stack': 1,
+    'stacks': 4,
+    'nodegroups': 20,
+    'service-accounts': 20,
+    'workflow-templates': 20,
+}
+# allowed growth over the baseline before a metric counts as a regression
+TOLERANCE = {'synth_s': 0.25, 'peak_rss_mb': 0.15, 'template_kb': 0.05}
+
+def _node_peak_rss_kb():
+    # the jsii runtime is a node child process, its peak RSS is not in RUSAGE_SELF
+    total = 0
+    for pid in filter(str.isdigit, os.listdir('/proc') if path.isdir('/proc') else []):
+        try:
+            with open('/proc/{}/stat'.format(pid)) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            if ppid != os.getpid():
+                continue
+            with open('/proc/{}/status'.format(pid)) as f:
+                total += next(int(l.split()[1]) for l in f if l.startswith('VmHWM:'))
+        except (OSError, ValueError, IndexError, StopIteration):
+            continue
+    return total
+
+def write_fleet_spec(scale, outdir):
+    """Write the default node fleet plus `scale` spot node groups, for EksConst to expand through the node_fleet context."""
+    from lib.util.manifest_reader import load_yaml_local
+
+    spec = load_yaml_local(SOURCE_DIR + '/app_resources/eks-nodegroups.yaml')
+    spot = next(g for g in spec['nodeGroups'] if g.get('capacityType') == 'SPOT')
+    for n in range(scale):
+        spec['nodeGroups'].append({**spot, 'id': 'bench-ng{}'.format(n), 'name': 'bench-{}'.format(n), 'nameTag': 'bench-{}-{{cluster}}'.format(n)})
+    spec_file = path.join(outdir, 'bench-nodegroups.yaml')
+    with open(spec_file, 'w') as f:
+        yaml.safe_dump(spec, f)
+    return spec_file
+
+def build_app(scenario, scale, outdir):
+    from aws_cdk import App, Tags, CfnOutput, aws_iam as iam
+    from lib.spark_on_eks_stack import SparkOnEksStack
+    from lib.cloud_front_stack import NestedStack
+    from lib.util.manifest_reader import load_yaml_local, load_yaml_replace_var_local
+
+    with open(path.join(SOURCE_DIR, 'cdk.json')) as f:
+        context = json.load(f)['context']
+    if scenario == 'nodegroups':
+        context['node_fleet'] = write_fleet_spec(scale, outdir)
+    app = App(outdir=outdir, context=context)
+
+    for i in range(scale if scenario == 'stacks' else 1):
+        suffix = '-{}'.format(i) if i else ''
+        stack = SparkOnEksStack(app, context['solution_name'] + suffix, context['cluster_name'] + suffix, context['solution_id'], context['version'])
+        cf_stack = NestedStack(stack, 'CreateCloudFront', stack.code_bucket, stack.argo_url, stack.jhub_url, stack.history_url)
+        Tags.of(stack).add('project', 'sqlbasedetl')
+        Tags.of(cf_stack).add('project', 'sqlbasedetl')
+        CfnOutput(stack, 'CODE_BUCKET', value=stack.code_bucket)
+        CfnOutput(stack, 'HISTORY_URL', value='https://' + cf_stack.history_cf)
+
+        cluster = stack.node.find_child('eks_cluster').my_cluster
+        if scenario == 'service-accounts':
+            statements = load_yaml_replace_var_local(SOURCE_DIR + '/app_resources/etl-iam-role.yaml',
+                fields={"{{codeBucket}}": stack.code_bucket, "{{datalakeBucket}}": stack.code_bucket})
+            for n in range(scale):
+                sa = cluster.add_service_account('BenchSa{}'.format(n), name='bench-{}'.format(n), namespace='spark')
+                for statmnt in statements:
+                    sa.add_to_principal_policy(iam.PolicyStatement.from_json(statmnt))
+        elif scenario == 'workflow-templates':
+            for n in range(scale):
+                tmpl = load_yaml_local(SOURCE_DIR + '/app_resources/spark-template.yaml')
+                tmpl['metadata']['name'] = 'bench-template-{}'.format(n)
+                cluster.add_manifest('BenchWrktmpl{}'.format(n), tmpl)
+    return app
+
+def run_scenario(scenario, scale):
+    """Synthesize one scenario in this process and return its metrics."""
+    # the constructs locate app_resources relative to $VIRTUAL_ENV
+    os.environ['VIRTUAL_ENV'] = path.join(path.dirname(SOURCE_DIR), '.env')
+    os.environ.setdefault('MANIFEST_OFFLINE', 'true')
+    sys.path.insert(0, SOURCE_DIR)
+
+    with tempfile.TemporaryDirectory() as outdir:
+        start = time.perf_counter()
+        app = build_app(scenario, scale, outdir)
+        app.synth()
+        synth_s = time.perf_counter() - start
+        template_bytes = sum(path.getsize(path.join(outdir, f)) for f in os.listdir(outdir) if f.endswith('.template.json'))
+
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'scenario': scenario,
+        'scale': scale,
+        'synth_s': round(synth_s, 3),
+        'peak_rss_mb': round((self_kb + _node_peak_rss_kb()) / 1024, 1),
+        'template_kb': round(template_bytes / 1024, 1)
+    }
+
+def compare(results, baseline, check=False):
+    regressions = []
+    for r in results:
+        base = baseline.get('{scenario}:{scale}'.format(**r))
+        if not base:
+            if check:
+                regressions.append('{scenario}:{scale} no baseline, record one with --update-baseline'.format(**r))
+            else:
+                print('{scenario}:{scale}  no baseline'.format(**r))
+            continue
+        for metric, tolerance in TOLERANCE.items():
+            if base.get(metric) and r[metric] > base[metric] * (1 + tolerance):
+                regressions.append('{}:{} {} {} -> {} (+{:.0%})'.format(
+                    r['scenario'], r['scale'], metric, base[metric], r[metric], r[metric] / base[metric] - 1))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('-n', '--scale', type=int, help='override the default scale of the selected scenarios')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='fail when a scenario has no baseline')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--run-one', nargs=2, metavar=('SCENARIO', 'SCALE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_scenario(args.run_one[0], int(args.run_one[1]))))
+        return
+
+    results = []
+    for scenario in args.scenario or sorted(SCENARIOS):
+        scale = args.scale or SCENARIOS[scenario]
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_synth', '--run-one', scenario, str(scale)],
+            cwd=SOURCE_DIR, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print('{scenario:<20} x{scale:<4} synth {synth_s:>7.2f}s  peak rss {peak_rss_mb:>7.1f} MB  templates {template_kb:>8.1f} KB'.format(**result))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        baseline.update({'{scenario}:{scale}'.format(**r): r for r in results})
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('baseline updated: ' + BASELINE_FILE)
+        return
+
+    regressions = compare(results, baseline, args.check)
+    for r in regressions:
+        print('REGRESSION ' + r)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Local-mode latency of short Arc jobs with and without the warm pool (app_code/job/arc_server.py).
+
+Each job is a small notebook of a few SQL stages. Without the pool every job is a new
+spark-submit of arc_dag.py, like a spark-template step; with the pool the jobs are posted
+to one arc_server.py started beforehand. Needs pyspark (spark-submit on the PATH or in the
+pyspark package) and the Delta jars, run from the source directory:
+    python -m benchmarks.bench_warm_pool --jobs 10 --packages io.delta:delta-core_2.12:2.4.0
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from urllib import request
+from urllib.error import URLError
+
+JOB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'deployment', 'app_code', 'job')
+
+def _cell(source):
+    return {'cell_type': 'code', 'metadata': {}, 'outputs': [], 'execution_count': None, 'source': source}
+
+def write_notebook(path, rows):
+    cells = [
+        _cell('%env\nETL_CONF_ROWS={}'.format(rows)),
+        _cell('%sql outputView="numbers" name="numbers" environments=test persist=true sqlParams=rows=${ETL_CONF_ROWS}\n\n'
+            'SELECT id, id % 7 AS g FROM range(${rows})'),
+        _cell('%sql outputView="totals" name="totals" environments=test persist=true\n\n'
+            'SELECT g, count(*) AS n, sum(id) AS s FROM numbers GROUP BY g'),
+        _cell('%sqlvalidate outputView="check" name="check" environments=test sqlParams=rows=${ETL_CONF_ROWS}\n\n'
+            'SELECT sum(n) = ${rows} AS valid, TO_JSON(NAMED_STRUCT(\'rows\', sum(n))) AS message FROM totals')
+    ]
+    with open(path, 'w') as f:
+        json.dump({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 4}, f)
+
+def _spark_submit():
+    found = shutil.which('spark-submit')
+    if found:
+        return found
+    import pyspark
+    return os.path.join(os.path.dirname(pyspark.__file__), 'bin', 'spark-submit')
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def _job_args(notebook):
+    return ['--etl.config.uri=' + notebook, '--etl.config.environment=test']
+
+def run_cold(submit, notebook):
+    start = time.perf_counter()
+    subprocess.run(submit + [os.path.join(JOB_DIR, 'arc_dag.py')] + _job_args(notebook),
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def start_pool(submit, port, timeout=300):
+    server = subprocess.Popen(submit + [os.path.join(JOB_DIR, 'arc_server.py'), '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            request.urlopen('http://localhost:{}/health'.format(port)).read()
+            return server, time.perf_counter() - start
+        except (URLError, ConnectionError):
+            time.sleep(0.5)
+    server.kill()
+    raise RuntimeError('the warm pool did not start in {}s'.format(timeout))
+
+def run_warm(port, notebook):
+    start = time.perf_counter()
+    body = '\n'.join(_job_args(notebook)).encode()
+    request.urlopen(request.Request('http://localhost:{}/jobs'.format(port), data=body)).read()
+    return time.perf_counter() - start
+
+def _summary(label, seconds):
+    ordered = sorted(seconds)
+    return '{:<10} jobs {:>3}  mean {:>6.2f}s  p50 {:>6.2f}s  max {:>6.2f}s  total {:>7.2f}s'.format(
+        label, len(seconds), sum(seconds) / len(seconds), ordered[len(ordered) // 2], ordered[-1], sum(seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--master', default='local[2]')
+    parser.add_argument('--packages', help='Delta Lake package matching the pyspark version, unless its jars are already on the classpath')
+    args = parser.parse_args()
+
+    submit = [_spark_submit(), '--master', args.master, '--conf', 'spark.ui.enabled=false']
+    if args.packages:
+        submit += ['--packages', args.packages]
+    with tempfile.TemporaryDirectory() as work:
+        notebook = os.path.join(work, 'short_job.ipynb')
+        write_notebook(notebook, args.rows)
+
+        cold = [run_cold(submit, notebook) for _ in range(args.jobs)]
+        port = _free_port()
+        server, startup = start_pool(submit, port)
+        try:
+            warm = [run_warm(port, notebook) for _ in range(args.jobs)]
+        finally:
+            server.terminate()
+            server.wait()
+
+    for i, (c, w) in enumerate(zip(cold, warm)):
+        print('job {:>3}  cold {:>6.2f}s  warm pool {:>6.2f}s'.format(i, c, w))
+    print(_summary('cold', cold))
+    print(_summary('warm pool', warm))
+    print('warm pool startup {:.2f}s, paid once, x{:.1f} faster per job after it'.format(startup, sum(cold) / sum(warm)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Local-mode benchmark of the wordcount.py native job against its original version.
+
+Generates yellow_tripdata-like CSV files and runs each variant on a local Spark session.
+Needs pyspark, run from the source directory:
+    python -m benchmarks.bench_wordcount --rows 2000000 --files 8
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_DIR = os.path.join(os.path.dirname(SOURCE_DIR), 'deployment', 'app_code', 'job')
+VENDORS = ['VTS', 'CMT', 'DDS', None]
+
+def generate_csv(directory, rows, files, seed=42):
+    from wordcount import TRIP_SCHEMA
+    rnd = random.Random(seed)
+    header = [f.name for f in TRIP_SCHEMA.fields]
+    for n in range(files):
+        with open(os.path.join(directory, 'yellow_tripdata_2009-{:02d}.csv'.format(n % 12 + 1)), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for _ in range(rows // files):
+                pickup = '2009-{:02d}-{:02d} {:02d}:{:02d}:00'.format(n % 12 + 1, rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59))
+                writer.writerow([rnd.choice(VENDORS) or '', pickup, pickup, rnd.randint(1, 6), round(rnd.random() * 20, 2),
+                    -73.99, 40.75, '1', '', -73.98, 40.76, 'CASH', 9.5, 0.5, 0.5, 1.0, 0.0, 11.5])
+
+def legacy_wordcount(spark, source, output):
+    # the job before the schema-aware rewrite
+    df = spark.read.option("header", True).csv(source)
+    df.filter(df["vendor_name"].isNotNull()).select("vendor_name").groupBy("vendor_name").count().write.mode("overwrite").parquet(output)
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--master', default='local[*]')
+    args = parser.parse_args()
+
+    sys.path.insert(0, JOB_DIR)
+    from pyspark.sql import SparkSession
+    import wordcount
+
+    spark = (SparkSession.builder.master(args.master).appName('bench-wordcount')
+        .config('spark.ui.enabled', 'false')
+        .getOrCreate())
+    with tempfile.TemporaryDirectory() as work:
+        source_dir = os.path.join(work, 'csv')
+        os.makedirs(source_dir)
+        generate_csv(source_dir, args.rows, args.files)
+        source = os.path.join(source_dir, 'yellow_tripdata*.csv')
+        cache = os.path.join(work, 'cache')
+
+        results = [
+            ('original', timed(legacy_wordcount, spark, source, os.path.join(work, 'out-legacy'))[0]),
+            ('schema + pruning', timed(wordcount.run, spark, source, os.path.join(work, 'out-schema'))[0]),
+            ('cache, first run', timed(wordcount.run, spark, source, os.path.join(work, 'out-cold'), cache)[0]),
+            ('cache, reused', timed(wordcount.run, spark, source, os.path.join(work, 'out-warm'), cache)[0])
+        ]
+        expected = sorted(map(tuple, spark.read.parquet(os.path.join(work, 'out-legacy')).collect()))
+        for out in ('out-schema', 'out-cold', 'out-warm'):
+            assert sorted(map(tuple, spark.read.parquet(os.path.join(work, out)).collect())) == expected, out
+
+    spark.stop()
+    baseline = results[0][1]
+    print('{:,} rows in {} files'.format(args.rows, args.files))
+    for name, seconds in results:
+        print('{:<20} {:>8.2f}s  x{:.2f}'.format(name, seconds, baseline / seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import json
+import logging
+import os
+import tempfile
+import zipfile
+import boto3
+from publisher import publish
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+s3 = boto3.client('s3')
+
+def handler(event, _):
+    """on_event handler of the custom resource publishing the app_code asset to the code bucket."""
+    props = event['ResourceProperties']
+    physical_id = 's3://{}/{}'.format(props['DestinationBucket'], props['DestinationPrefix'])
+    # the code bucket is retained, what was published stays with it
+    if event['RequestType'] == 'Delete':
+        return {'PhysicalResourceId': physical_id}
+
+    with tempfile.TemporaryDirectory() as work:
+        archive = os.path.join(work, 'app_code.zip')
+        s3.download_file(props['SourceBucket'], props['SourceKey'], archive)
+        root = os.path.join(work, 'app_code')
+        with zipfile.ZipFile(archive) as z:
+            z.extractall(root)
+        report = publish(s3, props['DestinationBucket'], props['DestinationPrefix'], root)
+    logger.info(json.dumps(report))
+    return {
+        'PhysicalResourceId': physical_id,
+        'Data': {'Uploaded': len(report['uploaded']), 'Deleted': len(report['deleted'])}
+    }
@@ -0,0 +1,174 @@
+"""Content-addressed publishing of deployment/app_code to the code bucket.
+
+    python -m lib.app_code_publisher.publisher --ecr-zip             # rebuild app_code/ecr_build_src.zip if its inputs changed
+    python -m lib.app_code_publisher.publisher --ecr-zip --check     # fail when ecr_build_src.zip is out of date
+    python -m lib.app_code_publisher.publisher --bucket <code bucket> [--endpoint-url http://localhost:5000] [--dry-run]
+
+Each file is published under <prefix>/<relative path> with its sha256, and the published set
+is recorded in <prefix>/.publish-manifest.json. A publish uploads only the files whose sha256
+differs from the manifest, in parallel and multipart above --multipart-mb, and deletes only
+the keys the previous manifest published, so the job outputs under the same prefix are never
+touched. Without a manifest (a bucket filled by a full sync) the ETag of a single part object
+is compared with the file's md5 instead.
+
+ecr_build_src.zip is written deterministically from the Docker inputs only (sorted names, fixed
+timestamps and modes, no __pycache__), so its bytes and hash only change with them and the
+polling S3 source of the image pipeline only fires on a real Docker change.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import os.path as path
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = '.publish-manifest.json'
+EXCLUDED_DIRS = {'__pycache__', '.ipynb_checkpoints', '.git'}
+EXCLUDED_SUFFIXES = ('.pyc', '.pyo', '.DS_Store')
+# files the image is built from, relative to lib/ecr_build (the CDK construct next to them is not one),
+# each one is at the root of the zip
+ECR_BUILD_INPUTS = ['Dockerfile', 'buildspec.yaml', 'buildspec-manifest.yaml', 'cds-archive.sh', 'cds-training.ipynb', 'jmx-exporter.yaml',
+    # smoke tested in the image build
+    '../../../deployment/app_code/job/arc_dag.py']
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+CHUNK = 1024 * 1024
+
+def _digests(file_path, md5=False):
+    sha = hashlib.sha256()
+    md = hashlib.md5() if md5 else None
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK), b''):
+            sha.update(block)
+            if md:
+                md.update(block)
+    return sha.hexdigest(), md.hexdigest() if md else None
+
+def local_manifest(root):
+    """{relative key: {sha256, size}} of the files to publish under root."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDED_DIRS)
+        for name in sorted(filenames):
+            if name.endswith(EXCLUDED_SUFFIXES) or name == MANIFEST_NAME:
+                continue
+            full = path.join(dirpath, name)
+            key = path.relpath(full, root).replace(os.sep, '/')
+            files[key] = {'sha256': _digests(full)[0], 'size': path.getsize(full)}
+    return files
+
+def ecr_source_zip(ecr_build_dir, inputs=ECR_BUILD_INPUTS):
+    """Bytes of the image build source zip, the same for the same inputs."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        for name in sorted(inputs, key=path.basename):
+            with open(path.join(ecr_build_dir, name), 'rb') as f:
+                data = f.read()
+            info = zipfile.ZipInfo(path.basename(name), date_time=ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (0o755 if name.endswith('.sh') else 0o644) << 16
+            z.writestr(info, data, compresslevel=9)
+    return buf.getvalue()
+
+def ecr_source_zip_is_current(ecr_build_dir, zip_path, inputs=ECR_BUILD_INPUTS):
+    if not path.exists(zip_path):
+        return False
+    with open(zip_path, 'rb') as f:
+        return f.read() == ecr_source_zip(ecr_build_dir, inputs)
+
+def write_ecr_source_zip(ecr_build_dir, zip_path, inputs=ECR_BUILD_INPUTS):
+    """Write the image build source zip unless it already holds the same bytes, return True when written."""
+    if ecr_source_zip_is_current(ecr_build_dir, zip_path, inputs):
+        return False
+    tmp_path = zip_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(ecr_source_zip(ecr_build_dir, inputs))
+    os.replace(tmp_path, zip_path)
+    return True
+
+def _remote_manifest(s3, bucket, prefix):
+    try:
+        body = s3.get_object(Bucket=bucket, Key=prefix + '/' + MANIFEST_NAME)['Body'].read()
+        return json.loads(body)
+    except s3.exceptions.NoSuchKey:
+        return None
+
+def _etags(s3, bucket, prefix):
+    etags = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix + '/'):
+        for obj in page.get('Contents', []):
+            etags[obj['Key'][len(prefix) + 1:]] = obj['ETag'].strip('"')
+    return etags
+
+def plan(root, local, remote, etags=None):
+    """Keys to upload and keys to delete, from the local files and the published manifest."""
+    if remote is not None:
+        upload = [k for k, v in local.items() if remote.get(k, {}).get('sha256') != v['sha256']]
+        delete = sorted(set(remote) - set(local))
+        return upload, delete
+    # first publish over a full sync: a single part ETag is the md5 of the object
+    upload = [k for k in local if etags.get(k) != _digests(path.join(root, k), md5=True)[1]]
+    return upload, []
+
+def publish(s3, bucket, prefix, root, max_workers=16, multipart_mb=64, dry_run=False):
+    """Upload the changed files of root to s3://bucket/prefix and prune the deleted ones."""
+    from boto3.s3.transfer import TransferConfig
+    prefix = prefix.strip('/')
+    local = local_manifest(root)
+    remote = _remote_manifest(s3, bucket, prefix)
+    upload, delete = plan(root, local, remote, None if remote is not None else _etags(s3, bucket, prefix))
+    report = {'files': len(local), 'uploaded': upload, 'deleted': delete,
+        'uploaded_bytes': sum(local[k]['size'] for k in upload)}
+    if dry_run:
+        return report
+
+    config = TransferConfig(multipart_threshold=multipart_mb * CHUNK, multipart_chunksize=16 * CHUNK, max_concurrency=4)
+    def put(key):
+        s3.upload_file(path.join(root, key), bucket, prefix + '/' + key,
+            ExtraArgs={'Metadata': {'sha256': local[key]['sha256']}}, Config=config)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(put, upload))
+    # delete_objects takes up to 1000 keys
+    for i in range(0, len(delete), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': prefix + '/' + k} for k in delete[i:i + 1000]], 'Quiet': True})
+    # written last, a failed publish is retried in full next time
+    s3.put_object(Bucket=bucket, Key=prefix + '/' + MANIFEST_NAME, Body=json.dumps(local, sort_keys=True).encode(),
+        ContentType='application/json')
+    return report
+
+def main():
+    proj_dir = path.dirname(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-code', default=path.join(proj_dir, 'deployment', 'app_code'))
+    parser.add_argument('--ecr-zip', action='store_true', help='only rebuild ecr_build_src.zip')
+    parser.add_argument('--bucket')
+    parser.add_argument('--prefix', default='app_code')
+    parser.add_argument('--endpoint-url', help='a local S3, eg. moto_server')
+    parser.add_argument('--max-workers', type=int, default=16)
+    parser.add_argument('--multipart-mb', type=int, default=64)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--check', action='store_true', help='with --ecr-zip, exit 1 when ecr_build_src.zip is out of date')
+    args = parser.parse_args()
+
+    ecr_build_dir, zip_path = path.join(proj_dir, 'source', 'lib', 'ecr_build'), path.join(args.app_code, 'ecr_build_src.zip')
+    if args.ecr_zip and args.check:
+        if not ecr_source_zip_is_current(ecr_build_dir, zip_path):
+            print('{} is out of date, run: python -m lib.app_code_publisher.publisher --ecr-zip'.format(zip_path))
+            sys.exit(1)
+        return
+    if write_ecr_source_zip(ecr_build_dir, zip_path):
+        print('rebuilt ecr_build_src.zip')
+    if args.ecr_zip:
+        return
+    if not args.bucket:
+        print('--bucket is required to publish')
+        sys.exit(1)
+    import boto3
+    s3 = boto3.client('s3', endpoint_url=args.endpoint_url)
+    report = publish(s3, args.bucket, args.prefix, args.app_code, args.max_workers, args.multipart_mb, args.dry_run)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from lib.util.manifest_reader import load_yaml_replace_var_local
+from lib.cdk_infra.spark_sizing import SizeSpec
+import json, os, sys
+
+# thresholds of the delta-maintenance CronWorkflow, override any of them with the
+# `delta_maintenance` context in cdk.json, or disable it with: cdk deploy -c delta_maintenance=false
+DEFAULT_SETTINGS = {
+    'schedule': '0 3 * * *',
+    # tables under the code bucket
+    'tables': ['app_code/output/contact_snapshot/', 'app_code/output/delta_load/'],
+    'targetFileMb': 128,
+    'minSmallFiles': 8,
+    'zorderBy': 'id',
+    'retentionHours': 168,
+    'checkpointInterval': 10
+}
+
+def maintenance_settings(context):
+    """DEFAULT_SETTINGS updated with the context value, None when maintenance is disabled."""
+    if str(context).lower() == 'false':
+        return None
+    if isinstance(context, str):
+        context = json.loads(context)
+    unknown = set(context or {}) - set(DEFAULT_SETTINGS)
+    if unknown:
+        print('Unknown delta_maintenance settings: ' + ', '.join(sorted(unknown)))
+        sys.exit(1)
+    settings = {**DEFAULT_SETTINGS, **(context or {})}
+    # the scheduled VACUUM never turns off the Delta retention check, a shorter retention is a manual
+    # run of delta_maintenance.py with --unsafe-retention
+    if int(settings['retentionHours']) < DEFAULT_SETTINGS['retentionHours']:
+        print('delta_maintenance retentionHours must be at least {}'.format(DEFAULT_SETTINGS['retentionHours']))
+        sys.exit(1)
+    return settings
+
+class DeltaMaintenanceConst(Construct):
+    """CronWorkflow compacting, Z-ordering and vacuuming the Delta tables written by the SCD2 jobs."""
+
+    @property
+    def cron_workflow(self):
+        return self._cron_workflow
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, code_bucket: str, size: SizeSpec, settings: dict, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+        tables = ','.join('s3a://{}/{}'.format(code_bucket, t.lstrip('/')) for t in settings['tables'])
+        _fields = {'{{' + k + '}}': str(v) for k, v in settings.items() if k != 'tables'}
+        _fields.update({
+            '{{tables}}': tables,
+            '{{codeBucket}}': code_bucket,
+            '{{image}}': size.image,
+            '{{pullPolicy}}': size.pull_policy
+        })
+        self._cron_workflow = eks_cluster.add_manifest('DeltaMaintenanceCron',
+            load_yaml_replace_var_local(source_dir+'/app_resources/delta-maintenance.yaml', fields=_fields, strict=True)
+        )
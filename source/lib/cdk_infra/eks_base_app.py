@@ -1,19 +1,28 @@
 from aws_cdk import Aws
 from constructs import Construct
 from aws_cdk.aws_eks import ICluster, KubernetesManifest
+from aws_cdk.aws_iam import IRole
+from lib.cdk_infra.karpenter import KarpenterConst
 from lib.util.manifest_reader import *
+from lib.util.remote_manifest import prefetch_remote_manifests
 import os
 
+CONTAINER_INSIGHT_URL = 'https://raw.githubusercontent.com/aws-samples/amazon-cloudwatch-container-insights/latest/k8s-deployment-manifest-templates/deployment-mode/daemonset/container-insights-monitoring/quickstart/cwagent-fluentd-quickstart.yaml'
+# remote manifests installed by this construct, add CONTAINER_INSIGHT_URL when enabling container insight
+REMOTE_MANIFESTS = []
+
 class EksBaseAppConst(Construct):
     @property
     def secret_created(self):
         return self._ext_secret
 
-    def __init__(self,scope: Construct,id: str,eks_cluster: ICluster, **kwargs,) -> None:
+    def __init__(self,scope: Construct,id: str,eks_cluster: ICluster, noderole: IRole = None, karpenter: bool = False, **kwargs,) -> None:
         super().__init__(scope, id, **kwargs)
 
         source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
-        
+        # resolve all remote manifests at once, the loads below are then served from the cache
+        prefetch_remote_manifests(REMOTE_MANIFESTS)
+
         # Add ALB ingress controller to EKS
         self._alb = eks_cluster.add_helm_chart('ALBChart',
             chart='aws-load-balancer-controller',
@@ -44,23 +53,26 @@ class EksBaseAppConst(Construct):
             )
         )
         self._ext_secret.node.add_dependency(self._alb)
-        # Add Cluster Autoscaler to EKS
+        # Add Cluster Autoscaler to EKS, or Karpenter to provision the Spark nodes directly
         _var_mapping = {
             "{{region_name}}": Aws.REGION, 
             "{{cluster_name}}": eks_cluster.cluster_name, 
         }
-        eks_cluster.add_helm_chart('ClusterAutoScaler',
-            chart='cluster-autoscaler',
-            repository='https://kubernetes.github.io/autoscaler',
-            release='nodescaler',
-            create_namespace=False,
-            namespace='kube-system',
-            values=load_yaml_replace_var_local(source_dir+'/app_resources/autoscaler-values.yaml',_var_mapping)
-        )
+        if karpenter:
+            KarpenterConst(self, 'Karpenter', eks_cluster, noderole)
+        else:
+            eks_cluster.add_helm_chart('ClusterAutoScaler',
+                chart='cluster-autoscaler',
+                repository='https://kubernetes.github.io/autoscaler',
+                release='nodescaler',
+                create_namespace=False,
+                namespace='kube-system',
+                values=load_yaml_replace_var_local(source_dir+'/app_resources/autoscaler-values.yaml',_var_mapping)
+            )
         # # Add container insight (CloudWatch Log) to EKS
         # KubernetesManifest(self,'ContainerInsight',
         #     cluster=eks_cluster, 
-        #     manifest=load_yaml_replace_var_remotely('https://raw.githubusercontent.com/aws-samples/amazon-cloudwatch-container-insights/latest/k8s-deployment-manifest-templates/deployment-mode/daemonset/container-insights-monitoring/quickstart/cwagent-fluentd-quickstart.yaml', 
+        #     manifest=load_yaml_replace_var_remotely(CONTAINER_INSIGHT_URL,
         #             fields=_var_mapping,
         #             multi_resource=True
         #     )
@@ -72,5 +84,5 @@ class EksBaseAppConst(Construct):
             release='spark-operator',
             version='1.1.27',
             create_namespace=True,
-            values=load_yaml_replace_var_local(source_dir+'/app_resources/spark-operator-values.yaml',fields={'':''})
+            values=load_yaml_local(source_dir+'/app_resources/spark-operator-values.yaml')
         )
\ No newline at end of file
@@ -1,7 +1,11 @@
+import os
+import sys
 from aws_cdk import (aws_eks as eks,aws_ec2 as ec2, RemovalPolicy)
 from aws_cdk.aws_iam import IRole
 from constructs import Construct
 from aws_cdk.lambda_layer_kubectl_v27 import KubectlV27Layer
+from lib.cdk_infra.node_fleet import load_fleet, expand_fleet, validate_fleet, LOCAL_NVME_LABEL
+from lib.cdk_infra.spark_sizing import load_sizes, sizing_workloads
 
 class EksConst(Construct):
 
@@ -9,8 +13,13 @@ class EksConst(Construct):
     def my_cluster(self):
         return self._my_cluster
 
-    def __init__(self, scope: Construct, id:str, eksname: str, eksvpc: ec2.IVpc, noderole: IRole, eks_adminrole: IRole, **kwargs) -> None:
+    @property
+    def node_groups(self):
+        return self._node_groups
+
+    def __init__(self, scope: Construct, id:str, eksname: str, eksvpc: ec2.IVpc, noderole: IRole, eks_adminrole: IRole, fleet_spec: str = None, karpenter: bool = False, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
 
         # 1.Create EKS cluster without node group
         self._my_cluster = eks.Cluster(self,'EKS',
@@ -24,53 +33,66 @@ class EksConst(Construct):
                 kubectl_layer=KubectlV27Layer(self, 'kubectlV27Layer')
         )
 
-        # 2.Add Managed NodeGroup to EKS, compute resource to run Spark jobs
-        self._my_cluster.add_nodegroup_capacity('onDemand-mn',
-            nodegroup_name = 'etl-ondemand',
-            node_role = noderole,
-            desired_size = 1,
-            max_size = 5,
-            disk_size = 50,
-            instance_types = [ec2.InstanceType('m7g.xlarge')],
-            labels = {'lifecycle':'OnDemand'},
-            # create one nodegroup per AZ, as cluster autoscaler has no control over what AZ ASG will launch instance in.
-            # if using Karpenter, this is not needed.
-            subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,one_per_az=True),
-            tags = {'Name':'OnDemand-'+eksname,'k8s.io/cluster-autoscaler/enabled': 'true', 'k8s.io/cluster-autoscaler/'+eksname: 'owned'}
-        )
-
-        # 3. Add Spot managed NodeGroup to EKS (Run Spark exectutor on spot)
-        self._my_cluster.add_nodegroup_capacity('spot-mn',
-            nodegroup_name = 'etl-spot',
-            node_role = noderole,
-            capacity_type=eks.CapacityType.SPOT,
-            desired_size = 1,
-            max_size = 30,
-            disk_size = 50,
-            instance_types=[ec2.InstanceType('r5.xlarge'),ec2.InstanceType('r4.xlarge'),ec2.InstanceType('r5a.xlarge')],
-            subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,one_per_az=True),
-            labels = {'lifecycle':'Ec2Spot'},
-            tags = {'Name':'Spot-'+eksname, 'k8s.io/cluster-autoscaler/enabled': 'true', 'k8s.io/cluster-autoscaler/'+eksname: 'owned'}
-        )
-        self._my_cluster.add_nodegroup_capacity('spot-arm64',
-            nodegroup_name = 'single-az-graviton',
-            node_role = noderole,
-            capacity_type=eks.CapacityType.SPOT,
-            desired_size = 1,
-            max_size = 30,
-            disk_size = 50,
-            instance_types = [ec2.InstanceType('r7g.xlarge'),ec2.InstanceType('r6g.xlarge'),ec2.InstanceType('r6gd.xlarge')],
-            # create one nodegroup per AZ, as cluster autoscaler has no control over what AZ ASG will launch instance in.
-            # if using Karpenter, this is not needed.
-            subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,availability_zones=sorted(eksvpc.availability_zones)[1:2]),
-            labels = {'nodegroup':'single-az-graviton', 'lifecycle':'Ec2Spot'},
-            tags = {'Name':'single-az-graviton','k8s.io/cluster-autoscaler/enabled': 'true', 'k8s.io/cluster-autoscaler/'+eksname: 'owned'}
-        )  
+        # 2.Add Managed NodeGroups to EKS, compute resource to run Spark jobs.
+        # The fleet is declared in app_resources/eks-nodegroups.yaml, on-demand for drivers and spot for executors.
+        # With Karpenter, the Spark pods run on its NodePools instead and only the on-demand group remains
+        default_fleet = '/app_resources/eks-nodegroups-karpenter.yaml' if karpenter else '/app_resources/eks-nodegroups.yaml'
+        fleet = expand_fleet(load_fleet(fleet_spec or source_dir+default_fleet), eksvpc.availability_zones)
+        # every Spark T-shirt size must fit the node groups
+        workloads = [] if karpenter else sizing_workloads(load_sizes(source_dir+'/app_resources/spark-sizing.yaml'))
+        problems = validate_fleet(fleet, workloads)
+        if problems:
+            print("Invalid EKS node group fleet:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        with open(source_dir+'/app_resources/local-nvme-setup.sh') as f:
+            nvme_setup = f.read()
+        self._node_groups = [self._add_nodegroup(ng, eksname, noderole, nvme_setup) for ng in fleet]
 
-        # # 4. Add Fargate NodeGroup to EKS, without setup cluster-autoscaler
+        # # 3. Add Fargate NodeGroup to EKS, without setup cluster-autoscaler
         # self._my_cluster.add_fargate_profile('FargateEnabled',
         #     selectors =[{
         #         "namespace": "spark"
         #     }],
         #     fargate_profile_name='sparkETL'
-        # )
\ No newline at end of file
+        # )
+
+    def _add_nodegroup(self, ng, eksname, noderole, nvme_setup):
+        labels, launch_template = ng.labels, None
+        if ng.local_nvme:
+            labels = {**ng.labels, LOCAL_NVME_LABEL: 'true'}
+            launch_template = self._local_nvme_template(ng, nvme_setup)
+
+        if ng.availability_zone:
+            # one nodegroup per AZ, as cluster autoscaler has no control over what AZ ASG will launch instance in.
+            # if using Karpenter, this is not needed.
+            subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,availability_zones=[ng.availability_zone])
+        else:
+            subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,one_per_az=True)
+
+        return self._my_cluster.add_nodegroup_capacity(ng.id,
+            nodegroup_name = ng.name,
+            node_role = noderole,
+            # on-demand is the EKS default, leave it unset to keep existing nodegroups unchanged
+            capacity_type = eks.CapacityType.SPOT if ng.capacity_type == 'SPOT' else None,
+            min_size = ng.min_size,
+            desired_size = ng.desired_size,
+            max_size = ng.max_size,
+            # with a launch template, the root volume is set in the template
+            disk_size = None if launch_template else ng.disk_size,
+            launch_template_spec = eks.LaunchTemplateSpec(id=launch_template.launch_template_id, version=launch_template.latest_version_number) if launch_template else None,
+            instance_types = [ec2.InstanceType(t) for t in ng.instance_types],
+            subnets = subnets,
+            labels = labels,
+            tags = {'Name':(ng.name_tag or ng.name).format(cluster=eksname),'k8s.io/cluster-autoscaler/enabled': 'true', 'k8s.io/cluster-autoscaler/'+eksname: 'owned'}
+        )
+
+    def _local_nvme_template(self, ng, nvme_setup):
+        # EKS merges its bootstrap script into MIME multi-part user data, so the disks are mounted before kubelet starts
+        setup = ec2.UserData.for_linux()
+        setup.add_commands(nvme_setup)
+        user_data = ec2.MultipartUserData()
+        user_data.add_user_data_part(setup, ec2.MultipartBody.SHELL_SCRIPT, True)
+        return ec2.LaunchTemplate(self, ng.id+'-lt',
+            user_data = user_data,
+            block_devices = [ec2.BlockDevice(device_name='/dev/xvda', volume=ec2.BlockDeviceVolume.ebs(ng.disk_size, volume_type=ec2.EbsDeviceVolumeType.GP3))]
+        )
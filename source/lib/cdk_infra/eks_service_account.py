@@ -8,7 +8,11 @@ import os
 
 class EksSAConst(Construct):
 
-    def __init__(self, scope: Construct, id:str, eks_cluster: ICluster, secret: ISecret, **kwargs,) -> None:
+    @property
+    def secrets_sa(self):
+        return self._secrets_sa
+
+    def __init__(self, scope: Construct, id:str, eks_cluster: ICluster, secret: ISecret, karpenter: bool = False, **kwargs,) -> None:
         super().__init__(scope, id, **kwargs)
 
         source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
@@ -17,14 +21,15 @@ class EksSAConst(Construct):
 # //***************************** SERVICE ACCOUNT, RBAC and IAM ROLES *******************************//
 # //****** Associating IAM role to K8s Service Account to provide fine-grain security control ******//
 # //***********************************************************************************************//
-        # Cluster Auto-scaler
-        self._scaler_sa = eks_cluster.add_service_account('AutoScalerSa', 
-            name='cluster-autoscaler', 
-            namespace='kube-system'
-        )  
-        _scaler_role = load_yaml_local(source_dir+'/app_resources/autoscaler-iam-role.yaml')
-        for statmt in _scaler_role:
-            self._scaler_sa.add_to_principal_policy(iam.PolicyStatement.from_json(statmt))
+        # Cluster Auto-scaler, Karpenter creates its own service account
+        if not karpenter:
+            self._scaler_sa = eks_cluster.add_service_account('AutoScalerSa', 
+                name='cluster-autoscaler', 
+                namespace='kube-system'
+            )  
+            _scaler_role = load_yaml_local(source_dir+'/app_resources/autoscaler-iam-role.yaml')
+            for statmt in _scaler_role:
+                self._scaler_sa.add_to_principal_policy(iam.PolicyStatement.from_json(statmt))
 
         # ALB Ingress
         self._alb_sa = eks_cluster.add_service_account('ALBServiceAcct', 
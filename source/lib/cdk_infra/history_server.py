@@ -0,0 +1,48 @@
+from aws_cdk import Aws, custom_resources as _custom_resources
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from lib.util.manifest_reader import load_yaml_replace_var_local
+import os
+
+# prefix of the code bucket the Spark jobs write their rolling event logs to
+EVENT_LOG_PREFIX = 'spark-events/'
+# event logs older than this are deleted by the History Server cleaner
+EVENT_LOG_RETENTION = '30d'
+
+class HistoryServerConst(Construct):
+    """Spark History Server of the event logs in the code bucket, with the ConfigMap the Spark templates read the log directory from."""
+
+    @property
+    def manifest(self):
+        return self._manifest
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, code_bucket: str, image: str, inbound_sg: str, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+        # Spark fails a job whose event log directory does not exist, S3A sees the directory from this marker
+        _log_dir = _custom_resources.AwsCustomResource(self, 'EventLogDir',
+            on_create=_custom_resources.AwsSdkCall(
+                service='S3',
+                action='putObject',
+                parameters={'Bucket': code_bucket, 'Key': EVENT_LOG_PREFIX, 'Body': ''},
+                physical_resource_id=_custom_resources.PhysicalResourceId.of(EVENT_LOG_PREFIX)
+            ),
+            policy=_custom_resources.AwsCustomResourcePolicy.from_sdk_calls(
+                resources=['arn:{}:s3:::{}/{}'.format(Aws.PARTITION, code_bucket, EVENT_LOG_PREFIX)]
+            ),
+            install_latest_aws_sdk=False
+        )
+        self._manifest = eks_cluster.add_manifest('SparkHistoryServer',
+            *load_yaml_replace_var_local(source_dir+'/app_resources/spark-history-server.yaml',
+                fields={
+                    '{{codeBucket}}': code_bucket,
+                    '{{image}}': image,
+                    '{{retention}}': EVENT_LOG_RETENTION,
+                    '{{INBOUND_SG}}': inbound_sg
+                },
+                multi_resource=True,
+                strict=True
+            )
+        )
+        self._manifest.node.add_dependency(_log_dir)
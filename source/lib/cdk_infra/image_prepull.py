@@ -0,0 +1,25 @@
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from lib.util.manifest_reader import load_yaml_replace_var_local
+import copy, os
+
+class ImagePrepullConst(Construct):
+    """DaemonSet pulling the Spark images on each new node, turn it off with: cdk deploy -c image_prepull=false"""
+
+    @property
+    def daemon_set(self):
+        return self._daemon_set
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, images: list, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+        _manifest = load_yaml_replace_var_local(source_dir+'/app_resources/image-prepuller.yaml',
+            fields={'{{name}}': 'image-0', '{{image}}': images[0]},
+            strict=True
+        )
+        # one container per image, all started from the same definition
+        _pod = _manifest['spec']['template']['spec']
+        _template = _pod['containers'][0]
+        _pod['containers'] = [dict(copy.deepcopy(_template), name='image-{}'.format(i), image=image) for i, image in enumerate(images)]
+        self._daemon_set = eks_cluster.add_manifest('ImagePrepuller', _manifest)
@@ -0,0 +1,87 @@
+from aws_cdk import (Aws, Duration, aws_iam as iam, aws_sqs as sqs, aws_events as events, aws_events_targets as targets)
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from lib.util.manifest_reader import *
+import os
+
+KARPENTER_VERSION = '1.0.6'
+
+class KarpenterConst(Construct):
+    """Karpenter controller with an on-demand NodePool for Spark drivers and a spot NodePool for executors.
+
+    Nodes launch straight from an EC2 Fleet call on pending pods, no node group or ASG in between.
+    """
+
+    @property
+    def node_pools(self):
+        return self._node_pools
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, noderole: iam.IRole, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+
+        # 1. Spot interruption, rebalance & scheduled maintenance events
+        queue = sqs.Queue(self, 'InterruptionQueue',
+            retention_period=Duration.minutes(5),
+            enforce_ssl=True
+        )
+        _events = {
+            'SpotInterruption': {'source': ['aws.ec2'], 'detail_type': ['EC2 Spot Instance Interruption Warning']},
+            'Rebalance': {'source': ['aws.ec2'], 'detail_type': ['EC2 Instance Rebalance Recommendation']},
+            'InstanceStateChange': {'source': ['aws.ec2'], 'detail_type': ['EC2 Instance State-change Notification']},
+            'ScheduledChange': {'source': ['aws.health'], 'detail_type': ['AWS Health Event']}
+        }
+        for name, pattern in _events.items():
+            events.Rule(self, name+'Rule',
+                event_pattern=events.EventPattern(**pattern),
+                targets=[targets.SqsQueue(queue)]
+            )
+
+        # 2. Controller service account, the node role is shared with the managed nodegroups so it's already in aws-auth
+        _sa = eks_cluster.add_service_account('KarpenterSa',
+            name='karpenter',
+            namespace='kube-system'
+        )
+        _karpenter_role = load_yaml_replace_var_local(source_dir+'/app_resources/karpenter-iam-role.yaml',
+            fields={
+                "{{region_name}}": Aws.REGION,
+                "{{node_role_arn}}": noderole.role_arn,
+                "{{cluster_arn}}": eks_cluster.cluster_arn,
+                "{{queue_arn}}": queue.queue_arn
+            }
+        )
+        for statmt in _karpenter_role:
+            _sa.add_to_principal_policy(iam.PolicyStatement.from_json(statmt))
+
+        # 3. Install the controller and CRDs
+        _chart = eks_cluster.add_helm_chart('KarpenterChart',
+            chart='karpenter',
+            repository='oci://public.ecr.aws/karpenter/karpenter',
+            release='karpenter',
+            version=KARPENTER_VERSION,
+            create_namespace=False,
+            namespace='kube-system',
+            values=load_yaml_replace_var_local(source_dir+'/app_resources/karpenter-values.yaml',
+                fields={
+                    "{{cluster_name}}": eks_cluster.cluster_name,
+                    "{{queue_name}}": queue.queue_name
+                }
+            )
+        )
+        _chart.node.add_dependency(_sa)
+
+        # 4. EC2NodeClass and NodePools
+        _node_pools = load_yaml_replace_var_local(source_dir+'/app_resources/karpenter-nodepools.yaml',
+            fields={
+                "{{cluster_name}}": eks_cluster.cluster_name,
+                "{{node_role_name}}": noderole.role_name,
+                "{{cluster_sg}}": eks_cluster.cluster_security_group_id
+            },
+            multi_resource=True
+        )
+        for doc in _node_pools:
+            if doc['kind'] == 'EC2NodeClass':
+                doc['spec']['subnetSelectorTerms'] = [{'id': subnet.subnet_id} for subnet in eks_cluster.vpc.private_subnets]
+        self._node_pools = eks_cluster.add_manifest('KarpenterNodePools', *_node_pools)
+        self._node_pools.node.add_dependency(_chart)
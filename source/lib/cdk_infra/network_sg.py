@@ -14,6 +14,9 @@ class NetworkSgConst(Construct):
     @property
     def alb_argo_sg(self):
         return self._alb_argo_sg
+    @property
+    def alb_history_sg(self):
+        return self._alb_history_sg
 
     def __init__(self,scope: Construct, id:str, eksname:str, codebucket: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
@@ -39,10 +42,13 @@ class NetworkSgConst(Construct):
             )
         self._alb_jhub_sg=ec2.SecurityGroup(self,'JupyterALBInboundSG', vpc=self._vpc,description='Security Group for Jupyter ALB')
         self._alb_argo_sg=ec2.SecurityGroup(self,'ArgoALBInboundSG', vpc=self._vpc,description='Security Group for Argo ALB')
+        self._alb_history_sg=ec2.SecurityGroup(self,'HistoryALBInboundSG', vpc=self._vpc,description='Security Group for Spark History Server ALB')
         self._alb_jhub_sg.add_ingress_rule(prefixlist_peer,ec2.Port.tcp(port=80))
         self._alb_argo_sg.add_ingress_rule(prefixlist_peer,ec2.Port.tcp(port=2746))
+        self._alb_history_sg.add_ingress_rule(prefixlist_peer,ec2.Port.tcp(port=18080))
         Tags.of(self._alb_jhub_sg).add('Name','SparkOnEKS-JhubSg')
         Tags.of(self._alb_argo_sg).add('Name','SparkOnEKS-ArgoSg')
+        Tags.of(self._alb_history_sg).add('Name','SparkOnEKS-HistorySg')
 
         # VPC endpoint security group
         self._vpc_endpoint_sg = ec2.SecurityGroup(self,'EndpointSg',vpc=self._vpc,description='Security Group for Endpoint')
@@ -0,0 +1,142 @@
+import math
+import re
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+from lib.util.manifest_reader import load_yaml_local
+
+# instance family -> (CPU architecture, GiB of memory per vCPU, GB of NVMe instance store per xlarge)
+INSTANCE_FAMILIES = {
+    'm5': ('amd64', 4, 0), 'm5d': ('amd64', 4, 150), 'm6i': ('amd64', 4, 0), 'm6id': ('amd64', 4, 237),
+    'm6g': ('arm64', 4, 0), 'm6gd': ('arm64', 4, 237), 'm7g': ('arm64', 4, 0), 'm7gd': ('arm64', 4, 237),
+    'r4': ('amd64', 7.625, 0), 'r5': ('amd64', 8, 0), 'r5a': ('amd64', 8, 0), 'r5d': ('amd64', 8, 150),
+    'r5ad': ('amd64', 8, 150), 'r6i': ('amd64', 8, 0), 'r6id': ('amd64', 8, 237),
+    'r6g': ('arm64', 8, 0), 'r6gd': ('arm64', 8, 237), 'r7g': ('arm64', 8, 0), 'r7gd': ('arm64', 8, 237),
+    'c5': ('amd64', 2, 0), 'c6i': ('amd64', 2, 0), 'c6g': ('arm64', 2, 0), 'c7g': ('arm64', 2, 0),
+}
+SIZE_VCPUS = {'large': 2, 'xlarge': 4, '2xlarge': 8, '4xlarge': 16, '8xlarge': 32, '12xlarge': 48, '16xlarge': 64}
+# node label and host path of the NVMe shuffle space, see app_resources/local-nvme-setup.sh
+LOCAL_NVME_LABEL = 'local-nvme'
+LOCAL_NVME_PATH = '/mnt/local-nvme'
+
+@dataclass
+class InstanceSpec:
+    name: str
+    arch: str
+    vcpus: int
+    memory_gib: float
+    nvme_gb: int
+
+    @property
+    def allocatable(self):
+        # rough EKS allocatable: kubelet/system reservations plus the aws-node & kube-proxy daemonsets
+        return (self.vcpus - 0.2, self.memory_gib * 0.92 - 1.0)
+
+def instance_spec(instance_type):
+    family, _, size = instance_type.partition('.')
+    if family not in INSTANCE_FAMILIES or size not in SIZE_VCPUS:
+        raise ValueError("Unknown instance type {}, add its family to INSTANCE_FAMILIES".format(instance_type))
+    arch, mem_per_vcpu, nvme = INSTANCE_FAMILIES[family]
+    vcpus = SIZE_VCPUS[size]
+    return InstanceSpec(instance_type, arch, vcpus, vcpus * mem_per_vcpu, nvme * vcpus // 4)
+
+@dataclass
+class NodeGroupSpec:
+    id: str
+    name: str
+    instance_types: List[str]
+    max_size: int
+    capacity_type: str = 'ON_DEMAND'
+    min_size: Optional[int] = None
+    desired_size: int = 1
+    disk_size: int = 50
+    placement: str = 'multiAz'
+    az_index: int = 0
+    arch: Optional[str] = None
+    local_nvme: bool = False
+    labels: Dict[str, str] = field(default_factory=dict)
+    name_tag: Optional[str] = None
+    # set on the node groups expanded from a single/per AZ placement
+    availability_zone: Optional[str] = None
+
+    @property
+    def instances(self):
+        return [instance_spec(t) for t in self.instance_types]
+
+    @property
+    def node_labels(self):
+        # labels the nodes of this group carry, as seen by a pod nodeSelector
+        labels = {**self.labels, 'kubernetes.io/arch': self.instances[0].arch}
+        if self.local_nvme:
+            labels[LOCAL_NVME_LABEL] = 'true'
+        return labels
+
+@dataclass
+class PodRequirement:
+    name: str
+    cpu: float
+    memory_gib: float
+    count: int = 1
+    node_selector: Dict[str, str] = field(default_factory=dict)
+
+def _snake_case(key):
+    return re.sub(r'(?<!^)([A-Z])', r'_\1', key).lower()
+
+def load_fleet(spec_file):
+    spec = load_yaml_local(spec_file)
+    defaults = spec.get('defaults', {})
+    return [NodeGroupSpec(**{_snake_case(k): v for k, v in {**defaults, **group}.items()}) for group in spec['nodeGroups']]
+
+def expand_fleet(groups, availability_zones):
+    """Expand arch pairs and per-AZ placements into one spec per managed node group."""
+    expanded = []
+    for group in groups:
+        variants = [group]
+        if group.arch == 'both':
+            variants = []
+            for arch in ('arm64', 'amd64'):
+                types = [t for t in group.instance_types if instance_spec(t).arch == arch]
+                if types:
+                    variants.append(replace(group, id=group.id + '-' + arch, name=group.name + '-' + arch, arch=arch, instance_types=types))
+
+        for variant in variants:
+            if variant.placement == 'perAz':
+                for i, az in enumerate(sorted(availability_zones)):
+                    expanded.append(replace(variant, id='{}-az{}'.format(variant.id, i), name='{}-az{}'.format(variant.name, i), availability_zone=az))
+            elif variant.placement == 'singleAz':
+                expanded.append(replace(variant, availability_zone=sorted(availability_zones)[variant.az_index]))
+            else:
+                expanded.append(variant)
+    return expanded
+
+def validate_fleet(groups, workloads=()):
+    """Return a list of problems with the fleet, empty when it is valid."""
+    problems = []
+    for g in groups:
+        try:
+            instances = g.instances
+        except ValueError as e:
+            problems.append('{}: {}'.format(g.name, e))
+            continue
+        if len({i.arch for i in instances}) > 1:
+            problems.append('{}: mixes arm64 and amd64 instance types, use arch: both to split them'.format(g.name))
+        if g.local_nvme and any(i.nvme_gb == 0 for i in instances):
+            problems.append('{}: localNvme needs instance types with NVMe instance store'.format(g.name))
+        if not (g.min_size if g.min_size is not None else 1) <= g.desired_size <= g.max_size:
+            problems.append('{}: sizes must satisfy minSize <= desiredSize <= maxSize'.format(g.name))
+
+    valid = [g for g in groups if not any(p.startswith(g.name + ':') for p in problems)]
+    for pod in workloads:
+        # any instance type of a group can be launched, so the smallest one decides
+        capacity = 0
+        for g in valid:
+            if any(g.node_labels.get(k) != v for k, v in pod.node_selector.items()):
+                continue
+            cpu, mem = min((i.allocatable for i in g.instances), key=lambda a: (a[1], a[0]))
+            if cpu >= pod.cpu and mem >= pod.memory_gib:
+                capacity += g.max_size * min(math.floor(cpu / pod.cpu), math.floor(mem / pod.memory_gib))
+        if capacity == 0:
+            problems.append('{}: no node group fits a pod of {} vCPU / {:.1f} GiB{}'.format(pod.name, pod.cpu, pod.memory_gib,
+                ' on ' + ','.join('{}={}'.format(k, v) for k, v in pod.node_selector.items()) if pod.node_selector else ''))
+        elif capacity < pod.count:
+            problems.append('{}: node groups fit {} of {} pods at max size'.format(pod.name, capacity, pod.count))
+    return problems
@@ -0,0 +1,66 @@
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from lib.util.manifest_reader import load_yaml_local, load_yaml_replace_var_local
+import copy, glob, json, os, sys
+
+# Prometheus, Pushgateway and Grafana in the monitoring namespace, off by default. Turn it on with
+# cdk deploy -c observability=true, or override any of these: -c observability='{"retention": "30d"}'
+DEFAULT_SETTINGS = {
+    # how long Prometheus keeps the job time series, it is a stand-in without a persistent volume
+    'retention': '15d',
+    'scrapeInterval': '15s'
+}
+
+def observability_settings(context):
+    """DEFAULT_SETTINGS updated with the context value, None when the observability stack is not enabled."""
+    if context is None or str(context).lower() == 'false':
+        return None
+    if str(context).lower() == 'true':
+        context = {}
+    if isinstance(context, str):
+        context = json.loads(context)
+    unknown = set(context) - set(DEFAULT_SETTINGS)
+    if unknown:
+        print('Unknown observability settings: ' + ', '.join(sorted(unknown)))
+        sys.exit(1)
+    return {**DEFAULT_SETTINGS, **context}
+
+class ObservabilityConst(Construct):
+    """Prometheus scraping the Spark jobs, Argo and the Spark operator, and Grafana with the Spark ETL dashboards."""
+
+    @property
+    def prometheus(self):
+        return self._prometheus
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, settings: dict, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+        self._prometheus = eks_cluster.add_helm_chart('PrometheusChart',
+            chart='prometheus',
+            repository='https://prometheus-community.github.io/helm-charts',
+            release='prometheus',
+            version='25.8.0',
+            namespace='monitoring',
+            create_namespace=True,
+            values=load_yaml_replace_var_local(source_dir+'/app_resources/prometheus-values.yaml',
+                fields={'{{' + k + '}}': str(v) for k, v in settings.items()},
+                strict=True)
+        )
+        # every dashboard json of app_resources/grafana-dashboards, in the spark-etl provider
+        _values = copy.deepcopy(load_yaml_local(source_dir+'/app_resources/grafana-values.yaml'))
+        _dashboards = {}
+        for _file in sorted(glob.glob(source_dir+'/app_resources/grafana-dashboards/*.json')):
+            with open(_file) as f:
+                _dashboards[os.path.splitext(os.path.basename(_file))[0]] = {'json': f.read()}
+        _values['dashboards'] = {'spark-etl': _dashboards}
+        grafana = eks_cluster.add_helm_chart('GrafanaChart',
+            chart='grafana',
+            repository='https://grafana.github.io/helm-charts',
+            release='grafana',
+            version='7.0.19',
+            namespace='monitoring',
+            create_namespace=False,
+            values=_values
+        )
+        grafana.node.add_dependency(self._prometheus)
@@ -1,6 +1,9 @@
-from aws_cdk import (RemovalPolicy, aws_s3 as s3, aws_s3_deployment as s3deploy, aws_kms as kms)
+from aws_cdk import (RemovalPolicy, Duration, Size, CustomResource, aws_s3 as s3, aws_s3_assets as s3_assets, aws_lambda as _lambda, aws_kms as kms)
+from aws_cdk import custom_resources as _custom_resources
 from constructs import Construct
-import os
+from lib.util.schema_compiler import is_current, compiled_path, TYPED_SCHEMAS
+from lib.app_code_publisher.publisher import ecr_source_zip_is_current, EXCLUDED_DIRS
+import os, sys
 
 class S3AppCodeConst(Construct):
 
@@ -30,10 +33,46 @@ class S3AppCodeConst(Construct):
         )
 
         proj_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]
-        self.deploy=s3deploy.BucketDeployment(self, "DeployCode",
-            sources=[s3deploy.Source.asset(proj_dir+'/deployment/app_code')],
-            destination_bucket= self.artifact_bucket,
-            destination_key_prefix="app_code"
+        # the typing SQL and the image build source zip are generated by build-s3-dist.sh and checked by
+        # run-all-tests.sh, synth only reads them
+        stale = [s for s in TYPED_SCHEMAS if not is_current(proj_dir+'/deployment/app_code', s)]
+        if stale:
+            print('{} out of date, run: cd source && python -m lib.util.schema_compiler'.format(
+                ', '.join(compiled_path(proj_dir+'/deployment/app_code', s) for s in stale)))
+            sys.exit(1)
+        if not ecr_source_zip_is_current(proj_dir+'/source/lib/ecr_build', proj_dir+'/deployment/app_code/ecr_build_src.zip'):
+            print('deployment/app_code/ecr_build_src.zip out of date, run: cd source && python -m lib.app_code_publisher.publisher --ecr-zip')
+            sys.exit(1)
+
+        # publish only the files whose sha256 changed, see lib/app_code_publisher/publisher.py.
+        # The asset hash changes with any file, which triggers an update of the custom resource
+        _asset = s3_assets.Asset(self, 'AppCodeAsset',
+            path=proj_dir+'/deployment/app_code',
+            exclude=['**/{}'.format(d) for d in EXCLUDED_DIRS] + ['**/*.pyc']
+        )
+        _publisher = _lambda.Function(self, 'AppCodePublisher',
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler='lambda_function.handler',
+            code=_lambda.Code.from_asset(proj_dir+'/source/lib/app_code_publisher', exclude=['__pycache__']),
+            description='Publish the changed files of app_code to the code bucket',
+            memory_size=1024,
+            ephemeral_storage_size=Size.gibibytes(2),
+            timeout=Duration.minutes(10)
+        )
+        _asset.grant_read(_publisher)
+        self.artifact_bucket.grant_read_write(_publisher, 'app_code/*')
+        self.artifact_bucket.grant_delete(_publisher, 'app_code/*')
+        _provider = _custom_resources.Provider(self, 'AppCodeProvider', on_event_handler=_publisher)
+        self.deploy = CustomResource(self, 'DeployCode',
+            service_token=_provider.service_token,
+            resource_type='Custom::AppCodePublish',
+            properties={
+                'SourceBucket': _asset.s3_bucket_name,
+                'SourceKey': _asset.s3_object_key,
+                'AssetHash': _asset.asset_hash,
+                'DestinationBucket': self.artifact_bucket.bucket_name,
+                'DestinationPrefix': 'app_code'
+            }
         )
         self.bucket_name = self.artifact_bucket.bucket_name
 
@@ -1,7 +1,8 @@
 from aws_cdk import (aws_iam as iam)
 from constructs import Construct
 from aws_cdk.aws_eks import ICluster, KubernetesManifest
-from lib.util.manifest_reader import load_yaml_replace_var_local
+from lib.util.manifest_reader import load_yaml_replace_var_local, iter_yaml_local
+from lib.util.chunked_manifest import add_chunked_manifest
 # import lib.util.override_rule as scan
 import os
 
@@ -52,15 +53,14 @@ class SparkOnEksSAConst(Construct):
         )
         self._etl_sa.node.add_dependency(etl_ns)
 
-        _etl_rb = KubernetesManifest(self,'ETLRoleBinding',
-            cluster=eks_cluster,
-            manifest=load_yaml_replace_var_local(source_dir+'/app_resources/etl-rbac.yaml', 
+        _etl_rb = add_chunked_manifest(self,'ETLRoleBinding',
+            eks_cluster,
+            iter_yaml_local(source_dir+'/app_resources/etl-rbac.yaml', 
             fields= {
                 "{{MY_SA}}": self._etl_sa.service_account_name
-            }, 
-            multi_resource=True)
+            })
         )
-        _etl_rb.node.add_dependency(self._etl_sa)
+        _etl_rb[0].node.add_dependency(self._etl_sa)
 
         self._jupyter_sa = eks_cluster.add_service_account('jhubServiceAcct', 
             # name=login_name,
@@ -0,0 +1,246 @@
+"""Render the Spark WorkflowTemplate from the T-shirt sizes in app_resources/spark-sizing.yaml.
+
+    python -m lib.cdk_infra.spark_sizing           # regenerate app_resources/spark-template.yaml
+    python -m lib.cdk_infra.spark_sizing --check   # fail when spark-template.yaml is out of date
+"""
+import argparse
+import os.path as path
+import sys
+import yaml
+from dataclasses import dataclass, field
+from typing import Dict
+from lib.util.manifest_reader import load_yaml_local, SafeDumper
+from lib.util.placeholder import substitute
+from lib.util.image_pin import is_pinned
+from lib.cdk_infra.node_fleet import PodRequirement, load_fleet, expand_fleet, validate_fleet, _snake_case
+
+MIN_MEMORY_OVERHEAD_MB = 384
+LOCAL_POD_PATCH = """containers:
+  - name: main
+    resources:
+      requests:
+        cpu: "{{inputs.parameters.executorCores}}"
+        memory: "{{inputs.parameters.executorMemory}}Gi"
+"""
+
+@dataclass
+class SizeSpec:
+    name: str
+    executor_instances: int
+    executor_cores: int
+    executor_memory: int
+    mode: str = 'cluster'
+    driver_cores: float = 1
+    driver_memory: float = 1
+    image: str = 'ghcr.io/tripl-ai/arc:arc_4.2.0_spark_3.3.4_scala_2.12_hadoop_3.3.2_4.2.1_slim'
+    pull_policy: str = 'Always'
+    memory_overhead_percent: int = 10
+    partitions_per_core: int = 4
+    node_selector: Dict[str, str] = field(default_factory=dict)
+    executor_node_selector: Dict[str, str] = field(default_factory=dict)
+
+    def overhead_mb(self, memory_mb):
+        # same rule as spark.{driver,executor}.memoryOverhead: a share of the heap, at least 384MiB
+        return max(MIN_MEMORY_OVERHEAD_MB, memory_mb * self.memory_overhead_percent // 100)
+
+    @property
+    def driver_memory_mb(self):
+        return int(self.driver_memory * 1024)
+
+    @property
+    def driver_limit_mb(self):
+        return self.driver_memory_mb + self.overhead_mb(self.driver_memory_mb)
+
+    @property
+    def executor_pod_mb(self):
+        return self.executor_memory * 1024 + self.overhead_mb(self.executor_memory * 1024)
+
+    @property
+    def shuffle_partitions(self):
+        return self.executor_instances * self.executor_cores * self.partitions_per_core
+
+    def workloads(self):
+        """Driver and executor pods of this size, to check against the node groups."""
+        if self.mode == 'local':
+            return [PodRequirement(self.name + '-driver', self.executor_cores, self.executor_memory, 1, self.node_selector)]
+        return [
+            PodRequirement(self.name + '-driver', self.driver_cores, self.driver_limit_mb / 1024, 1, self.node_selector),
+            PodRequirement(self.name + '-executor', self.executor_cores, self.executor_pod_mb / 1024, self.executor_instances, self.executor_node_selector)
+        ]
+
+def load_sizes(sizing_file):
+    spec = load_yaml_local(sizing_file)
+    defaults = spec.get('defaults', {})
+    return [SizeSpec(**{_snake_case(k): v for k, v in {**defaults, **size}.items()}) for size in spec['sizes']]
+
+def sizing_workloads(sizes):
+    return [pod for size in sizes for pod in size.workloads()]
+
+def image_problems(sizes):
+    # a node keeps the first image pulled for a tag, even a versioned tag can be pushed again,
+    # so nodes could run different builds: IfNotPresent needs an image pinned by digest
+    return ['{} ({}) is not pinned by digest, run: python -m lib.util.image_pin, or pull it Always'.format(
+        image, ', '.join(size.name for size in sizes if size.image == image and size.pull_policy != 'Always'))
+        for image in sizing_images(sizes)
+        if not is_pinned(image) and any(size.image == image and size.pull_policy != 'Always' for size in sizes)]
+
+def sizing_images(sizes):
+    """Distinct images of the sizes, in sizing order."""
+    return list(dict.fromkeys(size.image for size in sizes))
+
+def _quantity(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+def _parameters(size):
+    params = [
+        {'name': 'jobId'},
+        {'name': 'configUri'},
+        {'name': 'image', 'value': size.image},
+        {'name': 'pullPolicy', 'value': size.pull_policy},
+        {'name': 'executorInstances', 'value': str(size.executor_instances)},
+        {'name': 'executorCores', 'value': str(size.executor_cores)},
+        {'name': 'executorMemory', 'value': str(size.executor_memory)},
+        {'name': 'sparkConf', 'value': ''}
+    ]
+    if size.mode == 'cluster':
+        # executor shuffle & spill space: tmpfs (memory backed) or nvme (instance store of the local-nvme nodes)
+        params.append({'name': 'shuffleStorage', 'value': 'tmpfs'})
+        # arc, dag (experimental): run the independent notebook stages concurrently with app_code/job/arc_dag.py,
+        # or pool: run the notebook in the arc-warm-pool driver (cdk deploy -c warm_pool=true)
+        params.append({'name': 'runner', 'value': 'arc'})
+    params += [
+        {'name': 'tags', 'value': ''},
+        {'name': 'parameters', 'value': ''},
+        # to exec each stages at a jupyter notebook, we can control it by matching the environment
+        {'name': 'environment', 'value': 'test'}
+    ]
+    return params
+
+def _event_log_env():
+    # event log directory of the Spark History Server, no event log when the ConfigMap is missing
+    return [{'name': 'SPARK_EVENT_LOG_DIR',
+        'valueFrom': {'configMapKeyRef': {'name': 'spark-event-log', 'key': 'eventLogDir', 'optional': True}}}]
+
+def _warm_pool_env():
+    # bearer token of the arc-warm-pool service for runner=pool, unset when the warm pool is not deployed
+    return [{'name': 'ARC_POOL_TOKEN',
+        'valueFrom': {'secretKeyRef': {'name': 'arc-warm-pool-token', 'key': 'token', 'optional': True}}}]
+
+def _metrics(size):
+    # emitted by the Argo controller when the step ends, scraped from its metrics port (argo-values.yaml)
+    return {'prometheus': [{
+        'name': 'arc_job_duration_seconds',
+        'help': 'Duration of the Spark template step',
+        'labels': [
+            {'key': 'size', 'value': size.name},
+            {'key': 'jobId', 'value': '{{inputs.parameters.jobId}}'},
+            # no workflowId, a label per run would never end a series
+            {'key': 'status', 'value': '{{status}}'}
+        ],
+        'gauge': {'value': '{{duration}}'}
+    }]}
+
+def render_size(size, scripts):
+    tmpl = {
+        'name': size.name,
+        'retryStrategy': {'limit': 3, 'retryPolicy': 'Always'},
+        'inputs': {'parameters': _parameters(size)},
+        'metadata': {
+            'labels': {'app': 'spark', 'workflowId': '{{workflow.uid}}'},
+            # the driver runs in the step pod, its PrometheusServlet sink is on the Spark UI port
+            'annotations': {'prometheus.io/scrape': 'true', 'prometheus.io/port': '4040', 'prometheus.io/path': '/metrics/prometheus'}
+        },
+        'metrics': _metrics(size)
+    }
+    if size.node_selector:
+        tmpl['nodeSelector'] = dict(size.node_selector)
+    # substituted first, the fields of the submit script are not applied again to its value
+    metrics = substitute(scripts['metrics'], {'{{size}}': size.name}, strict=True, source=size.name)
+
+    if size.mode == 'local':
+        tmpl['podSpecPatch'] = LOCAL_POD_PATCH
+        source = substitute(scripts['local'], {'{{arc_metrics}}': metrics, '{{size}}': size.name}, strict=True, source=size.name)
+        tmpl['script'] = {'image': '{{inputs.parameters.image}}', 'imagePullPolicy': '{{inputs.parameters.pullPolicy}}',
+            'env': _event_log_env(), 'command': ['/bin/sh'], 'source': source}
+        return tmpl
+
+    source = substitute(scripts['cluster'], {
+        '{{driver_cores}}': _quantity(size.driver_cores),
+        '{{driver_memory_mb}}': str(size.driver_memory_mb),
+        '{{memory_overhead_percent}}': str(size.memory_overhead_percent),
+        '{{partitions_per_core}}': str(size.partitions_per_core),
+        '{{arc_metrics}}': metrics,
+        '{{size}}': size.name,
+        '{{executor_node_selector}}': ''.join('--conf spark.kubernetes.executor.node.selector.{}={} \\\n'.format(k, v)
+            for k, v in sorted(size.executor_node_selector.items()))
+    }, strict=True, source=size.name)
+    # the driver runs in this container (client mode), requests = limits for a guaranteed QoS
+    limits = {'cpu': _quantity(size.driver_cores), 'memory': '{}Mi'.format(size.driver_limit_mb)}
+    tmpl['script'] = {
+        'resources': {'requests': dict(limits), 'limits': limits},
+        'image': '{{inputs.parameters.image}}',
+        'imagePullPolicy': '{{inputs.parameters.pullPolicy}}',
+        'env': _event_log_env() + _warm_pool_env(),
+        'command': ['/bin/sh'],
+        'source': source
+    }
+    return tmpl
+
+def render_spark_template(sizes, source_dir):
+    """The spark-template WorkflowTemplate with one template per size."""
+    scripts = {}
+    for mode in ('cluster', 'local'):
+        with open(source_dir + '/app_resources/spark-submit-{}.sh'.format(mode)) as f:
+            scripts[mode] = f.read()
+    # push_stage_metrics, shared by both scripts
+    with open(source_dir + '/app_resources/arc-metrics.sh') as f:
+        scripts['metrics'] = f.read().rstrip('\n')
+    return {
+        'apiVersion': 'argoproj.io/v1alpha1',
+        'kind': 'WorkflowTemplate',
+        'metadata': {'name': 'spark-template', 'namespace': 'spark'},
+        'spec': {'templates': [render_size(size, scripts) for size in sizes]}
+    }
+
+class _TemplateDumper(SafeDumper):
+    pass
+
+def _represent_str(dumper, data):
+    # keep the scripts readable as block literals
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|' if '\n' in data else None)
+
+_TemplateDumper.add_representer(str, _represent_str)
+
+def dump_spark_template(template):
+    return ('# Generated from spark-sizing.yaml by: python -m lib.cdk_infra.spark_sizing, do not edit.\n'
+        + yaml.dump(template, Dumper=_TemplateDumper, sort_keys=False, default_flow_style=False, width=1000))
+
+def main():
+    source_dir = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizing', default=source_dir + '/app_resources/spark-sizing.yaml')
+    parser.add_argument('--fleet', default=source_dir + '/app_resources/eks-nodegroups.yaml')
+    parser.add_argument('--output', default=source_dir + '/app_resources/spark-template.yaml')
+    parser.add_argument('--check', action='store_true', help='exit 1 when the output file is out of date')
+    args = parser.parse_args()
+
+    sizes = load_sizes(args.sizing)
+    fleet = expand_fleet(load_fleet(args.fleet), ['az-a', 'az-b'])
+    problems = validate_fleet(fleet, sizing_workloads(sizes)) + image_problems(sizes)
+    for p in problems:
+        print(p)
+    rendered = dump_spark_template(render_spark_template(sizes, source_dir))
+
+    if args.check:
+        with open(args.output) as f:
+            current = f.read()
+        if current != rendered:
+            print('{} is out of date, run: python -m lib.cdk_infra.spark_sizing'.format(args.output))
+            sys.exit(1)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(rendered)
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
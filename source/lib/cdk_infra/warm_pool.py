@@ -0,0 +1,64 @@
+from aws_cdk import Aws, RemovalPolicy, aws_secretsmanager as secmger
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster
+from aws_cdk.aws_iam import IGrantable
+from lib.util.manifest_reader import load_yaml_replace_var_local
+import json, os, sys
+
+# the arc-warm-pool driver is off by default, as it keeps a pod running. Turn it on with
+# cdk deploy -c warm_pool=true, or override any of these: -c warm_pool='{"maxExecutors": 16}'
+DEFAULT_SETTINGS = {
+    # jobs running at once in the shared driver
+    'maxJobs': 4,
+    'maxExecutors': 8,
+    # seconds an executor stays up without work
+    'idleTimeout': 300,
+    'executorCores': 2,
+    'executorMemory': 4,
+    'driverMemoryMb': 3072
+}
+
+def warm_pool_settings(context):
+    """DEFAULT_SETTINGS updated with the context value, None when the warm pool is not enabled."""
+    if context is None or str(context).lower() == 'false':
+        return None
+    if str(context).lower() == 'true':
+        context = {}
+    if isinstance(context, str):
+        context = json.loads(context)
+    unknown = set(context) - set(DEFAULT_SETTINGS)
+    if unknown:
+        print('Unknown warm_pool settings: ' + ', '.join(sorted(unknown)))
+        sys.exit(1)
+    return {**DEFAULT_SETTINGS, **context}
+
+class WarmPoolConst(Construct):
+    """Long running Spark driver and service the spark-template steps with runner=pool submit to."""
+
+    @property
+    def manifest(self):
+        return self._manifest
+
+    def __init__(self, scope: Construct, id: str, eks_cluster: ICluster, code_bucket: str, image: str, settings: dict,
+        secrets_reader: IGrantable, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        source_dir=os.path.split(os.environ['VIRTUAL_ENV'])[0]+'/source'
+        # bearer token of POST /jobs, synced to the arc-warm-pool-token Secret by the external secrets controller
+        _token = secmger.Secret(self, 'PoolToken',
+            generate_secret_string=secmger.SecretStringGenerator(exclude_punctuation=True, password_length=48),
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        _token.grant_read(secrets_reader)
+        _fields = {'{{' + k + '}}': str(v) for k, v in settings.items()}
+        _fields.update({
+            # JVM heap plus the default 10% (min 384MB) overhead
+            '{{driverPodMemoryMb}}': str(settings['driverMemoryMb'] + max(384, settings['driverMemoryMb'] // 10)),
+            '{{codeBucket}}': code_bucket,
+            '{{image}}': image,
+            '{{tokenSecret}}': _token.secret_arn,
+            '{{REGION}}': Aws.REGION
+        })
+        self._manifest = eks_cluster.add_manifest('ArcWarmPool',
+            *load_yaml_replace_var_local(source_dir+'/app_resources/arc-warm-pool.yaml', fields=_fields, multi_resource=True, strict=True)
+        )
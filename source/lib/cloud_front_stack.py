@@ -18,7 +18,11 @@ class NestedStack(NestedStack):
     def argo_cf(self):
         return self._argo_cf
 
-    def __init__(self,scope: Construct, id: str,logbucket: str,argo_alb_dns_name: str, jhub_alb_dns_name: str, **kwargs) -> None:
+    @property
+    def history_cf(self):
+        return self._history_cf
+
+    def __init__(self,scope: Construct, id: str,logbucket: str,argo_alb_dns_name: str, jhub_alb_dns_name: str, history_alb_dns_name: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
 # //**********************************************************************************************************//
@@ -29,6 +33,7 @@ class NestedStack(NestedStack):
         self._bucket=s3.Bucket.from_bucket_name(self,'cf_logbucket', logbucket)
         self._jhub_cf = add_distribution(self, 'jhub_dist', jhub_alb_dns_name, 80, self._bucket)
         self._argo_cf = add_distribution(self, 'argo_dist', argo_alb_dns_name, 2746, self._bucket)
+        self._history_cf = add_distribution(self, 'history_dist', history_alb_dns_name, 18080, self._bucket)
 
 def add_distribution(scope: Construct, id: str, alb_dns_name: str, port: int, logbucket: s3.IBucket
 ) -> cf.IDistribution:
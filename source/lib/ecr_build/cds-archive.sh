@@ -0,0 +1,38 @@
+#!/bin/sh
+# Build the JVM class data sharing archive of the image: the classes a short Arc job loads
+# (Spark, Hadoop, Delta, Arc) are dumped once at build time, so each driver and executor JVM
+# maps them from /opt/spark/cds/spark.jsa instead of loading and verifying them at startup.
+# spark-submit-*.sh pass -XX:SharedArchiveFile when the archive exists, with -Xshare:auto
+# a JVM that cannot use it (eg. another classpath) starts as before.
+set -ex
+
+ARCHIVE=/opt/spark/cds/spark.jsa
+mkdir -p $(dirname $ARCHIVE)
+JAVA_MAJOR=$(java -version 2>&1 | sed -n 's/.*version "\(1\.\)\{0,1\}\([0-9]*\).*/\2/p' | head -1)
+
+# Java 13+ writes the archive at exit of the training run, before that it takes a class list
+if [ "$JAVA_MAJOR" -ge 13 ]; then
+  TRAINING_OPTS="-XX:ArchiveClassesAtExit=$ARCHIVE"
+else
+  TRAINING_OPTS="-XX:DumpLoadedClassList=/tmp/cds-classes.lst"
+fi
+
+/opt/spark/bin/spark-submit \
+--master local[1] \
+--class ai.tripl.arc.ARC \
+--conf spark.ui.enabled=false \
+--conf spark.driver.extraJavaOptions="-XX:+UseG1GC $TRAINING_OPTS" \
+local:///opt/spark/jars/arc.jar \
+--etl.config.uri=file://$(pwd)/cds-training.ipynb \
+--etl.config.job.id=cds-training \
+--etl.config.environment=test \
+--etl.config.ignoreEnvironments=false
+
+if [ "$JAVA_MAJOR" -lt 13 ]; then
+  # same classpath as the Spark launcher, the archive is only used when it matches
+  java -XX:+UseG1GC -Xshare:dump -XX:SharedClassListFile=/tmp/cds-classes.lst -XX:SharedArchiveFile=$ARCHIVE \
+    -cp "/opt/spark/conf/:/opt/spark/jars/*"
+  rm -f /tmp/cds-classes.lst
+fi
+rm -rf /tmp/cds-training
+ls -l $ARCHIVE
@@ -29,9 +29,30 @@ class DockerPipelineConstruct(Construct):
     def image_uri(self):
         return self.ecr_repo.repository_uri
 
+    def _build_project(self, id: str, name: str, build_image: codebuild.IBuildImage, build_spec: str, variables: dict) -> codebuild.PipelineProject:
+        project = codebuild.PipelineProject(self, id,
+            project_name=name,
+            build_spec=codebuild.BuildSpec.from_source_filename(build_spec),
+            environment=dict(
+                build_image=build_image,
+                privileged=True
+            ),
+            environment_variables={
+                'REPO_ECR': codebuild.BuildEnvironmentVariable(value=self.ecr_repo.repository_uri),
+                **{k: codebuild.BuildEnvironmentVariable(value=v) for k, v in variables.items()}
+            },
+            description='Pipeline for docker build',
+            timeout=Duration.minutes(60)
+        )
+        project.apply_removal_policy(RemovalPolicy.DESTROY)
+        self._codebucket.grant_read_write(project)
+        self.ecr_repo.grant_pull_push(project)
+        return project
+
     def __init__(self,scope: Construct, id: str, codebucket: s3.IBucket, **kwargs,) -> None:
         super().__init__(scope, id, **kwargs)
-        
+        self._codebucket = codebucket
+
         # 1. Create ECR repositories
         self.ecr_repo=ecr.Repository(self,'ECRRepo',
             image_scan_on_push=True,
@@ -42,25 +63,19 @@ class DockerPipelineConstruct(Construct):
             pipeline_name='BuildArcDockerImage',
             artifact_bucket=codebucket
         )
-        image_builder = codebuild.PipelineProject(self,'DockerBuild',
-            project_name='BuildArcDockerImage',
-            build_spec=codebuild.BuildSpec.from_source_filename('buildspec.yaml'),
-            environment=dict(
-                build_image=codebuild.LinuxBuildImage.AMAZON_LINUX_2_3,
-                privileged=True
-            ),
-            environment_variables={
-                'REPO_ECR': codebuild.BuildEnvironmentVariable(value=self.ecr_repo.repository_uri),
-            },
-            description='Pipeline for docker build',
-            timeout=Duration.minutes(60)
-        )
-        image_builder.apply_removal_policy(RemovalPolicy.DESTROY)
+        # one native build per CPU architecture, in parallel, then a multi-arch manifest of both. Graviton
+        # and x86 nodes run the same image tag, each build caches its layers in the ECR repository.
+        image_builders = {
+            'amd64': self._build_project('DockerBuild', 'BuildArcDockerImage',
+                codebuild.LinuxBuildImage.AMAZON_LINUX_2_4, 'buildspec.yaml', {'ARCH': 'amd64'}),
+            'arm64': self._build_project('DockerBuildArm64', 'BuildArcDockerImageArm64',
+                codebuild.LinuxArmBuildImage.AMAZON_LINUX_2_STANDARD_3_0, 'buildspec.yaml', {'ARCH': 'arm64'})
+        }
+        manifest_builder = self._build_project('DockerManifest', 'MergeArcDockerImage',
+            codebuild.LinuxBuildImage.AMAZON_LINUX_2_4, 'buildspec-manifest.yaml', {})
 
         # 3. grant permissions for the CI/CD
         codebucket.grant_read_write(pipeline.role)
-        codebucket.grant_read_write(image_builder)  
-        self.ecr_repo.grant_pull_push(image_builder)
 
         source_output=codepipeline.Artifact('src')
         pipeline.add_stage(
@@ -78,9 +93,17 @@ class DockerPipelineConstruct(Construct):
             stage_name='Build',
             actions=[
                 codepipeline_actions.CodeBuildAction(
-                    action_name='DockerImageBuild',
+                    action_name='DockerImageBuild' + ('' if arch == 'amd64' else 'Arm64'),
+                    input=source_output,
+                    project=project,
+                    run_order=1
+                ) for arch, project in image_builders.items()
+            ] + [
+                codepipeline_actions.CodeBuildAction(
+                    action_name='DockerManifest',
                     input=source_output,
-                    project=image_builder
+                    project=manifest_builder,
+                    run_order=2
                 )
             ]
         )
@@ -10,6 +10,13 @@ from lib.cdk_infra.spark_permission import SparkOnEksSAConst
 from lib.ecr_build.ecr_build_pipeline import DockerPipelineConstruct
 from lib.cloud_front_stack import NestedStack
 from lib.util.manifest_reader import *
+from lib.util.chunked_manifest import add_chunked_manifest
+from lib.cdk_infra.spark_sizing import load_sizes, render_spark_template, sizing_images
+from lib.cdk_infra.image_prepull import ImagePrepullConst
+from lib.cdk_infra.delta_maintenance import DeltaMaintenanceConst, maintenance_settings
+from lib.cdk_infra.warm_pool import WarmPoolConst, warm_pool_settings
+from lib.cdk_infra.observability import ObservabilityConst, observability_settings
+from lib.cdk_infra.history_server import HistoryServerConst
 # from lib.util import override_rule as scan
 # from lib.solution_helper import solution_metrics
 import json, os
@@ -28,6 +35,10 @@ class SparkOnEksStack(Stack):
     def jhub_url(self):
         return self._jhub_alb.value 
 
+    @property
+    def history_url(self):
+        return self._history_alb.value
+
     def __init__(self, scope: Construct, id: str, eksname: str, solution_id: str, version: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
@@ -68,9 +79,11 @@ class SparkOnEksStack(Stack):
         # 3. EKS base infrastructure
         network_sg = NetworkSgConst(self,'network-sg', eksname, self.app_s3.code_bucket)
         iam = IamConst(self,'iam_roles', eksname)
-        eks_cluster = EksConst(self,'eks_cluster', eksname, network_sg.vpc, iam.managed_node_role, iam.admin_role)
-        EksSAConst(self, 'eks_sa', eks_cluster.my_cluster, jhub_secret)
-        base_app=EksBaseAppConst(self, 'eks_base_app', eks_cluster.my_cluster)
+        # opt-in Karpenter instead of Cluster Autoscaler: cdk deploy -c karpenter=true
+        karpenter = str(self.node.try_get_context('karpenter')).lower() == 'true'
+        eks_cluster = EksConst(self,'eks_cluster', eksname, network_sg.vpc, iam.managed_node_role, iam.admin_role, self.node.try_get_context('node_fleet'), karpenter)
+        eks_sa = EksSAConst(self, 'eks_sa', eks_cluster.my_cluster, jhub_secret, karpenter)
+        base_app=EksBaseAppConst(self, 'eks_base_app', eks_cluster.my_cluster, iam.managed_node_role, karpenter)
 
         # 4. Spark app access control
         app_security = SparkOnEksSAConst(self,'spark_service_account', 
@@ -99,18 +112,17 @@ class SparkOnEksStack(Stack):
         name_parts=Fn.split('-',jhub_secret.secret_name)
         name_no_suffix=Fn.join('-',[Fn.select(0, name_parts), Fn.select(1, name_parts)])
 
-        config_hub = eks.KubernetesManifest(self,'JHubConfig',
-            cluster=eks_cluster.my_cluster,
-            manifest=load_yaml_replace_var_local(source_dir+'/app_resources/jupyter-config.yaml', 
+        config_hub = add_chunked_manifest(self,'JHubConfig',
+            eks_cluster.my_cluster,
+            iter_yaml_local(source_dir+'/app_resources/jupyter-config.yaml', 
                 fields= {
                     "{{MY_SA}}": app_security.jupyter_sa,
                     "{{REGION}}": Aws.REGION, 
                     "{{SECRET_NAME}}": name_no_suffix,
                     "{{INBOUND_SG}}": network_sg.alb_jhub_sg.security_group_id
-                }, 
-                multi_resource=True)
+                })
         )
-        config_hub.node.add_dependency(jhub_install)
+        config_hub[0].node.add_dependency(jhub_install)
             
         # 6. Install ETL orchestrator - Argo in EKS
         # can be replaced by other workflow tool, eg. Airflow
@@ -126,12 +138,40 @@ class SparkOnEksStack(Stack):
                     "{{INBOUND_SG}}": network_sg.alb_argo_sg.security_group_id
                 })
         )
-        argo_install.node.add_dependency(config_hub)
-        # Create argo workflow template for Spark with T-shirt size
+        argo_install.node.add_dependency(*config_hub)
+        # Create argo workflow template for Spark with T-shirt size, rendered from app_resources/spark-sizing.yaml
+        spark_sizes = load_sizes(source_dir+'/app_resources/spark-sizing.yaml')
         submit_tmpl = eks_cluster.my_cluster.add_manifest('SubmitSparkWrktmpl',
-            load_yaml_local(source_dir+'/app_resources/spark-template.yaml')
+            render_spark_template(spark_sizes, source_dir)
         )
         submit_tmpl.node.add_dependency(argo_install)
+        # Spark History Server of the event logs the templates write to the code bucket
+        history_server = HistoryServerConst(self, 'history_server', eks_cluster.my_cluster,
+            self.app_s3.code_bucket, ecr_image.image_uri, network_sg.alb_history_sg.security_group_id)
+        history_server.node.add_dependency(app_security, base_app)
+        # Pre-pull the template images and the ECR image on every node, the Spark pods pull IfNotPresent
+        if str(self.node.try_get_context('image_prepull')).lower() != 'false':
+            prepull = ImagePrepullConst(self, 'image_prepull', eks_cluster.my_cluster,
+                sizing_images(spark_sizes) + [ecr_image.image_uri])
+            prepull.node.add_dependency(app_security)
+        # Scheduled OPTIMIZE & VACUUM of the SCD2 Delta tables, thresholds from the delta_maintenance context
+        maintenance = maintenance_settings(self.node.try_get_context('delta_maintenance'))
+        if maintenance:
+            # same Arc build and pull policy as the Spark templates writing the tables
+            delta_cron = DeltaMaintenanceConst(self, 'delta_maintenance', eks_cluster.my_cluster,
+                self.app_s3.code_bucket, next(s for s in spark_sizes if s.mode == 'cluster'), maintenance)
+            delta_cron.node.add_dependency(argo_install, app_security, base_app)
+        # (OPTIONAL) warm Spark driver for short jobs, steps with runner=pool run in it
+        warm_pool = warm_pool_settings(self.node.try_get_context('warm_pool'))
+        if warm_pool:
+            warm_pool_app = WarmPoolConst(self, 'warm_pool', eks_cluster.my_cluster,
+                self.app_s3.code_bucket, ecr_image.image_uri, warm_pool, eks_sa.secrets_sa)
+            warm_pool_app.node.add_dependency(app_security, base_app)
+        # (OPTIONAL) Prometheus, Pushgateway and Grafana for the Spark, Arc stage and Argo step metrics
+        observability = observability_settings(self.node.try_get_context('observability'))
+        if observability:
+            monitoring = ObservabilityConst(self, 'observability', eks_cluster.my_cluster, observability)
+            monitoring.node.add_dependency(base_app)
 
         # 7. (OPTIONAL) retrieve ALB DNS Name to enable CloudFront in the nested stack.
         # It is used to serve HTTPS requests with its default domain name. 
@@ -144,7 +184,7 @@ class SparkOnEksStack(Stack):
             object_namespace='jupyter',
             timeout=Duration.minutes(10)
         )
-        self._jhub_alb.node.add_dependency(config_hub)
+        self._jhub_alb.node.add_dependency(*config_hub)
 
         self._argo_alb = eks.KubernetesObjectValue(self, 'argoALB',
             cluster=eks_cluster.my_cluster,
@@ -156,6 +196,16 @@ class SparkOnEksStack(Stack):
         )
         self._argo_alb.node.add_dependency(argo_install)
 
+        self._history_alb = eks.KubernetesObjectValue(self, 'historyALB',
+            cluster=eks_cluster.my_cluster,
+            json_path='..status.loadBalancer.ingress[0].hostname',
+            object_type='ingress.networking',
+            object_name='spark-history-server',
+            object_namespace='spark',
+            timeout=Duration.minutes(10)
+        )
+        self._history_alb.node.add_dependency(history_server)
+
         # 8. (OPTIONAL) Send solution metrics to AWS
         # turn it off from the CloudFormation mapping section if prefer.
         # send_metrics=solution_metrics.SendAnonymousData(self,"SendMetrics", network_sg.vpc, self.app_s3.artifact_bucket,self.app_s3.s3_deploy_contrust,
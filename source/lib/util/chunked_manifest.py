@@ -0,0 +1,39 @@
+import json
+from constructs import Construct
+from aws_cdk.aws_eks import ICluster, KubernetesManifest
+
+# The manifest is sent to the kubectl handler inside the custom resource event,
+# keep each chunk well below the Lambda async payload limit of 256KB.
+MAX_CHUNK_BYTES = 200 * 1024
+
+def chunk_documents(documents, max_bytes=MAX_CHUNK_BYTES, max_docs=None):
+    """Group k8s documents into ordered chunks, consuming the input lazily."""
+    chunk, size = [], 0
+    for doc in documents:
+        doc_size = len(json.dumps(doc, separators=(',', ':')))
+        if chunk and (size + doc_size > max_bytes or (max_docs and len(chunk) >= max_docs)):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(doc)
+        size += doc_size
+    if chunk:
+        yield chunk
+
+def add_chunked_manifest(scope: Construct, id: str, cluster: ICluster, documents, max_bytes=MAX_CHUNK_BYTES, max_docs=None, **kwargs):
+    """Apply a stream of documents as one KubernetesManifest per chunk.
+
+    The first chunk keeps the given id, so a manifest that fits in one chunk
+    synthesizes exactly as a plain KubernetesManifest would. Chunks are applied
+    in document order, eg. CRDs before the resources using them.
+    """
+    manifests = []
+    for i, chunk in enumerate(chunk_documents(documents, max_bytes, max_docs)):
+        manifest = KubernetesManifest(scope, id if i == 0 else '{}Part{}'.format(id, i + 1),
+            cluster=cluster,
+            manifest=chunk,
+            **kwargs
+        )
+        if manifests:
+            manifest.node.add_dependency(manifests[-1])
+        manifests.append(manifest)
+    return manifests
@@ -0,0 +1,317 @@
+"""Per-stage and per-task summaries of a Spark event log, for post-mortem and regression checks.
+
+    python -m lib.util.event_log <event log>                                  # summary JSON on stdout
+    python -m lib.util.event_log <event log> --output summary.json
+    python -m lib.util.event_log <event log> --baseline summary.json [--tolerance 0.25]
+    python -m lib.util.event_log <event log> --max-skew 4 --max-gc-ratio 0.2
+
+<event log> is an event log file or a rolling event log directory (eventlog_v2_<app id>), on
+the local disk or in S3 (s3:// or s3a://, needs boto3), eg. the ones the Spark templates write
+to s3a://<code bucket>/spark-events/. zstd compressed logs need the zstandard package.
+
+For each stage: task count and failures, wall time, task time percentiles, skew (slowest task
+over the median task), executor run and CPU time, GC time and its share of the run time, memory
+and disk spill, input and shuffle bytes. A stage is named by the job description its job was
+submitted with (the Arc stage name in app_code/job/arc_dag.py) and its Spark call site. For the
+application: the same totals, the CPU time over the cores x time of the executors, and the peak
+executor heap, off-heap and RSS memory.
+
+Exits 1 when a stage breaks --max-skew or --max-gc-ratio, or when the job, a stage duration,
+its skew, GC share or spill grew more than --tolerance over the --baseline summary.
+"""
+import argparse
+import io
+import json
+import os
+import os.path as path
+import re
+import sys
+from collections import Counter
+
+ROLLING_FILE = re.compile(r'^events_(\d+)_')
+# floors below which a change is noise, not a regression
+MIN_STAGE_SECONDS = 5
+MIN_SPILL_BYTES = 64 * 1024 * 1024
+MIN_GC_RATIO = 0.05
+MIN_SKEW = 2.0
+CONF_KEYS = ('spark.executor.instances', 'spark.executor.cores', 'spark.executor.memory', 'spark.executor.memoryOverhead',
+    'spark.driver.memory', 'spark.sql.shuffle.partitions',
+    # set by spark-submit-*.sh, the jobId and the spark-template size of the step
+    'spark.sparkoneks.jobId', 'spark.sparkoneks.template')
+PEAK_METRICS = ('JVMHeapMemory', 'JVMOffHeapMemory', 'ProcessTreeJVMRSSMemory')
+
+class EventLogError(ValueError):
+    pass
+
+def _s3(uri):
+    import boto3
+    bucket, _, key = uri.split('://', 1)[1].partition('/')
+    return boto3.client('s3'), bucket, key
+
+def _list(uri):
+    """Files of the event log, in write order."""
+    if uri.startswith(('s3://', 's3a://')):
+        s3, bucket, key = _s3(uri)
+        keys = [o['Key'] for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=key.rstrip('/') + '/')
+            for o in page.get('Contents', [])]
+        if not keys:
+            keys = [key]
+        files = ['s3://{}/{}'.format(bucket, k) for k in keys]
+    elif path.isdir(uri):
+        files = [path.join(uri, f) for f in os.listdir(uri)]
+    else:
+        files = [uri]
+    if len(files) == 1:
+        return files
+    # rolling event log: events_<n>_<app id>[.codec], the appstatus_ file only marks the application
+    rolled = [(int(ROLLING_FILE.match(path.basename(f)).group(1)), f) for f in files if ROLLING_FILE.match(path.basename(f))]
+    if not rolled:
+        raise EventLogError('No events_<n>_ file in ' + uri)
+    return [f for _, f in sorted(rolled)]
+
+def _read(file_uri):
+    if file_uri.startswith('s3://'):
+        s3, bucket, key = _s3(file_uri)
+        return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    with open(file_uri, 'rb') as f:
+        return f.read()
+
+def _lines(file_uri):
+    name = path.basename(file_uri)
+    if name.endswith('.inprogress'):
+        name = name[:-len('.inprogress')]
+    codec = name.rsplit('.', 1)[1] if '.' in name else None
+    data = _read(file_uri)
+    if codec in ('zstd', 'zst'):
+        try:
+            import zstandard
+        except ImportError:
+            print('pip install zstandard to read the zstd event log ' + file_uri)
+            sys.exit(1)
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+        data = reader.read()
+    elif codec in ('lz4', 'lzf', 'snappy'):
+        raise EventLogError('{}: {} event logs are not supported, use spark.eventLog.compression.codec=zstd'.format(file_uri, codec))
+    return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+
+def read_events(uri):
+    """The listener events of an event log, in order."""
+    for file_uri in _list(uri):
+        for line in _lines(file_uri):
+            if line.strip():
+                yield json.loads(line)
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+class _Stage:
+    def __init__(self, stage_id, attempt):
+        self.id = stage_id
+        self.attempt = attempt
+        self.name = None
+        self.description = None
+        self.submitted = None
+        self.completed = None
+        self.failure = None
+        self.task_ms = []
+        self.failed_tasks = 0
+        self.totals = Counter()
+
+    def add_task(self, event):
+        info, metrics = event['Task Info'], event.get('Task Metrics') or {}
+        if info.get('Failed') or info.get('Killed'):
+            self.failed_tasks += 1
+        if info.get('Finish Time') and info.get('Launch Time'):
+            self.task_ms.append(info['Finish Time'] - info['Launch Time'])
+        shuffle_read = metrics.get('Shuffle Read Metrics') or {}
+        self.totals.update({
+            'run_ms': metrics.get('Executor Run Time', 0),
+            'cpu_ns': metrics.get('Executor CPU Time', 0),
+            'gc_ms': metrics.get('JVM GC Time', 0),
+            'memory_spill_bytes': metrics.get('Memory Bytes Spilled', 0),
+            'disk_spill_bytes': metrics.get('Disk Bytes Spilled', 0),
+            'input_bytes': (metrics.get('Input Metrics') or {}).get('Bytes Read', 0),
+            'shuffle_read_bytes': shuffle_read.get('Remote Bytes Read', 0) + shuffle_read.get('Local Bytes Read', 0),
+            'shuffle_write_bytes': (metrics.get('Shuffle Write Metrics') or {}).get('Shuffle Bytes Written', 0)
+        })
+
+    def summary(self):
+        tasks = self.task_ms
+        p50 = _percentile(tasks, 0.5) if tasks else 0
+        return {
+            'stage_id': self.id,
+            'attempt': self.attempt,
+            'description': self.description,
+            'name': self.name,
+            'tasks': len(tasks),
+            'failed_tasks': self.failed_tasks,
+            'failure': self.failure,
+            'duration_s': round((self.completed - self.submitted) / 1000, 3) if self.completed and self.submitted else None,
+            'task_s': {'p50': p50 / 1000, 'p95': _percentile(tasks, 0.95) / 1000, 'max': max(tasks) / 1000} if tasks else None,
+            'skew': round(max(tasks) / p50, 2) if p50 else None,
+            'run_s': round(self.totals['run_ms'] / 1000, 3),
+            'cpu_s': round(self.totals['cpu_ns'] / 1e9, 3),
+            'gc_s': round(self.totals['gc_ms'] / 1000, 3),
+            'gc_ratio': round(self.totals['gc_ms'] / self.totals['run_ms'], 3) if self.totals['run_ms'] else 0,
+            'memory_spill_bytes': self.totals['memory_spill_bytes'],
+            'disk_spill_bytes': self.totals['disk_spill_bytes'],
+            'input_bytes': self.totals['input_bytes'],
+            'shuffle_read_bytes': self.totals['shuffle_read_bytes'],
+            'shuffle_write_bytes': self.totals['shuffle_write_bytes']
+        }
+
+def _peaks(peaks, executor_id, metrics):
+    # peak executor memory of spark.eventLog.logStageExecutorMetrics or of the task end events
+    current = peaks.setdefault(executor_id, Counter())
+    for k in PEAK_METRICS:
+        current[k] = max(current[k], (metrics or {}).get(k, 0))
+
+def summarize(events):
+    """Application and per-stage summary of the events of one application."""
+    app, stages, descriptions, executors, peaks = {}, {}, {}, {}, {}
+    failed_jobs = 0
+    def stage(stage_id, attempt):
+        return stages.setdefault((stage_id, attempt), _Stage(stage_id, attempt))
+
+    for e in events:
+        kind = e.get('Event')
+        if kind == 'SparkListenerApplicationStart':
+            app.update({'id': e.get('App ID'), 'name': e.get('App Name'), 'start': e.get('Timestamp')})
+        elif kind == 'SparkListenerApplicationEnd':
+            app['end'] = e.get('Timestamp')
+        elif kind == 'SparkListenerEnvironmentUpdate':
+            props = e.get('Spark Properties', {})
+            if isinstance(props, list):
+                props = dict(props)
+            app['conf'] = {k: props[k] for k in CONF_KEYS if k in props}
+        elif kind == 'SparkListenerExecutorAdded':
+            executors[e['Executor ID']] = [e.get('Executor Info', {}).get('Total Cores') or 0, e.get('Timestamp'), None]
+        elif kind == 'SparkListenerExecutorRemoved':
+            if e['Executor ID'] in executors:
+                executors[e['Executor ID']][2] = e.get('Timestamp')
+        elif kind == 'SparkListenerStageExecutorMetrics':
+            _peaks(peaks, e['Executor ID'], e.get('Executor Metrics'))
+        elif kind == 'SparkListenerJobEnd':
+            if (e.get('Job Result') or {}).get('Result') != 'JobSucceeded':
+                failed_jobs += 1
+        elif kind == 'SparkListenerJobStart':
+            description = (e.get('Properties') or {}).get('spark.job.description')
+            for stage_id in e.get('Stage IDs', []):
+                descriptions.setdefault(stage_id, description)
+        elif kind == 'SparkListenerStageSubmitted':
+            info = e['Stage Info']
+            stage(info['Stage ID'], info.get('Stage Attempt ID', 0)).submitted = info.get('Submission Time')
+        elif kind == 'SparkListenerStageCompleted':
+            info = e['Stage Info']
+            s = stage(info['Stage ID'], info.get('Stage Attempt ID', 0))
+            s.name = info.get('Stage Name')
+            s.submitted = info.get('Submission Time') or s.submitted
+            s.completed = info.get('Completion Time')
+            s.failure = info.get('Failure Reason')
+        elif kind == 'SparkListenerTaskEnd':
+            stage(e['Stage ID'], e.get('Stage Attempt ID', 0)).add_task(e)
+            _peaks(peaks, e['Task Info'].get('Executor ID'), e.get('Task Executor Metrics'))
+
+    summaries = []
+    for key in sorted(stages):
+        stages[key].description = descriptions.get(key[0])
+        summaries.append(stages[key].summary())
+    total = Counter()
+    for s in summaries:
+        total.update({k: s[k] for k in ('tasks', 'failed_tasks', 'run_s', 'cpu_s', 'gc_s', 'memory_spill_bytes', 'disk_spill_bytes')})
+    # cores x seconds the executors were up, the CPU time of the tasks is the used share of it
+    end = app.get('end') or max([s.completed or 0 for s in stages.values()] + [0])
+    core_s = sum(cores * ((removed or end) - added) / 1000 for k, (cores, added, removed) in executors.items()
+        if k != 'driver' and added and (removed or end))
+    executor_peaks = [v for k, v in peaks.items() if k != 'driver']
+    app.update({
+        'duration_s': round((app['end'] - app['start']) / 1000, 3) if app.get('end') and app.get('start') else None,
+        'executors': len([k for k in executors if k != 'driver']),
+        'failed_jobs': failed_jobs,
+        'stages': len(summaries),
+        'tasks': total['tasks'],
+        'failed_tasks': total['failed_tasks'],
+        'run_s': round(total['run_s'], 3),
+        'cpu_s': round(total['cpu_s'], 3),
+        'cpu_utilization': round(total['cpu_s'] / core_s, 3) if core_s else None,
+        'gc_ratio': round(total['gc_s'] / total['run_s'], 3) if total['run_s'] else 0,
+        'memory_spill_bytes': total['memory_spill_bytes'],
+        'disk_spill_bytes': total['disk_spill_bytes'],
+        'peak_heap_bytes': max([p['JVMHeapMemory'] for p in executor_peaks] + [0]) or None,
+        'peak_offheap_bytes': max([p['JVMOffHeapMemory'] for p in executor_peaks] + [0]) or None,
+        'peak_rss_bytes': max([p['ProcessTreeJVMRSSMemory'] for p in executor_peaks] + [0]) or None
+    })
+    return {'app': app, 'stages': summaries}
+
+def stage_keys(summary):
+    """A key per stage that survives a rerun: description and call site, numbered when they repeat."""
+    seen, keys = Counter(), []
+    for s in summary['stages']:
+        base = '{}|{}'.format(s['description'] or '', s['name'] or '')
+        keys.append('{}#{}'.format(base, seen[base]))
+        seen[base] += 1
+    return keys
+
+def check_limits(summary, max_skew=None, max_gc_ratio=None):
+    problems = []
+    for s in summary['stages']:
+        label = 'stage {} ({})'.format(s['stage_id'], s['description'] or s['name'])
+        if max_skew and s['skew'] and s['skew'] > max_skew and s['task_s']['max'] >= MIN_STAGE_SECONDS:
+            problems.append('{}: skew {} over {}, slowest task {}s'.format(label, s['skew'], max_skew, s['task_s']['max']))
+        if max_gc_ratio and s['gc_ratio'] > max_gc_ratio and s['run_s'] >= MIN_STAGE_SECONDS:
+            problems.append('{}: GC {:.0%} of the run time over {:.0%}'.format(label, s['gc_ratio'], max_gc_ratio))
+    return problems
+
+def compare(summary, baseline, tolerance=0.25):
+    """Regressions of summary against a baseline summary of the same job."""
+    problems = []
+    def grew(label, value, base, floor, unit=''):
+        if value is not None and base is not None and value >= floor and value > base * (1 + tolerance):
+            problems.append('{}: {}{} against {}{} in the baseline'.format(label, value, unit, base, unit))
+
+    grew('job duration', summary['app'].get('duration_s'), baseline['app'].get('duration_s'), MIN_STAGE_SECONDS, 's')
+    base_stages = dict(zip(stage_keys(baseline), baseline['stages']))
+    for key, s in zip(stage_keys(summary), summary['stages']):
+        b = base_stages.get(key)
+        if not b:
+            continue
+        label = 'stage {} ({})'.format(s['stage_id'], s['description'] or s['name'])
+        grew(label + ' duration', s['duration_s'], b['duration_s'], MIN_STAGE_SECONDS, 's')
+        grew(label + ' skew', s['skew'], b['skew'], MIN_SKEW)
+        grew(label + ' GC share', s['gc_ratio'], b['gc_ratio'], MIN_GC_RATIO)
+        grew(label + ' spill', s['memory_spill_bytes'] + s['disk_spill_bytes'],
+            b['memory_spill_bytes'] + b['disk_spill_bytes'], MIN_SPILL_BYTES, ' bytes')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('event_log')
+    parser.add_argument('--output', help='write the summary JSON here instead of stdout')
+    parser.add_argument('--baseline', help='summary JSON of a previous run of the same job')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative growth over the baseline that fails')
+    parser.add_argument('--max-skew', type=float, help='slowest over median task time of a stage')
+    parser.add_argument('--max-gc-ratio', type=float, help='GC time over executor run time of a stage')
+    args = parser.parse_args()
+
+    try:
+        summary = summarize(read_events(args.event_log))
+    except EventLogError as e:
+        print(e)
+        sys.exit(1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+    problems = check_limits(summary, args.max_skew, args.max_gc_ratio)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems += compare(summary, json.load(f), args.tolerance)
+    for p in problems:
+        print(p, file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Pin the images of app_resources/spark-sizing.yaml by digest.
+
+    python -m lib.util.image_pin           # resolve each image:tag, write image:tag@sha256:<digest> and pull it IfNotPresent
+    python -m lib.util.image_pin --check   # fail when an image is not pinned
+
+A pinned image is immutable, so the Spark pods can pull it with IfNotPresent and start from
+the copy already on the node (see the image-prepuller DaemonSet) instead of asking the
+registry on every pod. The digest of a multi-arch image is the one of its index, each node
+still pulls its own platform. Anonymous pulls only, eg. ghcr.io, public.ecr.aws or Docker Hub.
+Run python -m lib.cdk_infra.spark_sizing afterwards.
+"""
+import argparse
+import json
+import os.path as path
+import re
+import sys
+import urllib.request as request
+from urllib.error import HTTPError, URLError
+
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json'
+])
+IMAGE_LINE = re.compile(r'^(\s*image:\s*)(\S+?)\s*$', re.M)
+PULL_ALWAYS_LINE = re.compile(r'^(\s*pullPolicy:\s*)Always\s*$', re.M)
+BEARER = re.compile(r'(\w+)="([^"]*)"')
+
+class ImagePinError(ValueError):
+    pass
+
+def split_image(image):
+    """(registry, repository, tag, digest) of an image reference."""
+    name, _, digest = image.partition('@')
+    registry, _, rest = name.partition('/')
+    if not rest:
+        registry, rest = 'registry-1.docker.io', 'library/' + name
+    elif '.' not in registry and ':' not in registry and registry != 'localhost':
+        registry, rest = 'registry-1.docker.io', name
+    repository, _, tag = rest.partition(':')
+    return registry, repository, tag or 'latest', digest or None
+
+def is_pinned(image):
+    return split_image(image)[3] is not None
+
+def _token(challenge):
+    # Bearer realm="https://ghcr.io/token",service="ghcr.io",scope="repository:tripl-ai/arc:pull"
+    params = dict(BEARER.findall(challenge))
+    query = '&'.join('{}={}'.format(k, params[k]) for k in ('service', 'scope') if k in params)
+    with request.urlopen(params['realm'] + '?' + query, timeout=30) as r:
+        body = json.load(r)
+    return body.get('token') or body.get('access_token')
+
+def resolve_digest(image):
+    registry, repository, tag, _ = split_image(image)
+    url = 'https://{}/v2/{}/manifests/{}'.format(registry, repository, tag)
+    headers = {'Accept': MANIFEST_TYPES}
+    for _ in range(2):
+        try:
+            with request.urlopen(request.Request(url, headers=headers, method='HEAD'), timeout=30) as r:
+                digest = r.headers.get('Docker-Content-Digest')
+            # never write image@None, a registry may leave the header out
+            if not digest or not digest.startswith('sha256:'):
+                raise ImagePinError('{}: no sha256 Docker-Content-Digest in the registry response'.format(image))
+            return digest
+        except HTTPError as e:
+            challenge = e.headers.get('WWW-Authenticate', '')
+            if e.code != 401 or not challenge.startswith('Bearer') or 'Authorization' in headers:
+                raise ImagePinError('{}: {} {}'.format(image, e.code, e.reason))
+            headers['Authorization'] = 'Bearer ' + _token(challenge)
+        except URLError as e:
+            raise ImagePinError('{}: {}'.format(image, e.reason))
+
+def pin_images(text, resolve=resolve_digest):
+    """The sizing file with every unpinned image line pinned and pulled IfNotPresent, and the images pinned."""
+    pinned = []
+    def replace(m):
+        image = m.group(2)
+        if is_pinned(image):
+            return m.group(0)
+        pinned.append(image)
+        return '{}{}@{}'.format(m.group(1), image, resolve(image))
+    text = IMAGE_LINE.sub(replace, text)
+    # an unpinned image is pulled Always, once every image is pinned the node copy is the right one
+    return PULL_ALWAYS_LINE.sub(r'\1IfNotPresent', text), pinned
+
+def main():
+    source_dir = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizing', default=source_dir + '/app_resources/spark-sizing.yaml')
+    parser.add_argument('--check', action='store_true', help='exit 1 when an image is not pinned')
+    args = parser.parse_args()
+
+    with open(args.sizing) as f:
+        text = f.read()
+    if args.check:
+        unpinned = [m.group(2) for m in IMAGE_LINE.finditer(text) if not is_pinned(m.group(2))]
+        for image in unpinned:
+            print('{} is not pinned by digest, run: python -m lib.util.image_pin'.format(image))
+        sys.exit(1 if unpinned else 0)
+    try:
+        text, pinned = pin_images(text)
+    except ImagePinError as e:
+        print('Unable to resolve the image digest of {}'.format(e))
+        sys.exit(1)
+    with open(args.sizing, 'w') as f:
+        f.write(text)
+    for image in pinned:
+        print('pinned ' + image)
+
+if __name__ == '__main__':
+    main()
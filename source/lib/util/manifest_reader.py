@@ -1,22 +1,97 @@
 import yaml
 import urllib.request as request
 import os.path as path
+import os
 import sys
+import copy
+from lib.util.placeholder import PLACEHOLDER, UnresolvedPlaceholderError, check_unresolved, compile_fields
+from lib.util.remote_manifest import ManifestFetchError, get_fetcher
+from lib.util.synth_profiler import profiler
+
+# manifests are safe-loaded, with libyaml's C loader & dumper when PyYAML was built with it
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# path -> ((mtime, size), ManifestTemplate)
+_template_cache = {}
+# (path, mtime, fields, multi_resource) -> parsed yaml
+_yaml_cache = {}
+
+class ManifestTemplate:
+    """A manifest file read once, with the position of every {{...}} placeholder indexed."""
+
+    def __init__(self, text):
+        self.text = text
+        self.placeholders = [(m.start(), m.end(), m.group(0)) for m in PLACEHOLDER.finditer(text)]
+        self.tokens = frozenset(token for _, _, token in self.placeholders)
+
+    def render(self, fields):
+        # keys that are not {{...}} tokens need the compiled scan over the whole text
+        if any(searchwrd and searchwrd not in self.tokens for searchwrd in fields):
+            return compile_fields(fields).apply(self.text)
+
+        # otherwise substitute the indexed placeholders in a single pass
+        pieces = []
+        pos = 0
+        for start, end, token in self.placeholders:
+            if token in fields:
+                pieces.append(self.text[pos:start])
+                pieces.append(fields[token])
+                pos = end
+        pieces.append(self.text[pos:])
+        return ''.join(pieces)
+
+def _file_version(file_path):
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def get_manifest_template(file_path):
+    """Return the cached template of a local file, re-reading it only when the file has changed."""
+    file_path = path.abspath(file_path)
+    version = _file_version(file_path)
+    cached = _template_cache.get(file_path)
+    if cached is None or cached[0] != version:
+        with open(file_path, 'r') as f:
+            cached = (version, ManifestTemplate(f.read()))
+        _template_cache[file_path] = cached
+    return cached[1]
+
+def _parse_yaml(filedata, multi_resource):
+    if multi_resource:
+        return list(yaml.load_all(filedata, Loader=SafeLoader))
+    return yaml.load(filedata, Loader=SafeLoader)
+
+def _load_cached_yaml(file_path, fields, multi_resource, strict=False):
+    # memoized on (path, mtime, fields), so repeated loads of a manifest skip the parse cost.
+    # Each caller gets its own copy, as constructs are free to mutate what they receive.
+    file_path = path.abspath(file_path)
+    template = get_manifest_template(file_path)
+    if strict:
+        check_unresolved(template.tokens, fields, source=file_path)
+    key = (file_path, _template_cache[file_path][0], frozenset(fields.items()), multi_resource)
+    with profiler.span('manifest:' + path.basename(file_path)):
+        if key not in _yaml_cache:
+            _yaml_cache[key] = _parse_yaml(template.render(fields), multi_resource)
+        return copy.deepcopy(_yaml_cache[key])
+
+def clear_manifest_cache():
+    _template_cache.clear()
+    _yaml_cache.clear()
 
 def load_yaml_remotely(url, multi_resource=False):
     try:
-        file_to_parse = request.urlopen(url)
-        if multi_resource:
-            yaml_data = list(yaml.full_load_all(file_to_parse))
-        else:
-            yaml_data = yaml.full_load(file_to_parse) 
-        # print(yaml_data)  
+        with profiler.span('manifest:' + url):
+            yaml_data = _parse_yaml(get_fetcher().fetch(url), multi_resource)
+        # print(yaml_data)
+    except ManifestFetchError as e:
+        print(e)
+        sys.exit(1)
     except:
         print("Cannot read yaml config file {}, check formatting."
-                "".format(file_to_parse))
+                "".format(url))
         sys.exit(1)
-        
-    return yaml_data 
+
+    return yaml_data
 
 def load_yaml_local(yaml_file, multi_resource=False):
 
@@ -27,39 +102,29 @@ def load_yaml_local(yaml_file, multi_resource=False):
         sys.exit(1)
 
     try:
-        with open(file_to_parse, 'r') as yaml_stream:
-            if multi_resource:
-                yaml_data = list(yaml.full_load_all(yaml_stream))
-            else:
-                yaml_data = yaml.full_load(yaml_stream) 
-            # print(yaml_data)    
+        yaml_data = _load_cached_yaml(file_to_parse, {}, multi_resource)
+        # print(yaml_data)
     except:
         print("Cannot read yaml config file {}, check formatting."
                 "".format(file_to_parse))
         sys.exit(1)
-        
-    return yaml_data 
 
-def load_yaml_replace_var_remotely(url, fields, multi_resource=False):
-    try:
-        with request.urlopen(url) as f:
-            file_to_replace = f.read().decode('utf-8')
-            for searchwrd,replwrd in fields.items():
-                file_to_replace = file_to_replace.replace(searchwrd, replwrd)
+    return yaml_data
 
-        if multi_resource:
-            yaml_data = list(yaml.full_load_all(file_to_replace))
-        else:
-            yaml_data = yaml.full_load(file_to_replace) 
+def load_yaml_replace_var_remotely(url, fields, multi_resource=False, strict=False):
+    try:
+        with profiler.span('manifest:' + url):
+            file_to_replace = compile_fields(fields).apply(get_fetcher().fetch(url), strict=strict, source=url)
+            yaml_data = _parse_yaml(file_to_replace, multi_resource)
         # print(yaml_data)
-    except request.URLError as e:
-        print(e.reason)
+    except (ManifestFetchError, UnresolvedPlaceholderError) as e:
+        print(e)
         sys.exit(1)
 
     return yaml_data
 
 
-def load_yaml_replace_var_local(yaml_file, fields, multi_resource=False, write_output=False):
+def load_yaml_replace_var_local(yaml_file, fields, multi_resource=False, write_output=False, strict=False):
 
     file_to_replace=path.join(path.dirname(__file__), yaml_file)
     if not path.exists(file_to_replace):
@@ -68,22 +133,51 @@ def load_yaml_replace_var_local(yaml_file, fields, multi_resource=False, write_o
         sys.exit(1)
 
     try:
-        with open(file_to_replace, 'r') as f:
-            filedata = f.read()
-
-            for searchwrd, replwrd in fields.items():
-                filedata = filedata.replace(searchwrd, replwrd)
-            if multi_resource:
-                yaml_data = list(yaml.full_load_all(filedata))
-            else:
-                yaml_data = yaml.full_load(filedata) 
+        yaml_data = _load_cached_yaml(file_to_replace, fields, multi_resource, strict)
         if write_output:
             with open(file_to_replace, "w") as f:
-                yaml.dump(yaml_data, f, default_flow_style=False, allow_unicode = True, sort_keys=False)
-    
+                yaml.dump(yaml_data, f, Dumper=SafeDumper, default_flow_style=False, allow_unicode = True, sort_keys=False)
+
         # print(yaml_data)
     except request.URLError as e:
         print(e.reason)
         sys.exit(1)
+    except UnresolvedPlaceholderError as e:
+        print(e)
+        sys.exit(1)
 
     return yaml_data
+
+def iter_yaml_local(yaml_file, fields=None, strict=False):
+    """Yield the documents of a multi-document manifest one at a time, skipping empty ones.
+
+    Nothing is materialized up front, so a large bundle (eg. CRDs) can be handed
+    to add_chunked_manifest without holding every parsed document in memory.
+    """
+    file_to_parse=path.join(path.dirname(__file__), yaml_file)
+    if not path.exists(file_to_parse):
+        print("The file {} does not exist"
+            "".format(file_to_parse))
+        sys.exit(1)
+
+    try:
+        if fields:
+            template = get_manifest_template(file_to_parse)
+            if strict:
+                check_unresolved(template.tokens, fields, source=file_to_parse)
+            documents = yaml.load_all(template.render(fields), Loader=SafeLoader)
+            for doc in documents:
+                if doc is not None:
+                    yield doc
+        else:
+            with open(file_to_parse, 'r') as yaml_stream:
+                for doc in yaml.load_all(yaml_stream, Loader=SafeLoader):
+                    if doc is not None:
+                        yield doc
+    except UnresolvedPlaceholderError as e:
+        print(e)
+        sys.exit(1)
+    except yaml.YAMLError:
+        print("Cannot read yaml config file {}, check formatting."
+                "".format(file_to_parse))
+        sys.exit(1)
@@ -0,0 +1,50 @@
+import re
+from functools import lru_cache
+
+# {{placeholder}} tokens used by the files in app_resources
+PLACEHOLDER = re.compile(r'\{\{[^{}]*\}\}')
+
+# Argo expressions are resolved by the workflow controller at run time, not at synth time
+ARGO_EXPRESSIONS = ('{{inputs.', '{{outputs.', '{{workflow.', '{{pod.', '{{steps.', '{{tasks.', '{{item')
+
+class UnresolvedPlaceholderError(ValueError):
+    def __init__(self, tokens, source=None):
+        self.tokens = sorted(tokens)
+        self.source = source
+        super().__init__("Unresolved placeholders {} in {}".format(', '.join(self.tokens), source or 'manifest'))
+
+class Substitution:
+    """All search words of a field mapping compiled into one regex, applied in a single scan.
+
+    Replacement values are never re-scanned, so a value that itself contains a
+    search word does not cascade into a second substitution.
+    """
+
+    def __init__(self, fields):
+        self.fields = {k: v for k, v in fields.items() if k}
+        # longest first, so a key that is a prefix of another never shadows it
+        keys = sorted(self.fields, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(map(re.escape, keys))) if keys else None
+
+    def apply(self, text, strict=False, ignore=ARGO_EXPRESSIONS, source=None):
+        if strict:
+            check_unresolved(PLACEHOLDER.findall(text), self.fields, ignore, source)
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(lambda m: self.fields[m.group(0)], text)
+
+def check_unresolved(tokens, fields, ignore=ARGO_EXPRESSIONS, source=None):
+    unresolved = {t for t in tokens if t not in fields and not t.startswith(ignore)}
+    if unresolved:
+        raise UnresolvedPlaceholderError(unresolved, source)
+
+@lru_cache(maxsize=256)
+def _compile(items):
+    return Substitution(dict(items))
+
+def compile_fields(fields):
+    """Return the compiled substitution for a field mapping, reused across calls with the same fields."""
+    return _compile(frozenset(fields.items()))
+
+def substitute(text, fields, strict=False, ignore=ARGO_EXPRESSIONS, source=None):
+    return compile_fields(fields).apply(text, strict=strict, ignore=ignore, source=source)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import os.path as path
+import sys
+import tempfile
+import threading
+import time
+import urllib.request as request
+from urllib.error import HTTPError, URLError
+from concurrent.futures import ThreadPoolExecutor
+from lib.util.synth_profiler import profiler
+
+# Settings can be overridden from the environment, eg. MANIFEST_OFFLINE=true cdk synth
+DEFAULT_CACHE_DIR = path.join(path.expanduser('~'), '.cache', 'sql-based-etl', 'manifests')
+
+class ManifestFetchError(Exception):
+    pass
+
+def _env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+class RemoteManifestFetcher:
+    """Fetch remote manifests through a content-addressed on-disk cache.
+
+    Bodies are stored once under objects/<sha256>, and each url has a small ref
+    file with the digest and the validators (ETag, Last-Modified) of its last
+    response. Refs younger than max_age are served without a request, older ones
+    are revalidated with a conditional GET. When the network fails, or in offline
+    mode, the cached copy is served instead.
+    """
+
+    def __init__(self, cache_dir=None, timeout=10, retries=3, backoff=0.5, max_age=None, offline=None, max_workers=8, opener=None):
+        self.cache_dir = cache_dir or os.environ.get('MANIFEST_CACHE_DIR', DEFAULT_CACHE_DIR)
+        if retries < 1:
+            raise ValueError('retries counts the attempts of a fetch, it must be at least 1, got {}'.format(retries))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_age = max_age if max_age is not None else int(os.environ.get('MANIFEST_CACHE_MAX_AGE', 3600))
+        self.offline = offline if offline is not None else _env_flag('MANIFEST_OFFLINE')
+        self.max_workers = max_workers
+        self._open = opener or request.urlopen
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _ref_path(self, url):
+        return path.join(self.cache_dir, 'refs', _sha256(url.encode('utf-8')) + '.json')
+
+    def _object_path(self, digest):
+        return path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def _write_atomic(self, file_path, data):
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.dirname(file_path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, file_path)
+
+    def _read_ref(self, url):
+        try:
+            with open(self._ref_path(url)) as f:
+                ref = json.load(f)
+            with open(self._object_path(ref['sha256']), 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None, None
+        # never serve an object that does not match its address
+        if _sha256(body) != ref['sha256']:
+            return None, None
+        return ref, body
+
+    def _store(self, url, body, headers):
+        digest = _sha256(body)
+        object_path = self._object_path(digest)
+        if not path.exists(object_path):
+            self._write_atomic(object_path, body)
+        ref = {
+            'url': url,
+            'sha256': digest,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'checked_at': time.time()
+        }
+        self._write_atomic(self._ref_path(url), json.dumps(ref).encode('utf-8'))
+        return body
+
+    def _touch(self, url, ref):
+        ref['checked_at'] = time.time()
+        self._write_atomic(self._ref_path(url), json.dumps(ref).encode('utf-8'))
+
+    def _request(self, url, ref):
+        req = request.Request(url)
+        if ref:
+            if ref.get('etag'):
+                req.add_header('If-None-Match', ref['etag'])
+            if ref.get('last_modified'):
+                req.add_header('If-Modified-Since', ref['last_modified'])
+
+        for attempt in range(self.retries):
+            try:
+                with self._open(req, timeout=self.timeout) as resp:
+                    return resp.status, resp.read(), resp.headers
+            except HTTPError as e:
+                if e.code == 304:
+                    return 304, None, e.headers
+                # client errors won't go away by retrying
+                if 400 <= e.code < 500 and e.code != 429 or attempt == self.retries - 1:
+                    raise
+            except (URLError, OSError):
+                if attempt == self.retries - 1:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def _fetch(self, url):
+        ref, cached = self._read_ref(url)
+        if cached is not None and (self.offline or time.time() - ref.get('checked_at', 0) < self.max_age):
+            return cached
+        if self.offline:
+            raise ManifestFetchError("Offline mode and no cached copy of {}".format(url))
+
+        try:
+            status, body, headers = self._request(url, ref if cached is not None else None)
+        except (HTTPError, URLError, OSError) as e:
+            if cached is None:
+                raise ManifestFetchError("Cannot fetch {}: {}".format(url, e))
+            print("Cannot fetch {} ({}), using the cached copy".format(url, e), file=sys.stderr)
+            return cached
+
+        if status == 304:
+            self._touch(url, ref)
+            return cached
+        return self._store(url, body, headers)
+
+    def fetch(self, url):
+        """Return the body of a remote manifest as text."""
+        with self._lock:
+            if url in self._resolved:
+                return self._resolved[url]
+        text = self._fetch(url).decode('utf-8')
+        with self._lock:
+            self._resolved[url] = text
+        return text
+
+    def prefetch(self, urls):
+        """Resolve a batch of manifests concurrently, so the loads that follow are served from memory."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+
+        def _try_fetch(url):
+            # a failure is reported again by the load that needs the manifest
+            try:
+                return self.fetch(url)
+            except ManifestFetchError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return dict(zip(urls, pool.map(_try_fetch, urls)))
+
+_fetcher = None
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = RemoteManifestFetcher()
+    return _fetcher
+
+def set_fetcher(fetcher):
+    global _fetcher
+    _fetcher = fetcher
+
+def prefetch_remote_manifests(urls):
+    with profiler.span('prefetch-remote-manifests'):
+        return get_fetcher().prefetch(urls)
@@ -0,0 +1,233 @@
+"""Right-size the Spark template of each job from the event logs of its past runs.
+
+    python -m lib.util.right_sizing collect s3://<code bucket>/spark-events/    # add the new runs to the history
+    python -m lib.util.right_sizing recommend --target-minutes 20                # smallest size and executors per jobId
+    python -m lib.util.right_sizing recommend --target-minutes 20 --apply example/scd2-job-scheduler.yaml
+
+collect summarizes every finished event log of the directory not in the history yet
+(lib/util/event_log.py) into one run per Spark application, keyed by the jobId and the
+spark-template size the step ran with (spark.sparkoneks.* confs of spark-submit-*.sh): its
+duration, executors, executor core seconds of task time, CPU utilization, peak executor heap
+and spill.
+
+recommend takes the last successful runs of each job and models a run as a fixed part (driver,
+scheduling, the single threaded stages) plus the task time divided by the executor cores. Of
+the cluster sizes of spark-sizing.yaml on the same nodes, with an executor heap above the peak
+heap plus --headroom, and never less memory when the job spilled, it picks the cheapest size
+and executor count (cores and GiB of the driver and executors) meeting --target-minutes.
+--apply rewrites the template and executorInstances of the matching steps of a workflow file.
+"""
+import argparse
+import json
+import math
+import os
+import os.path as path
+import re
+import sys
+from lib.cdk_infra.spark_sizing import load_sizes
+from lib.util import event_log
+
+DEFAULT_HISTORY = 'right-sizing-history.json'
+# price ratio of a GiB of memory to a vCPU of the general purpose instances
+GIB_PER_CORE = 4
+MEMORY = re.compile(r'^(\d+(?:\.\d+)?)([kmgt]?)b?$', re.I)
+# a DAG task or steps entry, an argument is followed by its value
+TASK = re.compile(r'^ *- name: \S+\n(?! *value:)', re.M)
+# eventlog_v2_<app id> rolling log directory or a single <app id>[.codec] file, app ids are spark-<uuid> on Kubernetes
+EVENT_LOG = re.compile(r'^(?:eventlog_v2_)?((?:spark|app|local|application)[-_][^.]+)(?:\.\w+)?$')
+PARAMETER = r'(\n( *)- name: {}\n *value: )([^\n]*)'
+
+def _memory_mb(value):
+    m = MEMORY.match(str(value or '').strip())
+    if not m:
+        return None
+    # a bare number is MiB, like spark.executor.memory
+    return int(float(m.group(1)) * {'': 1, 'k': 1 / 1024, 'm': 1, 'g': 1024, 't': 1024 * 1024}[m.group(2).lower()])
+
+def _event_logs(uri):
+    """Finished event logs of the directory: rolling log directories and single files."""
+    if uri.startswith(('s3://', 's3a://')):
+        s3, bucket, key = event_log._s3(uri)
+        prefix = key.rstrip('/') + '/' if key else ''
+        names = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            names += [p['Prefix'][len(prefix):].rstrip('/') for p in page.get('CommonPrefixes', [])]
+            names += [o['Key'][len(prefix):] for o in page.get('Contents', [])]
+        base = 's3://{}/{}'.format(bucket, prefix)
+    else:
+        names, base = os.listdir(uri), uri.rstrip('/') + '/'
+    # an .inprogress file is still being written
+    return [(m.group(1), base + name) for name, m in ((n, EVENT_LOG.match(n)) for n in sorted(names))
+        if m and not name.endswith('.inprogress')]
+
+def run_record(summary):
+    """One run of a job from its event log summary."""
+    app, conf = summary['app'], summary['app'].get('conf', {})
+    instances = int(conf.get('spark.executor.instances', app['executors'] or 1))
+    cores = int(conf.get('spark.executor.cores', 1))
+    return {
+        'app_id': app.get('id'),
+        'job_id': conf.get('spark.sparkoneks.jobId'),
+        'template': conf.get('spark.sparkoneks.template'),
+        'end': app.get('end'),
+        'succeeded': bool(app.get('end')) and app['failed_jobs'] == 0,
+        'duration_s': app['duration_s'],
+        'executor_instances': instances,
+        'executor_cores': cores,
+        'executor_memory_mb': _memory_mb(conf.get('spark.executor.memory')),
+        'task_core_s': app['run_s'],
+        'cpu_utilization': app['cpu_utilization'],
+        'peak_heap_bytes': app['peak_heap_bytes'],
+        'spill_bytes': app['memory_spill_bytes'] + app['disk_spill_bytes']
+    }
+
+def collect(uri, history):
+    """Add the runs of the new event logs under uri to history, return the runs added."""
+    known = {r['app_id'] for r in history}
+    added = []
+    for app_id, log in _event_logs(uri):
+        if app_id in known:
+            continue
+        try:
+            record = run_record(event_log.summarize(event_log.read_events(log)))
+        except event_log.EventLogError as e:
+            print('skipped {}: {}'.format(log, e))
+            continue
+        if not record['job_id']:
+            # not started by a spark-template step
+            continue
+        history.append(record)
+        added.append(record)
+    return added
+
+def _cost(size, instances):
+    executors = instances * (size.executor_cores + size.executor_pod_mb / 1024 / GIB_PER_CORE)
+    return round(executors + size.driver_cores + size.driver_limit_mb / 1024 / GIB_PER_CORE, 2)
+
+def recommend(runs, sizes, target_s, headroom=0.25, last=5):
+    """Cheapest size and executor count meeting target_s for the runs of one job, or a reason why there is none."""
+    runs = sorted([r for r in runs if r['succeeded'] and r['duration_s']], key=lambda r: r['end'] or 0)[-last:]
+    if not runs:
+        return {'reason': 'no successful run'}
+    by_name = {s.name: s for s in sizes}
+    current = by_name.get(runs[-1]['template'])
+    if not current or current.mode != 'cluster':
+        return {'reason': 'last run is not on a cluster size of spark-sizing.yaml'}
+
+    work = max(r['task_core_s'] for r in runs)
+    fixed = sorted(max(0, r['duration_s'] - r['task_core_s'] / (r['executor_instances'] * r['executor_cores'])) for r in runs)[len(runs) // 2]
+    peaks = [r['peak_heap_bytes'] for r in runs if r['peak_heap_bytes']]
+    used_mb = max(r['executor_memory_mb'] or current.executor_memory * 1024 for r in runs)
+    # without the peak heap, or when the job spilled, the executors keep at least their memory
+    need_mb = max(peaks) / 1024 / 1024 * (1 + headroom) if peaks else used_mb
+    if any(r['spill_bytes'] >= event_log.MIN_SPILL_BYTES for r in runs):
+        need_mb = max(need_mb, used_mb)
+
+    options = []
+    for size in sizes:
+        if size.mode != 'cluster' or size.executor_memory * 1024 < need_mb or (size.node_selector, size.executor_node_selector) != (
+                current.node_selector, current.executor_node_selector):
+            continue
+        for instances in range(1, size.executor_instances + 1):
+            predicted = fixed + work / (instances * size.executor_cores)
+            options.append((predicted <= target_s, _cost(size, instances), predicted, size, instances))
+    if not options:
+        return {'reason': 'no size has an executor heap of {} MiB'.format(int(need_mb))}
+    meets = [o for o in options if o[0]]
+    # cheapest meeting the target, or else the fastest
+    _, cost, predicted, size, instances = min(meets, key=lambda o: (o[1], o[4])) if meets else min(options, key=lambda o: (o[2], o[1]))
+    return {
+        'template': size.name,
+        'executor_instances': instances,
+        'predicted_s': round(predicted, 1),
+        'meets_target': bool(meets),
+        'cost': cost,
+        'current_template': current.name,
+        'current_executor_instances': runs[-1]['executor_instances'],
+        'current_cost': _cost(current, runs[-1]['executor_instances']),
+        'runs': len(runs),
+        'task_core_s': work,
+        'fixed_s': round(fixed, 1),
+        'executor_heap_needed_mb': int(math.ceil(need_mb)),
+        'cpu_utilization': runs[-1]['cpu_utilization']
+    }
+
+def _set_parameter(block, name, value, after):
+    """The task block with the argument name set to value, added after the argument `after` when missing."""
+    m = re.search(PARAMETER.format(re.escape(name)), block)
+    if m:
+        return block[:m.start(3)] + value + block[m.end(3):]
+    m = re.search(PARAMETER.format(re.escape(after)), block)
+    return block[:m.end()] + '\n{}- name: {}\n{}  value: {}'.format(m.group(2), name, m.group(2), value) + block[m.end():]
+
+def _remove_parameter(block, name):
+    return re.sub(PARAMETER.format(re.escape(name)), '', block)
+
+def apply_recommendations(text, recommendations, sizes):
+    """The workflow text with the spark-template steps of the recommended jobs moved to their size."""
+    defaults = {s.name: s.executor_instances for s in sizes}
+    starts = [m.start() for m in TASK.finditer(text)] + [len(text)]
+    parts, applied = [text[:starts[0]]], []
+    for start, end in zip(starts, starts[1:]):
+        block = text[start:end]
+        job = re.search(PARAMETER.format('jobId'), block)
+        rec = recommendations.get(job.group(3).strip().strip('"\'')) if job else None
+        if rec and rec.get('template') and re.search(r'\n *name: spark-template\n *template: \S+', block):
+            block = re.sub(r'(\n *name: spark-template\n *template: )\S+', r'\g<1>' + rec['template'], block, count=1)
+            if rec['executor_instances'] == defaults[rec['template']]:
+                block = _remove_parameter(block, 'executorInstances')
+            else:
+                block = _set_parameter(block, 'executorInstances', '"{}"'.format(rec['executor_instances']), 'jobId')
+            applied.append(job.group(3).strip())
+        parts.append(block)
+    return ''.join(parts), applied
+
+def _load_history(history_file):
+    if not path.exists(history_file):
+        return []
+    with open(history_file) as f:
+        return json.load(f)
+
+def main():
+    source_dir = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['collect', 'recommend'])
+    parser.add_argument('event_logs', nargs='?', help='collect: the event log directory, eg. s3://<code bucket>/spark-events/')
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--sizing', default=source_dir + '/app_resources/spark-sizing.yaml')
+    parser.add_argument('--target-minutes', type=float, default=30)
+    parser.add_argument('--headroom', type=float, default=0.25, help='executor heap above the peak heap')
+    parser.add_argument('--last', type=int, default=5, help='successful runs of a job to size it from')
+    parser.add_argument('--apply', metavar='WORKFLOW', help='move the steps of the workflow file to the recommended size')
+    args = parser.parse_args()
+
+    history = _load_history(args.history)
+    if args.command == 'collect':
+        if not args.event_logs:
+            print('collect needs the event log directory')
+            sys.exit(1)
+        added = collect(args.event_logs, history)
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=1)
+        print('{} new runs, {} in {}'.format(len(added), len(history), args.history))
+        return
+
+    sizes = load_sizes(args.sizing)
+    jobs = {}
+    for r in history:
+        jobs.setdefault(r['job_id'], []).append(r)
+    recommendations = {job: recommend(runs, sizes, args.target_minutes * 60, args.headroom, args.last) for job, runs in sorted(jobs.items())}
+    print(json.dumps(recommendations, indent=2))
+    if args.apply:
+        with open(args.apply) as f:
+            text, applied = apply_recommendations(f.read(), recommendations, sizes)
+        with open(args.apply, 'w') as f:
+            f.write(text)
+        print('resized {} in {}'.format(', '.join(applied) or 'no step', args.apply))
+    missed = [job for job, rec in recommendations.items() if not rec.get('meets_target')]
+    for job in missed:
+        print('{}: {}'.format(job, recommendations[job].get('reason', 'no size meets the target runtime')), file=sys.stderr)
+    sys.exit(1 if missed else 0)
+
+if __name__ == '__main__':
+    main()
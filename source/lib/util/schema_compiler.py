@@ -0,0 +1,161 @@
+"""Compile Arc metadata (app_code/meta/*.json) into a typing SQL script (app_code/sql/typed/*.sql).
+
+    python -m lib.util.schema_compiler           # recompile the scripts whose metadata has changed
+    python -m lib.util.schema_compiler --check   # fail when a script is out of date
+
+The script does what Arc's TypingTransform does with the same metadata: trim, map the
+nullableValues to NULL, cast, and collect an _errors array<struct<field,message>>, all in
+one projection. Source columns are read by position (_c0, _c1, ...), the names given by a
+DelimitedExtract without header. Each script records the sha256 of its metadata and the
+compiler version, and is only rewritten when either changes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import os.path as path
+import re
+import sys
+
+# metadata compiled by the stack, relative to app_code/meta
+TYPED_SCHEMAS = ['contact_meta_0.json']
+# bump when the generated SQL changes, so every script is compiled again
+COMPILER_VERSION = 1
+SPARK_TYPES = {
+    'integer': 'INT',
+    'long': 'BIGINT',
+    'double': 'DOUBLE',
+    'string': 'STRING',
+    'date': 'DATE',
+    'timestamp': 'TIMESTAMP'
+}
+# formats a plain cast parses, anything else needs Arc's TypingTransform
+ISO_FORMATTERS = {'date': ['yyyy-MM-dd'], 'timestamp': ['yyyy-MM-dd HH:mm:ss', "yyyy-MM-dd'T'HH:mm:ss"]}
+HASH_HEADER = re.compile(r'^-- metadata sha256: ([0-9a-f]{64}), compiler version: (\d+)$', re.M)
+EMPTY_ERRORS = 'CAST(ARRAY() AS ARRAY<STRUCT<field: STRING, message: STRING>>)'
+
+class SchemaCompileError(ValueError):
+    pass
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _spark_type(field):
+    kind = field['type']
+    if kind == 'decimal':
+        return 'DECIMAL({}, {})'.format(field['precision'], field['scale'])
+    if kind in ('date', 'timestamp') and any(f not in ISO_FORMATTERS[kind] for f in field.get('formatters', [])):
+        raise SchemaCompileError('{}: formatters {} are not supported'.format(field['name'], field['formatters']))
+    if kind not in SPARK_TYPES and kind != 'boolean':
+        raise SchemaCompileError('{}: type {} is not supported'.format(field['name'], kind))
+    return SPARK_TYPES.get(kind, 'BOOLEAN')
+
+def _typed(field, raw):
+    if field['type'] == 'string':
+        return raw
+    if field['type'] == 'boolean':
+        values = lambda key, default: ', '.join(map(_literal, field.get(key, default)))
+        return 'CASE WHEN {0} IN ({1}) THEN TRUE WHEN {0} IN ({2}) THEN FALSE END'.format(
+            raw, values('trueValues', ['true']), values('falseValues', ['false']))
+    # TRY_CAST: the jobs run with spark.sql.ansi.enabled, where a bad value fails the cast
+    return 'TRY_CAST({} AS {})'.format(raw, _spark_type(field))
+
+def _error(field, raw, typed):
+    checks = []
+    if not field.get('nullable', True):
+        checks.append(('{} IS NULL'.format(raw), _literal('null value found but field is not nullable')))
+    if field['type'] != 'string':
+        checks.append(('{} IS NOT NULL AND {} IS NULL'.format(raw, typed),
+            "CONCAT('unable to convert ''', {}, ''' to {}')".format(raw, field['type'])))
+    if not checks:
+        return None
+    whens = ' '.join('WHEN {} THEN {}'.format(cond, msg) for cond, msg in checks)
+    return "IF({}, NAMED_STRUCT('field', {}, 'message', CASE {} END), NULL)".format(
+        ' OR '.join('({})'.format(cond) for cond, _ in checks), _literal(field['name']), whens)
+
+def compile_schema(fields, source_name, digest):
+    """The typing SQL of a metadata field list, reading ${inputView}."""
+    raw_columns, typed_columns, errors = [], [], []
+    for i, field in enumerate(fields):
+        _spark_type(field)
+        raw = '`__{}`'.format(field['name'])
+        value = 'TRIM(`_c{}`)'.format(i) if field.get('trim') else '`_c{}`'.format(i)
+        if field.get('nullableValues'):
+            value = 'CASE WHEN {0} IN ({1}) THEN NULL ELSE {0} END'.format(value, ', '.join(map(_literal, field['nullableValues'])))
+        raw_columns.append('{} AS {}'.format(value, raw))
+        typed = _typed(field, raw)
+        typed_columns.append('{} AS `{}`'.format(typed, field['name']))
+        error = _error(field, raw, typed)
+        if error:
+            errors.append(error)
+
+    error_column = 'FILTER(ARRAY(\n    {}\n  ), e -> e IS NOT NULL)'.format(',\n    '.join(errors)) if errors else EMPTY_ERRORS
+    return '\n'.join([
+        '-- Compiled from meta/{} by: python -m lib.util.schema_compiler, do not edit.'.format(source_name),
+        '-- metadata sha256: {}, compiler version: {}'.format(digest, COMPILER_VERSION),
+        'SELECT',
+        '  ' + '\n  ,'.join(typed_columns),
+        '  ,' + error_column + ' AS _errors',
+        'FROM (',
+        '  SELECT',
+        '    ' + '\n    ,'.join(raw_columns),
+        '  FROM ${inputView}',
+        ') raw',
+        ''
+    ])
+
+def compiled_path(app_code_dir, schema):
+    return path.join(app_code_dir, 'sql', 'typed', path.splitext(schema)[0] + '.sql')
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def is_current(app_code_dir, schema):
+    with open(path.join(app_code_dir, 'meta', schema), 'rb') as f:
+        digest = _digest(f.read())
+    target = compiled_path(app_code_dir, schema)
+    if not path.exists(target):
+        return False
+    with open(target) as f:
+        match = HASH_HEADER.search(f.read())
+    return bool(match) and match.groups() == (digest, str(COMPILER_VERSION))
+
+def compile_file(app_code_dir, schema):
+    """Write the typing SQL of one metadata file unless it is already current, return True when written."""
+    if is_current(app_code_dir, schema):
+        return False
+    with open(path.join(app_code_dir, 'meta', schema), 'rb') as f:
+        data = f.read()
+    sql = compile_schema(json.loads(data), schema, _digest(data))
+    target = compiled_path(app_code_dir, schema)
+    if not path.isdir(path.dirname(target)):
+        os.makedirs(path.dirname(target))
+    with open(target, 'w') as f:
+        f.write(sql)
+    return True
+
+def compile_schemas(app_code_dir, schemas=TYPED_SCHEMAS):
+    try:
+        return [s for s in schemas if compile_file(app_code_dir, s)]
+    except (SchemaCompileError, KeyError) as e:
+        print('Unable to compile the typing SQL: {}'.format(e))
+        sys.exit(1)
+
+def main():
+    app_code_dir = path.join(path.dirname(path.dirname(path.dirname(path.dirname(path.abspath(__file__))))), 'deployment', 'app_code')
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-code', default=app_code_dir)
+    parser.add_argument('--check', action='store_true', help='exit 1 when a script is out of date')
+    parser.add_argument('schemas', nargs='*', default=TYPED_SCHEMAS)
+    args = parser.parse_args()
+
+    if args.check:
+        stale = [s for s in args.schemas if not is_current(args.app_code, s)]
+        for s in stale:
+            print('{} is out of date, run: python -m lib.util.schema_compiler'.format(compiled_path(args.app_code, s)))
+        sys.exit(1 if stale else 0)
+    for s in compile_schemas(args.app_code, args.schemas):
+        print('compiled ' + compiled_path(args.app_code, s))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import functools
+import importlib
+import inspect
+import json
+import pkgutil
+import os.path as path
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.calls = 0
+        self.wall = 0.0
+        self.alloc = 0
+        self.peak = 0
+
+    def child(self, name):
+        # repeated calls with the same name (eg. a manifest loaded twice) are aggregated
+        for c in self.children:
+            if c.name == name:
+                return c
+        c = _Span(name)
+        self.children.append(c)
+        return c
+
+    def to_dict(self):
+        self_wall = self.wall - sum(c.wall for c in self.children)
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'wall_ms': round(self.wall * 1000, 3),
+            'self_ms': round(max(self_wall, 0) * 1000, 3),
+            'alloc_kb': round(self.alloc / 1024, 1),
+            'peak_kb': round(self.peak / 1024, 1),
+            'children': [c.to_dict() for c in self.children]
+        }
+
+    def folded(self, prefix=''):
+        # "a;b;c <self time in us>" lines, the input format of flamegraph.pl and speedscope
+        stack = prefix + self.name
+        self_wall = self.wall - sum(c.wall for c in self.children)
+        lines = ['{} {}'.format(stack, int(max(self_wall, 0) * 1e6))] if self.calls else []
+        for c in self.children:
+            lines.extend(c.folded(stack + ';'))
+        return lines
+
+class SynthProfiler:
+    """Opt-in hierarchical wall time & memory profile of a cdk synth.
+
+    Disabled by default: span() is then a no-op and instrumented constructs run unchanged.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.track_memory = False
+        self._root = _Span('cdk-synth')
+        self._stack = [self._root]
+        self._peaks = []
+        self._max_peak = 0
+
+    def enable(self, track_memory=True):
+        self.enabled = True
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._root.calls = 1
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        node = self._stack[-1].child(name)
+        self._stack.append(node)
+        mem_before = self._enter_memory() if self.track_memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            node.wall += time.perf_counter() - start
+            node.calls += 1
+            if self.track_memory:
+                current, peak = self._exit_memory()
+                node.alloc += current - mem_before
+                node.peak = max(node.peak, peak - mem_before)
+            self._stack.pop()
+
+    def _enter_memory(self):
+        # tracemalloc has a single peak counter: fold it into the running peak of
+        # every open span before resetting it for the new one
+        current, peak = tracemalloc.get_traced_memory()
+        self._max_peak = max(self._max_peak, peak)
+        self._peaks = [max(p, peak) for p in self._peaks] + [current]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return current
+
+    def _exit_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(self._peaks.pop(), peak)
+        self._max_peak = max(self._max_peak, peak)
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        return current, peak
+
+    def instrument(self, *classes):
+        """Time the __init__ of each construct class, labelled with the construct id."""
+        for cls in classes:
+            if getattr(cls.__init__, '_synth_profiled', False):
+                continue
+            cls.__init__ = self._timed_init(cls, cls.__init__)
+
+    def _timed_init(self, cls, init):
+        @functools.wraps(init)
+        def timed_init(obj, *args, **kwargs):
+            construct_id = args[1] if len(args) > 1 else kwargs.get('id')
+            with self.span('{}({})'.format(cls.__name__, construct_id)):
+                init(obj, *args, **kwargs)
+
+        timed_init._synth_profiled = True
+        return timed_init
+
+    def report(self):
+        self._root.wall = time.perf_counter() - self._started
+        if self.track_memory:
+            self._root.peak = max(self._max_peak, tracemalloc.get_traced_memory()[1])
+        return self._root.to_dict()
+
+    def write_report(self, report_file):
+        """Write the JSON report, and the folded stacks next to it for a flamegraph."""
+        report = self.report()
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(path.splitext(report_file)[0] + '.folded', 'w') as f:
+            f.write('\n'.join(self._root.folded()) + '\n')
+        return report
+
+def package_constructs(package):
+    """The Construct classes defined in the modules of a package, eg. lib.cdk_infra."""
+    from constructs import Construct
+    pkg = importlib.import_module(package)
+    classes = []
+    for info in sorted(pkgutil.iter_modules(pkg.__path__), key=lambda m: m.name):
+        module = importlib.import_module('{}.{}'.format(package, info.name))
+        classes.extend(cls for _, cls in inspect.getmembers(module, inspect.isclass)
+            if issubclass(cls, Construct) and cls.__module__ == module.__name__)
+    return classes
+
+profiler = SynthProfiler()
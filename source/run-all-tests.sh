@@ -98,6 +98,34 @@ run_source_unit_test() {
 	done
 }
 
+run_template_check() {
+	echo "------------------------------------------------------------------------------"
+	echo "[Test] Spark WorkflowTemplate is up to date with the sizing table"
+	echo "------------------------------------------------------------------------------"
+	cd $source_dir
+	python3 -m lib.cdk_infra.spark_sizing --check
+	echo "------------------------------------------------------------------------------"
+	echo "[Test] Typing SQL is up to date with the Arc metadata"
+	echo "------------------------------------------------------------------------------"
+	python3 -m lib.util.schema_compiler --check
+	echo "------------------------------------------------------------------------------"
+	echo "[Test] Image build source zip is up to date with its inputs"
+	echo "------------------------------------------------------------------------------"
+	python3 -m lib.app_code_publisher.publisher --ecr-zip --check
+}
+
+run_benchmarks() {
+	echo "------------------------------------------------------------------------------"
+	echo "[Benchmark] Synthesize the stack at scale and compare against the baseline"
+	echo "------------------------------------------------------------------------------"
+	cd $source_dir
+	python3 -m benchmarks.bench_synth --check
+	if [ "$?" = "1" ]; then
+		echo "(source/run-all-tests.sh) ERROR: synth benchmark regression, see the output above." 1>&2
+		exit 1
+	fi
+}
+
 # Clean the test environment before running tests and after finished running tests
 # The variable is option with default of 'true'. It can be overwritten by caller
 # setting the CLEAN environment variable. For example
@@ -113,6 +141,9 @@ cd $source_dir
 
 python --version
 run_source_unit_test
+run_template_check
+# Opt-in synth benchmarks, eg. BENCH=true ./run-all-tests.sh
+[ "${BENCH:-false}" = "true" ] && run_benchmarks
 
 # Return to the root/ level where we started
 cd $source_dir
\ No newline at end of file
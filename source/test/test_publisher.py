@@ -0,0 +1,115 @@
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from lib.app_code_publisher.publisher import MANIFEST_NAME, publish
+
+# moto 5 replaced the per-service decorators with mock_aws
+mock_aws = getattr(moto, 'mock_aws', None) or moto.mock_s3
+
+BUCKET = 'code-bucket'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def app_code(tmp_path):
+    root = tmp_path / 'app_code'
+    (root / 'job').mkdir(parents=True)
+    (root / 'job' / 'wordcount.py').write_text('print("count")\n')
+    (root / 'job' / 'initial_load.ipynb').write_text('{"cells": []}\n')
+    (root / 'sql').mkdir()
+    (root / 'sql' / 'contact.sql').write_text('SELECT 1\n')
+    (root / 'job' / '__pycache__').mkdir()
+    (root / 'job' / '__pycache__' / 'wordcount.cpython-311.pyc').write_bytes(b'\0')
+    return root
+
+
+@pytest.fixture
+def uploads(s3, monkeypatch):
+    keys = []
+    upload_file = s3.upload_file
+    def counted(file_name, bucket, key, **kwargs):
+        keys.append(key)
+        return upload_file(file_name, bucket, key, **kwargs)
+    monkeypatch.setattr(s3, 'upload_file', counted)
+    return keys
+
+
+def keys(s3):
+    return sorted(o['Key'] for o in s3.list_objects_v2(Bucket=BUCKET).get('Contents', []))
+
+
+def test_first_publish_uploads_every_file(s3, app_code, uploads):
+    report = publish(s3, BUCKET, 'app_code', str(app_code))
+
+    assert sorted(report['uploaded']) == ['job/initial_load.ipynb', 'job/wordcount.py', 'sql/contact.sql']
+    assert sorted(uploads) == ['app_code/job/initial_load.ipynb', 'app_code/job/wordcount.py', 'app_code/sql/contact.sql']
+    assert keys(s3) == ['app_code/' + MANIFEST_NAME, 'app_code/job/initial_load.ipynb', 'app_code/job/wordcount.py',
+        'app_code/sql/contact.sql']
+
+
+def test_unchanged_republish_uploads_nothing(s3, app_code, uploads):
+    publish(s3, BUCKET, 'app_code', str(app_code))
+    del uploads[:]
+
+    report = publish(s3, BUCKET, 'app_code', str(app_code))
+
+    assert report['uploaded'] == [] and report['deleted'] == []
+    assert uploads == []
+
+
+def test_changed_file_uploads_one_object(s3, app_code, uploads):
+    publish(s3, BUCKET, 'app_code', str(app_code))
+    del uploads[:]
+    (app_code / 'job' / 'wordcount.py').write_text('print("count words")\n')
+
+    report = publish(s3, BUCKET, 'app_code', str(app_code))
+
+    assert report['uploaded'] == ['job/wordcount.py'] and report['deleted'] == []
+    assert uploads == ['app_code/job/wordcount.py']
+    body = s3.get_object(Bucket=BUCKET, Key='app_code/job/wordcount.py')['Body'].read()
+    assert body == b'print("count words")\n'
+
+
+def test_removed_file_deletes_only_published_keys(s3, app_code, uploads):
+    publish(s3, BUCKET, 'app_code', str(app_code))
+    # job outputs and files of an earlier full sync, never in the manifest
+    foreign = ['app_code/output/contact/part-0000.parquet', 'app_code/ingest_state/contact/state.json', 'app_code/job/old.py']
+    for key in foreign:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'data')
+    (app_code / 'sql' / 'contact.sql').unlink()
+
+    report = publish(s3, BUCKET, 'app_code', str(app_code))
+
+    assert report['uploaded'] == [] and report['deleted'] == ['sql/contact.sql']
+    remaining = keys(s3)
+    assert 'app_code/sql/contact.sql' not in remaining
+    assert set(foreign) <= set(remaining)
+
+
+def test_publish_over_full_sync_skips_identical_objects(s3, app_code, uploads):
+    s3.put_object(Bucket=BUCKET, Key='app_code/job/wordcount.py', Body=b'print("count")\n')
+    s3.put_object(Bucket=BUCKET, Key='app_code/sql/contact.sql', Body=b'SELECT 2\n')
+
+    report = publish(s3, BUCKET, 'app_code', str(app_code))
+
+    assert sorted(report['uploaded']) == ['job/initial_load.ipynb', 'sql/contact.sql']
+    assert report['deleted'] == []
+
+
+def test_dry_run_changes_nothing(s3, app_code, uploads):
+    report = publish(s3, BUCKET, 'app_code', str(app_code), dry_run=True)
+
+    assert len(report['uploaded']) == 3
+    assert uploads == [] and keys(s3) == []
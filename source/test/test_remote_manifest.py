@@ -0,0 +1,131 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lib.util.remote_manifest import ManifestFetchError, RemoteManifestFetcher
+
+
+class ManifestHandler(BaseHTTPRequestHandler):
+    # the test sets server.responses, a list of (status, body, etag), the last one is repeated
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        responses = self.server.responses
+        status, body, etag = responses.pop(0) if len(responses) > 1 else responses[0]
+        if status == 200 and etag and self.headers.get('If-None-Match') == etag:
+            status = 304
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status == 200:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ManifestHandler)
+    httpd.requests = []
+    httpd.responses = [(200, b'kind: ConfigMap\n', '"v1"')]
+    httpd.url = 'http://127.0.0.1:{}/manifest.yaml'.format(httpd.server_port)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetcher(tmp_path, **kwargs):
+    # max_age=0 revalidates on every fetch, a new fetcher has no in-memory copy
+    settings = {'cache_dir': str(tmp_path), 'max_age': 0, 'backoff': 0, 'offline': False}
+    settings.update(kwargs)
+    return RemoteManifestFetcher(**settings)
+
+
+def objects(tmp_path):
+    return sorted(name for _, _, files in os.walk(tmp_path / 'objects') for name in files)
+
+
+def test_unchanged_manifest_is_revalidated_with_304(server, tmp_path):
+    assert fetcher(tmp_path).fetch(server.url) == 'kind: ConfigMap\n'
+    assert fetcher(tmp_path).fetch(server.url) == 'kind: ConfigMap\n'
+
+    assert len(server.requests) == 2
+    assert 'If-None-Match' not in server.requests[0]
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+    assert len(objects(tmp_path)) == 1
+
+
+def test_fresh_ref_is_served_without_request(server, tmp_path):
+    fetcher(tmp_path).fetch(server.url)
+    assert fetcher(tmp_path, max_age=3600).fetch(server.url) == 'kind: ConfigMap\n'
+    assert len(server.requests) == 1
+
+
+def test_changed_etag_stores_new_body(server, tmp_path):
+    fetcher(tmp_path).fetch(server.url)
+    server.responses = [(200, b'kind: Secret\n', '"v2"')]
+
+    assert fetcher(tmp_path).fetch(server.url) == 'kind: Secret\n'
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+    # the previous body stays in the store, the ref points at the new one
+    assert len(objects(tmp_path)) == 2
+    assert fetcher(tmp_path).fetch(server.url) == 'kind: Secret\n'
+    assert server.requests[2]['If-None-Match'] == '"v2"'
+
+
+def test_server_error_is_retried(server, tmp_path):
+    server.responses = [(503, b'', None), (503, b'', None), (200, b'kind: ConfigMap\n', '"v1"')]
+    assert fetcher(tmp_path, retries=3).fetch(server.url) == 'kind: ConfigMap\n'
+    assert len(server.requests) == 3
+
+
+def test_retries_exhausted_without_cache_fails(server, tmp_path):
+    server.responses = [(503, b'', None)]
+    with pytest.raises(ManifestFetchError):
+        fetcher(tmp_path, retries=3).fetch(server.url)
+    assert len(server.requests) == 3
+
+
+def test_retries_below_one_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        fetcher(tmp_path, retries=0)
+
+
+def test_client_error_is_not_retried(server, tmp_path):
+    server.responses = [(404, b'', None)]
+    with pytest.raises(ManifestFetchError):
+        fetcher(tmp_path, retries=3).fetch(server.url)
+    assert len(server.requests) == 1
+
+
+def test_retries_exhausted_falls_back_to_cache(server, tmp_path):
+    fetcher(tmp_path).fetch(server.url)
+    server.responses = [(503, b'', None)]
+    assert fetcher(tmp_path, retries=2).fetch(server.url) == 'kind: ConfigMap\n'
+    assert len(server.requests) == 3
+
+
+def test_offline_is_served_from_the_store(server, tmp_path):
+    fetcher(tmp_path).fetch(server.url)
+    server.shutdown()
+
+    assert fetcher(tmp_path, offline=True).fetch(server.url) == 'kind: ConfigMap\n'
+    assert len(server.requests) == 1
+    with pytest.raises(ManifestFetchError):
+        fetcher(tmp_path, offline=True).fetch(server.url + '?other')
+
+
+def test_offline_never_serves_a_corrupted_object(server, tmp_path):
+    fetcher(tmp_path).fetch(server.url)
+    [name] = objects(tmp_path)
+    (tmp_path / 'objects' / name[:2] / name).write_bytes(b'kind: Tampered\n')
+
+    with pytest.raises(ManifestFetchError):
+        fetcher(tmp_path, offline=True).fetch(server.url)